@@ -1,6 +1,8 @@
 # Millimanipulation Mark 3 driver script
 # written by Jheng-Han Tsai, February 2021
 #================================================================
+import startup
+import json
 import time
 import threading
 
@@ -8,43 +10,27 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 
-from ximc import StageControl
+import calibration
+import diagnostics
+from engine import Config, Engine, MillimanipulationParams, RelaxationParams, loadQueue
+from liveplot import LiveTrace, MinMaxDecimator, updateArtists
 
-import matplotlib
-matplotlib.use("TkAgg")
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+startup.mark('imports')
 
-from scipy import signal, stats, mean
 
-
-import csv
-import ctypes
-import os
-import sys
-import cv2
-
-import nidaqmx
-from nidaqmx.constants import TerminalConfiguration, VoltageUnits
+def importMatplotlib():
+    # define function to import matplotlib when the first page with a
+    # figure is built, most of the start-up time went here otherwise
+    global Figure, FigureCanvasTkAgg, animation
+    import matplotlib
+    matplotlib.use("TkAgg")
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    import matplotlib.animation as animation
 
 
 # ------ global variables ------
-a = 54
-b = -5.4
-frameWidth = 640
-frameHeight = 480
-xm = [0]
-ym = [0]
-xc = [0]
-yc = [0]
-filFreq = 50
-operation = False
-cameraSelected = False
-recordImage = False
-ImagePath = ''
-img = [[0]*frameWidth for _ in range(frameHeight)] # Use camera frame size to setup figure size
-niport = 'Dev2/ai0'
+engine = None # Engine running all tests, created at start-up
 
 
 # font size for title
@@ -65,34 +51,68 @@ class tkinterApp(tk.Tk):
         container.grid_rowconfigure(0, weight = 1)
         container.grid_columnconfigure(0, weight = 1)
 
-        # initializing frames to an empty array
+        # initializing frames to an empty array, pages are built the
+        # first time they are shown
+        self.container = container
         self.frames = {}
+        self.paused = set() # pages whose animation is stopped while hidden
+        self.current = None # page shown
+        startup.mark('window')
 
-        # iterating through a tuple consisting
-        # of the different page layouts
-        for F in (SetPositionPage, MillimanipulationPage,
-                  RelaxationTestsPage, ConfigurationPage,
-                  ForceCalibrationPage):
-
-            frame = F(container, self)
+        self.show_frame(SetPositionPage)
+        startup.mark('first page')
 
-            # initializing frame of that object from pages with for loop
-            self.frames[F] = frame
+        engine.eventCallbacks.append(self.onEvent)
 
+    def getFrame(self, page):
+        # define function to return a page, building it on first use
+        if page not in self.frames:
+            start = time.perf_counter()
+            frame = page(self.container, self)
+            self.frames[page] = frame
             frame.grid(row = 0, column = 0, sticky ='nsew')
-
-        self.show_frame(SetPositionPage)
+            print('Built {} in {:.0f} ms'.format(page.__name__,
+                                                  1000*(time.perf_counter()-start)))
+        return self.frames[page]
+
+    def onEvent(self, name, info):
+        # engine events arrive on the thread that raised them (runs, jogs
+        # and queues run on worker threads); Tk is not thread-safe, so they
+        # are handled on the Tk main loop
+        self.after(0, self.handleEvent, name, info)
+
+    def handleEvent(self, name, info):
+        # define function to update the pages after an engine event
+        if name == 'moved':
+            self.frames[SetPositionPage].updatePosition()
+        elif name == 'queueProgress' and MillimanipulationPage in self.frames:
+            self.frames[MillimanipulationPage].showQueueProgress(info)
 
     
     def show_frame(self, cont):
         # display the current frame passed as parameter
-        frame = self.frames[cont]
+        frame = self.getFrame(cont)
         frame.tkraise()
+        self.current = frame
+
+        # only the visible page animates its figure; a new page starts
+        # its animation itself on the first draw
+        for other in self.frames.values():
+            if not hasattr(other, 'ani'):
+                continue
+            if other is not frame:
+                other.ani.event_source.stop()
+                self.paused.add(other)
+            elif other in self.paused:
+                # the hidden time is not a gap between redraws
+                diagnostics.timer('animate '+type(other).__name__).start()
+                other.ani.event_source.start()
+                self.paused.discard(other)
         
     
     def pass_on_text(self, page):
         # function to pass variables among frames
-        return self.frames[page].getEntry()
+        return self.getFrame(page).getEntry()
 
 
 
@@ -185,7 +205,7 @@ class SetPositionPage(tk.Frame):
                         sticky = 'e')
 
         # get current positions of X and Z and show on panel
-        self.stcon = StageControl()
+        self.stcon = engine.stage
         positionX, positionZ = self.stcon.posXYVals_cal()
         
         self.positionX = tk.StringVar()
@@ -215,7 +235,7 @@ class SetPositionPage(tk.Frame):
 
         # buttons to run x-axis positioner
         button11 = ttk.Button(labelframeX, text ='Start (Translational)',
-                              command = lambda : threading.Thread(target = Mark3.XmoveRight).start())
+                              command = lambda : self.jog('x'))
         button11.grid(row = 3, column = 0, padx = 10, pady = 10)
 
         button12 = ttk.Button(labelframeX, text ='Soft stop',
@@ -296,7 +316,7 @@ class SetPositionPage(tk.Frame):
 
         # buttons to run z-axis positioner
         button16 = ttk.Button(labelframeZ, text ='Start (Vertical)',
-                              command = lambda : threading.Thread(target = Mark3.ZmoveUp).start())
+                              command = lambda : self.jog('z'))
         button16.grid(row = 3, column = 0, padx = 10, pady = 10)
 
         button17 = ttk.Button(labelframeZ, text ='Soft stop',
@@ -323,6 +343,12 @@ class SetPositionPage(tk.Frame):
         self.positionX.set(positionX)
         self.positionZ.set(positionZ)
 
+    def jog(self, axis):
+        # define function to move one axis by the entered distance and speed
+        distanceX, speedX, distanceZ, speedZ = self.getEntry()
+        args = (axis, distanceX, speedX) if axis == 'x' else (axis, distanceZ, speedZ)
+        threading.Thread(target = engine.jog, args = args).start()
+
     def getEntry(self):
         # function to collect entry variables for sending to other classes
         distanceX = float(self.entry1.get())
@@ -338,6 +364,7 @@ class MillimanipulationPage(tk.Frame):
     # second window frame millimanipulation
     def __init__(self, parent, controller):
         tk.Frame.__init__(self, parent)
+        importMatplotlib()
 
         # label of frame layout 
         label = tk.Label(self, text ='Millimanipulation', font = LARGEFONT,
@@ -452,10 +479,10 @@ class MillimanipulationPage(tk.Frame):
 
 
         # buttons to run x-axis positioner
-        self.stcon = StageControl()
+        self.stcon = engine.stage
         
         button11 = ttk.Button(labelframeX, text ='Start (Measurement)',
-                             command = lambda : threading.Thread(target = Mark3().Millimanipulation).start())
+                             command = lambda : self.start())
         button11.grid(row = 6, column = 0, padx = 10, pady = 10)
 
         button12 = ttk.Button(labelframeX, text ='Soft stop',
@@ -473,14 +500,17 @@ class MillimanipulationPage(tk.Frame):
                          padx = 10, pady = 10, sticky = 'w')
         
         # add figure canvas to show results
-        self.fig = plt.Figure(figsize = (6, 6))
+        self.fig = Figure(figsize = (6, 6))
         
-        # create variable to control capture of video frames
-        self.entry0 = tk.IntVar(value = 0)
+        # create variable to control capture of video frames, checked if
+        # the camera was connected on another page
+        self.entry0 = tk.IntVar(value = 1 if engine.camera is not None else 0)
         self.axImg = self.fig.add_subplot(211)
 
-        global img
-        self.im = self.axImg.imshow(img)
+        # use camera frame size to setup figure size
+        config = engine.config
+        self.im = self.axImg.imshow([[0]*config.frameWidth for _ in range(config.frameHeight)],
+                                    animated = True)
         self.axImg.axis('off')
         
         checkButton2 = ttk.Checkbutton(self.labelframeFig, text ='Connect to camera',
@@ -488,14 +518,37 @@ class MillimanipulationPage(tk.Frame):
                                   command = lambda : self.checkCameraButton())
         checkButton2.grid(row = 0, column = 0, padx = 0, pady = 0)
 
+        # achieved camera frame rate
+        self.fpsText = tk.StringVar(value = '')
+        labelFps = ttk.Label(self.labelframeFig, textvariable = self.fpsText)
+        labelFps.grid(row = 0, column = 1, padx = 0, pady = 0)
+
+        # channel shown in the lower plot, force or an extra DAQ channel
+        self.channelVar = tk.StringVar(value = 'force')
+        comboChannel = ttk.Combobox(self.labelframeFig, textvariable = self.channelVar,
+                                    values = ['force']+[c.name for c in engine.channels],
+                                    state = 'readonly', width = 15)
+        comboChannel.grid(row = 0, column = 2, padx = 0, pady = 0)
+        comboChannel.bind('<<ComboboxSelected>>', lambda event : self.selectChannel())
+        self.channelChanged = False
 
         self.axFig = self.fig.add_subplot(212) 
+        self.trace = LiveTrace(self.axFig, 'Time (s)', 'Force (N)',
+                               color = 'lightsteelblue', label = 'Raw')
+        self.trace.addLine(color = 'navy', label = 'Filtered')
+        self.axFig.legend(loc = 'upper left')
+        # reduce the traces to about two points per pixel column
+        self.decimator = MinMaxDecimator('time', 'force',
+                                         columns = self.axFig.bbox.width)
+        self.decimatorFiltered = MinMaxDecimator('time', 'filtered',
+                                                 columns = self.axFig.bbox.width)
         self.canvas = FigureCanvasTkAgg(self.fig, self.labelframeFig)
         self.canvas.get_tk_widget().grid(row = 1, column = 0, rowspan = 3, columnspan = 3, 
                          padx = 10, pady = 10, sticky = 'w')
 
         self.canvas.draw()
-        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100)
+        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100,
+                                           blit = True, cache_frame_data = False)
 
         # labelframe of z-axis movement
         labelframeZ = tk.LabelFrame(self,
@@ -514,18 +567,66 @@ class MillimanipulationPage(tk.Frame):
         button14.grid(row = 0, column = 1, padx = 10, pady = 10)
 
 
+        # labelframe of the run queue
+        labelframeQ = tk.LabelFrame(self, text = 'Run Queue')
+        labelframeQ.grid(row = 6, column = 0, columnspan = 2,
+                         padx = 10, pady = 10, sticky = 'nw')
+
+        def browseQueue():
+            # function to browse the queue file
+            self.entry6_var.set(filedialog.askopenfilename(filetypes = [('Queue', '*.csv')]))
+
+        button15 = ttk.Button(labelframeQ, text = 'Browse queue file:',
+                              command = browseQueue, width = 15)
+        button15.grid(row = 0, column = 0, padx = 10, pady = 5)
+
+        self.entry6_var = tk.StringVar(value = '')
+        self.entry6 = ttk.Entry(labelframeQ, textvariable = self.entry6_var, width = 20)
+        self.entry6.grid(row = 0, column = 1, padx = 10, pady = 5, sticky = 'w')
+
+        self.entry7 = tk.IntVar(value = 1)
+        checkButton3 = ttk.Checkbutton(labelframeQ, text ='Reset Z after each run',
+                                       variable = self.entry7, onvalue = 1, offvalue = 0)
+        checkButton3.grid(row = 1, column = 0, padx = 10, pady = 5, sticky = 'w')
+
+        self.entry8 = tk.IntVar(value = 1)
+        checkButton4 = ttk.Checkbutton(labelframeQ, text ='Return X after each run',
+                                       variable = self.entry8, onvalue = 1, offvalue = 0)
+        checkButton4.grid(row = 1, column = 1, padx = 10, pady = 5, sticky = 'w')
+
+        button16 = ttk.Button(labelframeQ, text ='Start queue',
+                              command = lambda : self.startQueue())
+        button16.grid(row = 2, column = 0, padx = 10, pady = 5)
+
+        button17 = ttk.Button(labelframeQ, text ='Stop queue',
+                              command = engine.stopQueue)
+        button17.grid(row = 2, column = 1, padx = 10, pady = 5)
+
+        self.queueText = tk.StringVar(value = '')
+        labelQueue = ttk.Label(labelframeQ, textvariable = self.queueText)
+        labelQueue.grid(row = 3, column = 0, columnspan = 2, padx = 10, pady = 5, sticky = 'w')
+
+
 		
+    @diagnostics.timed('animate MillimanipulationPage')
     def animate(self, i):
         # define function to show real time figure 
-        global xm, ym, img
-
-        self.axFig.clear()
-        self.axFig.plot(xm, ym)
-        self.axFig.set_xlabel('Time (s)')
-        self.axFig.set_ylabel('Force (N)')
-        
-        if self.entry0.get() == 1:
-            self.im.set_data(img)
+        t, force = self.decimator.update(engine.forceData)
+        if self.decimatorFiltered is not None:
+            tf, filtered = self.decimatorFiltered.update(engine.forceData)
+        else:
+            tf, filtered = [], []
+        changed = self.trace.update(t, force, tf, filtered) or self.channelChanged
+        self.channelChanged = False
+        
+        camera = engine.camera
+        image = engine.image
+        if self.entry0.get() == 1 and image is not None:
+            self.im.set_data(image)
+            if camera is not None:
+                self.fpsText.set('{:.1f} fps'.format(camera.fps))
+
+        return updateArtists(self.canvas, changed, *self.trace.lines, self.im)
     
     def getEntry(self):
         # define function to collect entry variables for sending to other classes
@@ -542,32 +643,65 @@ class MillimanipulationPage(tk.Frame):
         
         return [distance, speed, path]
 
+    def start(self):
+        # define function to run the test with the entered parameters
+        distance, speed, path = self.getEntry()
+        params = MillimanipulationParams(distance, speed, path,
+                                         recordImages = self.entry5.get() == 1)
+        threading.Thread(target = engine.runMillimanipulation, args = (params,)).start()
+
+    def startQueue(self):
+        # define function to run every test of the queue file, saved in the
+        # entered folder
+        try:
+            entries = loadQueue(self.entry6.get())
+        except (OSError, ValueError) as e:
+            self.queueText.set('Cannot read queue: '+str(e))
+            return
+        runs = sum(entry.repeats for entry in entries)
+        self.queueText.set('0/{} runs'.format(runs))
+        threading.Thread(target = engine.runQueue,
+                         args = (entries, self.entry3.get(), self.entry7.get() == 1,
+                                 self.entry8.get() == 1)).start()
+
+    def showQueueProgress(self, info):
+        self.queueText.set('{done}/{runs} runs, last: {path}'.format(**info))
+
+    def selectChannel(self):
+        # define function to plot another channel; the filtered trace is
+        # only computed for the force
+        name = self.channelVar.get()
+        columns = self.axFig.bbox.width
+        self.decimator = MinMaxDecimator('time', name, columns = columns)
+        self.decimatorFiltered = (MinMaxDecimator('time', 'filtered', columns = columns)
+                                  if name == 'force' else None)
+        label = 'Force (N)' if name == 'force' else [c.label for c in engine.channels if c.name == name][0]
+        self.axFig.set_ylabel(label)
+        self.channelChanged = True
+
     def checkImageRecordButton(self):
-        global recordImage
-        
-        if self.entry0.get() == 1:
-            recordImage = True if self.entry5.get() == 1 else False
-        else:
+        # images can only be recorded while the camera is connected
+        if self.entry0.get() != 1:
             self.entry5.set(0)
                 
     def checkCameraButton(self):
-        global cameraSelected, recordImage
-        
         if self.entry0.get() == 1:
-            cameraSelected = True
-            threading.Thread(target = Mark3().grabImage).start()
-            app.frames[RelaxationTestsPage].entry0.set(1)
+            engine.startCamera()
+            if RelaxationTestsPage in app.frames:
+                app.frames[RelaxationTestsPage].entry0.set(1)
             
         else:
-            cameraSelected = recordImage = False
+            engine.stopCamera()
             self.entry5.set(0)
-            app.frames[RelaxationTestsPage].entry0.set(0)
+            if RelaxationTestsPage in app.frames:
+                app.frames[RelaxationTestsPage].entry0.set(0)
             
             
 class RelaxationTestsPage(tk.Frame):
     # third window frame relaxationtests
     def __init__(self, parent, controller):
         tk.Frame.__init__(self, parent)
+        importMatplotlib()
 
         # label of frame layout 
         label = tk.Label(self, text ='Relaxation Tests', font = LARGEFONT,
@@ -704,10 +838,10 @@ class RelaxationTestsPage(tk.Frame):
         
         
         # buttons to run x-axis positioner
-        self.stcon = StageControl()
+        self.stcon = engine.stage
         
         button11 = ttk.Button(labelframeX, text ='Start (Measurement)',
-                             command = lambda : threading.Thread(target = Mark3().RelaxationTests).start())
+                             command = lambda : self.start())
         button11.grid(row = 8, column = 0, padx = 10, pady = 10)
 
         button12 = ttk.Button(labelframeX, text ='Soft stop',
@@ -727,14 +861,17 @@ class RelaxationTestsPage(tk.Frame):
 
 
         # add figure canvas to show results
-        self.fig = plt.Figure(figsize = (6, 6))
+        self.fig = Figure(figsize = (6, 6))
         
-        # create variable to control capture of video frames
-        self.entry0 = tk.IntVar(value = 0)
+        # create variable to control capture of video frames, checked if
+        # the camera was connected on another page
+        self.entry0 = tk.IntVar(value = 1 if engine.camera is not None else 0)
         self.axImg = self.fig.add_subplot(211)
 
-        global img
-        self.im = self.axImg.imshow(img)
+        # use camera frame size to setup figure size
+        config = engine.config
+        self.im = self.axImg.imshow([[0]*config.frameWidth for _ in range(config.frameHeight)],
+                                    animated = True)
         self.axImg.axis('off')
         
         buttonc = ttk.Checkbutton(self.labelframeFig, text ='Connect to camera',
@@ -742,14 +879,37 @@ class RelaxationTestsPage(tk.Frame):
                                   command = lambda : self.checkCameraButton())
         buttonc.grid(row = 0, column = 0, padx = 0, pady = 0)
 
+        # achieved camera frame rate
+        self.fpsText = tk.StringVar(value = '')
+        labelFps = ttk.Label(self.labelframeFig, textvariable = self.fpsText)
+        labelFps.grid(row = 0, column = 1, padx = 0, pady = 0)
+
+        # channel shown in the lower plot, force or an extra DAQ channel
+        self.channelVar = tk.StringVar(value = 'force')
+        comboChannel = ttk.Combobox(self.labelframeFig, textvariable = self.channelVar,
+                                    values = ['force']+[c.name for c in engine.channels],
+                                    state = 'readonly', width = 15)
+        comboChannel.grid(row = 0, column = 2, padx = 0, pady = 0)
+        comboChannel.bind('<<ComboboxSelected>>', lambda event : self.selectChannel())
+        self.channelChanged = False
 
         self.axFig = self.fig.add_subplot(212) 
+        self.trace = LiveTrace(self.axFig, 'Time (s)', 'Force (N)',
+                               color = 'lightsteelblue', label = 'Raw')
+        self.trace.addLine(color = 'navy', label = 'Filtered')
+        self.axFig.legend(loc = 'upper left')
+        # reduce the traces to about two points per pixel column
+        self.decimator = MinMaxDecimator('time', 'force',
+                                         columns = self.axFig.bbox.width)
+        self.decimatorFiltered = MinMaxDecimator('time', 'filtered',
+                                                 columns = self.axFig.bbox.width)
         self.canvas = FigureCanvasTkAgg(self.fig, self.labelframeFig)
         self.canvas.get_tk_widget().grid(row = 1, column = 0, rowspan = 3, columnspan = 3, 
                          padx = 10, pady = 10, sticky = 'w')
 
         self.canvas.draw()
-        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100)
+        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100,
+                                           blit = True, cache_frame_data = False)
 
         # labelframe of z-axis movement
         labelframeZ = tk.LabelFrame(self,
@@ -767,17 +927,25 @@ class RelaxationTestsPage(tk.Frame):
                               command = lambda : threading.Thread(target = self.stcon.moveToZeroY).start())
         button14.grid(row = 0, column = 1, padx = 10, pady = 10)
 
+    @diagnostics.timed('animate RelaxationTestsPage')
     def animate(self, i):
         # define function to show real time figure 
-        global xm, ym, img
-
-        self.axFig.clear()
-        self.axFig.plot(xm, ym)
-        self.axFig.set_xlabel('Time (s)')
-        self.axFig.set_ylabel('Force (N)')
+        t, force = self.decimator.update(engine.forceData)
+        if self.decimatorFiltered is not None:
+            tf, filtered = self.decimatorFiltered.update(engine.forceData)
+        else:
+            tf, filtered = [], []
+        changed = self.trace.update(t, force, tf, filtered) or self.channelChanged
+        self.channelChanged = False
         
-        if self.entry0.get() == 1:
-            self.im.set_data(img)
+        camera = engine.camera
+        image = engine.image
+        if self.entry0.get() == 1 and image is not None:
+            self.im.set_data(image)
+            if camera is not None:
+                self.fpsText.set('{:.1f} fps'.format(camera.fps))
+
+        return updateArtists(self.canvas, changed, *self.trace.lines, self.im)
 
     
     def getEntry(self):
@@ -797,28 +965,43 @@ class RelaxationTestsPage(tk.Frame):
 
         return [interval, speed, noScrape, relaxTime, path]
 
+    def start(self):
+        # define function to run the test with the entered parameters
+        interval, speed, noScrape, relaxTime, path = self.getEntry()
+        params = RelaxationParams(interval, speed, noScrape, relaxTime, path,
+                                  recordImages = self.entry7.get() == 1)
+        threading.Thread(target = engine.runRelaxation, args = (params,)).start()
+
+    def selectChannel(self):
+        # define function to plot another channel; the filtered trace is
+        # only computed for the force
+        name = self.channelVar.get()
+        columns = self.axFig.bbox.width
+        self.decimator = MinMaxDecimator('time', name, columns = columns)
+        self.decimatorFiltered = (MinMaxDecimator('time', 'filtered', columns = columns)
+                                  if name == 'force' else None)
+        label = 'Force (N)' if name == 'force' else [c.label for c in engine.channels if c.name == name][0]
+        self.axFig.set_ylabel(label)
+        self.channelChanged = True
+
     def checkImageRecordButton(self):
-        # define function to turn on recording images
-        global recordImage
-        
-        if self.entry0.get() == 1:
-            recordImage = True if self.entry7.get() == 1 else False
-        else:
+        # define function to turn on recording images, only while the
+        # camera is connected
+        if self.entry0.get() != 1:
             self.entry7.set(0)
                 
     def checkCameraButton(self):
         # define function to connect camera
-        global cameraSelected, recordImage
-        
         if self.entry0.get() == 1:
-            cameraSelected = True
-            threading.Thread(target = Mark3().grabImage).start()
-            app.frames[MillimanipulationPage].entry0.set(1)
+            engine.startCamera()
+            if MillimanipulationPage in app.frames:
+                app.frames[MillimanipulationPage].entry0.set(1)
             
         else:
-            cameraSelected = recordImage = False
+            engine.stopCamera()
             self.entry7.set(0)
-            app.frames[MillimanipulationPage].entry0.set(0)
+            if MillimanipulationPage in app.frames:
+                app.frames[MillimanipulationPage].entry0.set(0)
 
 
 class ConfigurationPage(tk.Frame):
@@ -878,12 +1061,12 @@ class ConfigurationPage(tk.Frame):
         label1.grid(row = 0, column = 0, columnspan = 3, padx = 10, pady = 10,
                         sticky = 'w')
 
-        global a, b
+        config = engine.config
         label2 = ttk.Label(labelFrame1, text = 'a:', width = 20)
         label2.grid(row = 1, column = 0, padx = 10, pady = 0,
                         sticky = 'w')
 
-        self.entry1_var = tk.StringVar(value = a)
+        self.entry1_var = tk.StringVar(value = config.a)
         self.entry1 = ttk.Entry(labelFrame1, textvariable = self.entry1_var)
         self.entry1.grid(row = 1, column = 1, padx = 10, pady = 0, sticky = 'w')
 
@@ -891,7 +1074,7 @@ class ConfigurationPage(tk.Frame):
         label3.grid(row = 2, column = 0, padx = 10, pady = 0,
                         sticky = 'w')
 
-        self.entry2_var = tk.StringVar(value = b)
+        self.entry2_var = tk.StringVar(value = config.b)
         self.entry2 = ttk.Entry(labelFrame1, textvariable = self.entry2_var)
         self.entry2.grid(row = 2, column = 1, padx = 10, pady = 0, sticky = 'w')
 
@@ -901,12 +1084,11 @@ class ConfigurationPage(tk.Frame):
         label4.grid(row = 3, column = 0, columnspan = 3, padx = 10, pady = 10,
                         sticky = 'w')
 
-        global frameWidth, frameHeight
         label5 = ttk.Label(labelFrame1, text = 'Frame width (pixel):', width = 20)
         label5.grid(row = 4, column = 0, padx = 10, pady = 0,
                         sticky = 'w')
 
-        self.entry3_var = tk.StringVar(value = frameWidth)
+        self.entry3_var = tk.StringVar(value = config.frameWidth)
         self.entry3 = ttk.Entry(labelFrame1, textvariable = self.entry3_var)
         self.entry3.grid(row = 4, column = 1, padx = 10, pady = 0, sticky = 'w')
 
@@ -914,14 +1096,42 @@ class ConfigurationPage(tk.Frame):
         label3.grid(row = 5, column = 0, padx = 10, pady = 0,
                         sticky = 'w')
 
-        self.entry4_var = tk.StringVar(value = frameHeight)
+        self.entry4_var = tk.StringVar(value = config.frameHeight)
         self.entry4 = ttk.Entry(labelFrame1, textvariable = self.entry4_var)
         self.entry4.grid(row = 5, column = 1, padx = 10, pady = 0, sticky = 'w')
 
 
+        label6 = ttk.Label(labelFrame1,
+                               text = 'Force acquisition - ')
+        label6.grid(row = 6, column = 0, columnspan = 3, padx = 10, pady = 10,
+                        sticky = 'w')
+
+        label7 = ttk.Label(labelFrame1, text = 'Sample rate (Hz):', width = 20)
+        label7.grid(row = 7, column = 0, padx = 10, pady = 0,
+                        sticky = 'w')
+
+        self.entry5_var = tk.StringVar(value = config.sampleRate)
+        self.entry5 = ttk.Entry(labelFrame1, textvariable = self.entry5_var)
+        self.entry5.grid(row = 7, column = 1, padx = 10, pady = 0, sticky = 'w')
+
+        label8 = ttk.Label(labelFrame1, text = 'Low-pass cutoff (Hz):', width = 20)
+        label8.grid(row = 8, column = 0, padx = 10, pady = 0,
+                        sticky = 'w')
+
+        self.entry6_var = tk.StringVar(value = config.filCutoff)
+        self.entry6 = ttk.Entry(labelFrame1, textvariable = self.entry6_var)
+        self.entry6.grid(row = 8, column = 1, padx = 10, pady = 0, sticky = 'w')
+
+
         button1 = ttk.Button(labelFrame1, text ='Set and save parameters',
                               command = lambda : self.saveConfiguration())
-        button1.grid(row = 6, column = 1, padx = 10, pady = 10)
+        button1.grid(row = 9, column = 1, padx = 10, pady = 10)
+
+        # timing of the acquisition, camera, plot and stage loops
+        button6 = ttk.Button(self, text ='Timing diagnostics',
+                             command = lambda : controller.show_frame(DiagnosticsPage),
+                             width = 20)
+        button6.grid(row = 4, column = 1, padx = 10, pady = 10, sticky = 'w')
 
         
 
@@ -929,29 +1139,23 @@ class ConfigurationPage(tk.Frame):
         # define function to save and set configuration parameters
         
         # collect parameters
-        global a, b, frameWidth, frameHeight
-        a = float(self.entry1.get())
-        b = float(self.entry2.get())
-        frameWidth = int(self.entry3.get())
-        frameHeight = int(self.entry4.get())
-
-        headers = ['a', 'b', 'frame width', 'frame height']
-        parameters = [{'a': a,
-                       'b': b,
-                       'frame width': frameWidth,
-                       'frame height': frameHeight}]
-        
+        config = engine.config
+        config.a = float(self.entry1.get())
+        config.b = float(self.entry2.get())
+        config.frameWidth = int(self.entry3.get())
+        config.frameHeight = int(self.entry4.get())
+        config.sampleRate = float(self.entry5.get())
+        config.filCutoff = float(self.entry6.get())
+
         # resave configuration file
-        with open('config.csv', 'w', encoding = 'UTF8', newline = '') as f:
-            writer = csv.DictWriter(f, headers)
-            writer.writeheader()
-            writer.writerows(parameters)
+        config.save('config.csv')
 
         
 class ForceCalibrationPage(tk.Frame):
     # fifth window frame forcecalibration
     def __init__(self, parent, controller):
         tk.Frame.__init__(self, parent)
+        importMatplotlib()
 
         # label of frame layout 
         label = tk.Label(self, text ='Force Calibration', font = LARGEFONT,
@@ -1010,7 +1214,7 @@ class ForceCalibrationPage(tk.Frame):
         self.entry1.grid(row = 0, column = 1, padx = 10, pady = 10, sticky = 'w')
 
         button6 = ttk.Button(labelFrame1, text ='Get point',
-                             command = lambda : threading.Thread(target = self.getPoint).start(),
+                             command = lambda : self.getPoint(),
                              width = 20)
         button6.grid(row = 1, column = 1, padx = 10, pady = 10)
 
@@ -1031,6 +1235,19 @@ class ForceCalibrationPage(tk.Frame):
                              command = lambda : self.deleteAll(),
                              width = 20)
         button8.grid(row = 4, column = 1, padx = 10, pady = 10, sticky = 'nw')
+
+        button9 = ttk.Button(labelFrame1, text ='Apply calibration',
+                             command = lambda : self.applyCalibration(),
+                             width = 20)
+        button9.grid(row = 5, column = 1, padx = 10, pady = 10, sticky = 'nw')
+
+        # progress of the running capture, else the last applied calibration
+        history = calibration.loadHistory()
+        self.progress = ('Last calibration: '+history[-1]['date']) if history else 'No calibration history'
+        self.progressText = tk.StringVar(value = self.progress)
+        label3 = ttk.Label(labelFrame1, textvariable = self.progressText)
+        label3.grid(row = 6, column = 0, columnspan = 2, padx = 10, pady = 0,
+                    sticky = 'w')
         
 
         # labelframe of calibration figure
@@ -1041,36 +1258,96 @@ class ForceCalibrationPage(tk.Frame):
 
 
         # define variables for ploting
+        self.controller = controller
         self.xlist = []
         self.ylist = []
+        self.calPoints = [] # statistics of every point for the history
+        self.pending = [] # points captured by the worker thread
+        self.capturing = False
         self.slope = 0
         self.intercept = 0
-        self.r_value = 0
+        self.rSquared = 0
         
         # add figure canvas to show results
-        self.fig = plt.Figure(figsize = (6, 6))
+        self.fig = Figure(figsize = (6, 6))
         self.fig.tight_layout()
 
         self.axFig = self.fig.add_subplot(211)
+        self.trace = LiveTrace(self.axFig, 'Time (s)', 'Measured voltage (V)',
+                               title = 'Force transducer data')
+        self.decimator = MinMaxDecimator('time', 'voltage',
+                                         columns = self.axFig.bbox.width)
+
         self.axCal = self.fig.add_subplot(212)
+        self.points, = self.axCal.plot([], [], 'o', color = 'blue', label = 'Measured')
+        self.fitted, = self.axCal.plot([], [], color = 'red', label = 'Fitted line')
+        self.axCal.set_xlabel('Measured voltage (V)')
+        self.axCal.set_ylabel('Actual force (N)')
+        self.axCal.set_title('Calibration data')
+        self.pointsChanged = False
+
         self.fig.tight_layout(pad = 3)
         self.canvas = FigureCanvasTkAgg(self.fig, self.labelFrameFig)
         self.canvas.get_tk_widget().grid(row = 0, column = 0, rowspan = 3, columnspan = 3, 
                          padx = 10, pady = 10, sticky = 'w')
 
         self.canvas.draw()
-        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100)
+        self.ani = animation.FuncAnimation(self.fig, self.animate, interval = 100,
+                                           blit = True, cache_frame_data = False)
         
     def getPoint(self):
+        # define function to capture a point off the GUI thread; animate()
+        # adds it to the list once it is done
+        if self.capturing:
+            return
         force = float(self.entry1.get())
-        self.listBox.insert('end', force)
-        # measure 5 s
-        fMean, fStd = Mark3().calibration()
-        self.xlist.append(fMean)
-        self.ylist.append(force)
-        
+        self.capturing = True
+        self.progress = 'Measuring '+str(force)+' N ...'
+        threading.Thread(target = self.capturePoint, args = (force,), daemon = True).start()
+
+    def capturePoint(self, force):
+        # worker: measure until the standard error is below target
+        try:
+            point = engine.calibrate(onProgress = self.showProgress)
+            if point is not None:
+                point['force'] = force
+                self.pending.append(point)
+                self.progress = 'Measured {:.6g} V +/- {:.2g} V in {:.2f} s'.format(
+                    point['mean'], point['sem'], point['duration'])
+        finally:
+            self.capturing = False
+
+    def showProgress(self, blocks, elapsed):
+        # called from the worker thread, shown by animate()
+        self.progress = 'Measuring: {:.6g} V, SEM {:.2g} V, {:.1f} s'.format(
+            blocks.mean, blocks.sem, elapsed)
+
+    def addPoint(self, point):
+        self.listBox.insert('end', point['force'])
+        self.calPoints.append(point)
+        self.xlist.append(point['mean'])
+        self.ylist.append(point['force'])
+        self.updateFit()
+
+    def updateFit(self):
         if len(self.xlist) > 1:
-            self.slope, self.intercept, self.r_value, p_value, std_err = stats.linregress(self.xlist, self.ylist)
+            self.slope, self.intercept, self.rSquared = calibration.fitLine(self.xlist, self.ylist)
+        self.pointsChanged = True
+
+    def applyCalibration(self):
+        # define function to store the fitted line in the history and
+        # save it as a/b in config.csv
+        if len(self.xlist) < 2:
+            self.progress = 'At least two points are needed to calibrate'
+            return
+        calibration.appendHistory(self.slope, self.intercept, self.rSquared,
+                                  [{key: point[key] for key in ('force', 'mean', 'std', 'sem', 'samples')}
+                                   for point in self.calPoints])
+        config = self.controller.getFrame(ConfigurationPage)
+        config.entry1_var.set(self.slope)
+        config.entry2_var.set(self.intercept)
+        config.saveConfiguration()
+        self.progress = 'Applied: a = {:.6g}, b = {:.6g}'.format(self.slope, self.intercept)
 
     def deletePoint(self):
         # define function to delete selected points
@@ -1078,367 +1355,159 @@ class ForceCalibrationPage(tk.Frame):
         self.listBox.delete(selected)
         self.xlist.pop(selected[0])
         self.ylist.pop(selected[0])
+        self.calPoints.pop(selected[0])
+        self.updateFit()
 
     def deleteAll(self):
         # define function to delete all points
         self.listBox.delete(0, 'end')
         self.xlist = []
         self.ylist = []
+        self.calPoints = []
         self.slope = 0
         self.intercept = 0
-        self.r_value = 0
+        self.rSquared = 0
+        self.pointsChanged = True
 
+    @diagnostics.timed('animate ForceCalibrationPage')
     def animate(self, i):
         # define function to show real time figure 
-        global xc, yc
-
-        self.axFig.clear()
-        self.axFig.plot(xc, yc)
-        self.axFig.set_xlabel('Time (s)')
-        self.axFig.set_ylabel('Measured voltage (V)')
-        self.axFig.set_title('Force transducer data')
-
-        self.axCal.clear()
-        self.axCal.plot(self.xlist, self.ylist, 'o', color = 'blue', label = 'Measured')
-        # define fitted line label
-        labelFitted = 'Fitted line: y = '+str(self.slope)+'x + '+str(self.intercept)+r'$ (R^2$'+str(self.r_value**2)+')'
-        
-        self.axCal.plot(self.xlist, self.ylist, color = 'red', label = labelFitted)
-        self.axCal.legend()
-        self.axCal.set_xlabel('Measured voltage (V)')
-        self.axCal.set_ylabel('Actual force (N)')
-        self.axCal.set_title('Calibration data')
-
-
-class Mark3():
-    #Class to run Millimanipulation application
-    def __init__(self):
-        self.path = ''
-
-    def XmoveRight(self):
-        # function to run x-axis movement
-        distanceX, speedX, distanceZ, speedZ = app.pass_on_text(SetPositionPage)
+        t, vol = self.decimator.update(engine.calData)
+        changed = self.trace.update(t, vol)
+
+        # points and progress from the capture thread
+        while self.pending:
+            self.addPoint(self.pending.pop(0))
+        if self.progressText.get() != self.progress:
+            self.progressText.set(self.progress)
+
+        # calibration points only change on user action, redraw them then
+        if self.pointsChanged:
+            self.pointsChanged = False
+            self.points.set_data(self.xlist, self.ylist)
+            xFit = [min(self.xlist), max(self.xlist)] if self.xlist else []
+            self.fitted.set_data(xFit, [self.slope*x+self.intercept for x in xFit])
+
+            # define fitted line label
+            labelFitted = 'Fitted line: y = '+str(self.slope)+'x + '+str(self.intercept)+r'$ (R^2$'+str(self.rSquared)+')'
+            self.fitted.set_label(labelFitted)
+            self.axCal.legend()
+            self.axCal.relim()
+            self.axCal.autoscale_view()
+            changed = True
+
+        return updateArtists(self.canvas, changed, self.trace.line)
+
+
+class DiagnosticsPage(tk.Frame):
+    # window frame of the loop timings, reached from the configuration page
+    def __init__(self, parent, controller):
+        tk.Frame.__init__(self, parent)
+        self.controller = controller
 
-        # prepare parameters for setting x-axis positioner 
-        stepsX = int(distanceX*200)
-        stepSpeedX = int(speedX*200) # steps/s
-        settingsX = {"Speed":stepSpeedX, "uSpeed":0, "Accel":10000, "Decel":10000, "AntiplaySpeed":50, "uAntiplaySpeed":0}
+        # label of frame layout 
+        label = tk.Label(self, text ='Diagnostics', font = LARGEFONT,
+                         width = 20, height = 1, anchor = 'nw')
+        label.grid(row = 0, column = 0, columnspan = 3,
+                   padx = 10, pady = 5)
 
+        buttonExit = ttk.Button(self, text="Exit Window",
+                                command = controller.destroy)
+        buttonExit.grid(row = 0, column = 4, padx = 10, pady = 5)
         
-        try:
-            with StageControl() as stcon:
-                # set up x-axis movement parameters
-                stcon.setMoveParameters(stcon.lrDevId, settingsX)
-                print ('Set up x-axis movement parameters.')
-                stcon.getMoveParameters(stcon.lrDevId)
-
-                # run x-axis positioner
-                stcon.moveRelativeRight(stepsX)
-                stcon.waitForStopXY()
-                time.sleep(0.3)
-                # set parameters to original
-                stcon.setMoveParameters(stcon.lrDevId, {"Speed":2000, "uSpeed":0, "Accel":2000,
-                                                        "Decel":5000, "AntiplaySpeed":50, "uAntiplaySpeed":0})
-		
+        # buttons to go to different pages
+        button1 = ttk.Button(self, text ='Set Position',
+        command = lambda : controller.show_frame(SetPositionPage), 
+                             width = 20)
+        button1.grid(row = 1, column = 0, padx = 10, pady = 5)
 
-        except KeyboardInterrupt:
-            print('Exiting scan early!')
-            
-        except:
-            print('Error thrown in XmoveRight()')
-        
-        # update current positions of x and z
-        app.frames[SetPositionPage].updatePosition()
+        button2 = ttk.Button(self, text ='Millimanipulation',
+        command = lambda : controller.show_frame(MillimanipulationPage), 
+                             width = 20)
+        button2.grid(row = 1, column = 1, padx = 10, pady = 5)
     
-
-    def ZmoveUp(self):
-        # function to run z-axis movement
-        distanceX, speedX, distanceZ, speedZ = app.pass_on_text(SetPositionPage)
-
-        # prepare parameters for setting z-axis positioner 
-        stepsZ = int(distanceZ*12000)
-        stepSpeedZ = int(speedZ*12000) # steps/s
-
-        try:
-            with StageControl() as stcon:
-                # set up z-axis movement parameters
-                stcon.setMoveParameters(stcon.udDevId, settingsZ)
-                print ('Set up z-axis movement parameters.')
-                stcon.getMoveParameters(stcon.udDevId)
-
-                # run z-axis positioner
-                stcon.moveRelativeUp(stepsZ)
-                stcon.waitForStopXY()
-                time.sleep(0.3) # pause time: 0.3 s
-		
-
-        except KeyboardInterrupt:
-            print("Exiting scan early")		
-        except:
-            print("Error thrown in XmoveRight()")
-        
-        # update current positions of x and z
-        app.frames[SetPositionPage].updatePosition()
-
-
-    def Millimanipulation(self):
-        # define function to run millimanipulation
-        app.frames[MillimanipulationPage].animate()
-        
-        # get all entry variables
-        distance, speed, path = app.pass_on_text(MillimanipulationPage)
-
-        # create a folder to save images
-        global recordImage, ImagePath
-        if recordImage:
-            ImagePath = path
-            if not os.path.isdir(ImagePath): os.mkdir(ImagePath)
-
-        # add extra 1 sec to capture relaxation
-        targetTime = int(distance/speed)+1
-        
-        # prepare parameters for setting x-axis positioner 
-        steps = int(distance*200)
-        stepSpeed = int(speed*200) # steps/s
-        settings = {"Speed":stepSpeed, "uSpeed":0, "Accel":10000, "Decel":10000, "AntiplaySpeed":50, "uAntiplaySpeed":0}
-
-        try:
-            with StageControl() as stcon:
-                # set up x-axis movement parameters
-                stcon.setMoveParameters(stcon.lrDevId, settings)
-                print ('Set up x-axis movement parameters.')
-                stcon.getMoveParameters(stcon.lrDevId)
-
-                # start to record force
-                trans = threading.Thread(target = self.recordForce(targetTime))
-                trans.start()
-                
-                # run x-axis positioner
-                stcon.moveRelativeRight(steps)
-                stcon.waitForStopXY()
-                time.sleep(0.3) # pause time: 0.3 s
-                
-                trans.join()
-
-                # set parameters to original
-                stcon.setMoveParameters(stcon.lrDevId, {"Speed":2000, "uSpeed":0, "Accel":2000,
-                                                        "Decel":5000, "AntiplaySpeed":50, "uAntiplaySpeed":0})
-                
-        except KeyboardInterrupt:
-            print('Exiting scan early!')		
-        except:
-            print('Error thrown in Millimanipulation()')
-
-        # filter results using low-pass
-        yf = self.filter(ym)
-        
-        # save results as csv
-        self.save(path, xm, ym, yf)
-            
+        button3 = ttk.Button(self, text ='Relaxation Tests',
+        command = lambda : controller.show_frame(RelaxationTestsPage),
+                             width = 20)
+        button3.grid(row = 1, column = 2, padx = 10, pady = 5)
     
-    def RelaxationTests(self):
-        # define function to run relaxation tests
-
-        # get all entry variables
-        interval, speed, noScrape, relaxTime, path = app.pass_on_text(RelaxationTestsPage)
-
-        # create a folder to save images
-        global recordImage, ImagePath
-        if recordImage:
-            ImagePath = path
-            if not os.path.isdir(ImagePath): os.mkdir(ImagePath)
-
-        # calculate required time
-        targetTime = int((interval/speed+relaxTime+1)*noScrape)
-
-        # prepare parameters for setting x-axis positioner 
-        steps = int(interval*200)
-        stepSpeed = int(speed*200) # steps/s
-        settings = {"Speed":stepSpeed, "uSpeed":0, "Accel":10000, "Decel":10000, "AntiplaySpeed":50, "uAntiplaySpeed":0}
-
-        try:
-            with StageControl() as stcon:
-                # set up x-axis movement parameters
-                stcon.setMoveParameters(stcon.lrDevId, settings)
-                print ('Set up x-axis movement parameters.')
-                stcon.getMoveParameters(stcon.lrDevId)
-
-                # start to record force
-                trans = threading.Thread(target = self.recordForce(targetTime))
-                trans.start()
-
-                # run x-axis positioner
-                for _ in range(noScrape):
-                    stcon.moveRelativeRight(steps)
-                    stcon.waitForStopXY()
-                    time.sleep(relaxTime) 
-
-                trans.join()
-
-                # set parameters to original
-                stcon.setMoveParameters(stcon.lrDevId, {"Speed":2000, "uSpeed":0, "Accel":2000,
-                                                        "Decel":5000, "AntiplaySpeed":50, "uAntiplaySpeed":0})
+        button4 = ttk.Button(self, text ='Configuration',
+        command = lambda : controller.show_frame(ConfigurationPage),
+                             width = 20)
+        button4.grid(row = 1, column = 3, padx = 10, pady = 5)
+    
+        button5 = ttk.Button(self, text ='Force Calibration',
+        command = lambda : controller.show_frame(ForceCalibrationPage),
+                             width = 20)
+        button5.grid(row = 1, column = 4, padx = 10, pady = 5)
 
+        # separation line
+        separator1 = ttk.Separator(self, orient = 'horizontal')
+        separator1.grid(row = 2, column = 0, pady = 10,
+                        columnspan = 6, sticky = 'we')
 
-        except KeyboardInterrupt:
-            print('Exiting scan early!')		
-        except:
-            print('Error thrown in RelaxationTests()')
 
-        # filter results using low-pass
-        yf = self.filter(ym)
-        
-        # save results as csv
-        self.save(path, xm, ym, yf)
-        
+        # labelframe of the loop timings
+        labelFrame1 = tk.LabelFrame(self,
+                                    text = 'Loop timings since the last run started or reset')
+        labelFrame1.grid(row = 3, column = 0, columnspan = 5,
+                         padx = 10, pady = 10, sticky = 'w')
 
-    def calibration(self):
-        # define function to get calibration point
-        global xc, yc, operation
-        xc = [0]
-        yc = [0]
-        
-        try:
-            operation = True
+        self.text = tk.Text(labelFrame1, width = 110, height = 14, font = ('Courier', 10))
+        self.text.grid(row = 0, column = 0, columnspan = 3, padx = 10, pady = 10)
 
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_voltage_chan(niport,
-                terminal_config=TerminalConfiguration.RSE,
-                min_val=-5.0, max_val=5.0, units=VoltageUnits.VOLTS)
-                
-                startTime = time.perf_counter()
-                
-                while operation:
-                    # read voltage
-                    vol = task.read()
-                    
-                    # add x and y to lists              
-                    xc.append(time.perf_counter()-startTime)
-                    yc.append(vol) 
-
-                    # stop measurement as reaching target time
-                    if time.perf_counter()-startTime > 5: # run 5 sec for calibration
-                        operation = False
-                
-        except KeyboardInterrupt:
-            print('Exiting early!')
-            operation = False
-            return
+        button6 = ttk.Button(labelFrame1, text ='Reset',
+                             command = diagnostics.reset)
+        button6.grid(row = 1, column = 0, padx = 10, pady = 10)
 
-        # filter results using low-pass
-        yf = self.filter(yc)
-        fMean = stats.tmean(yf)
-        fStd = stats.tstd(yf)
-        return [fMean, fStd]
-        
-    
-    def recordForce(self, targetTime):
-        # define function to record force
-        global xm, ym, operation, a, b, niport
-        
-        try:
-            xm = [0]
-            ym = [0]
-            operation = True
-
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_voltage_chan(niport,
-                terminal_config=TerminalConfiguration.RSE,
-                min_val=-5.0, max_val=5.0, units=VoltageUnits.VOLTS)
-                
-                startTime = time.perf_counter()
-                
-                while operation:
-                    # read voltage
-                    vol = task.read()
-                    
-                    # add x and y to lists              
-                    xm.append(time.perf_counter()-startTime)
-                    #ym.append(vol)
-                    ym.append(a*vol+b)
-
-                    # stop measurement as reaching target time
-                    if time.perf_counter()-startTime > targetTime:
-                        operation = False
-                
-        except KeyboardInterrupt:
-            print('Exiting early!')
-            operation = False
-            return
-    
-    def grabImage(self):
-        # define function to take images
-        global frameWidth, frameHeight, img, cameraSelected, recordImage
-        global ImagePath, operation, xm
-
-        if cameraSelected: 
-            cap = cv2.VideoCapture(0)
-            # set up frame size
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, frameWidth)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, frameHeight)
-        
-        try:
-            while cameraSelected:      
-                # get frames from camera and convert into images
-                cap = cv2.VideoCapture(0)
-                cvimage = cap.read()[1]
-                img = cv2.cvtColor(cvimage, cv2.COLOR_BGR2RGB)
-
-                # save images
-                if operation and recordImage:
-                    cv2.imwrite(ImagePath+'/{:.2f}.jpg'.format(xm[-1]),
-                                cvimage, [cv2.IMWRITE_JPEG_QUALITY, 90])
-                    
-        except KeyboardInterrupt:
-            print('Exiting early!')
-            return
-        
-        except:
-            print('Error thrown in VideoCapture(). Check camera connection.')
-            
-        finally:
-            cap.release()
+        button7 = ttk.Button(labelFrame1, text ='Save as json',
+                             command = lambda : self.saveTimings())
+        button7.grid(row = 1, column = 1, padx = 10, pady = 10)
 
-    def filter(self, yy):
-        # define function to filter results using low-pass
-        
-        global filFreq
-        bb, aa = signal.butter(3, 1/max(1, filFreq), 'lowpass')
-        return signal.filtfilt(bb, aa, yy)
+        self.refresh()
 
+    def refresh(self):
+        # define function to update the table once a second while shown
+        if self.controller.current is self:
+            self.text.delete('1.0', 'end')
+            self.text.insert('end', diagnostics.report())
+        self.after(1000, self.refresh)
 
-    def save(self, path, xx, yy, yyf):
-        # define function to save results as csv
+    def saveTimings(self):
+        # define function to dump the statistics of every loop
+        path = filedialog.asksaveasfilename(defaultextension = '.json',
+                                            filetypes = [('json', '*.json')])
+        if path:
+            with open(path, 'w', encoding = 'UTF8') as f:
+                json.dump(diagnostics.summary(), f, indent = 1)
 
-        header = ['time (s)', 'Force (N)']
-        with open(path+'.csv', 'w', encoding = 'UTF8', newline = '') as f:
-            writer = csv.writer(f)
-                
-            # write the header and data
-            writer.writerow(header)
-            writer.writerows([[xx[i], yy[i], yyf[i]] for i in range(len(xx))])
-                
 
 # run GUI
 if __name__ == '__main__':
     # import configuration parameters
     try:
-        with open('config.csv', newline = '') as f:
-            reader = csv.DictReader(f)
-            column = [row for row in reader]
-        dic = column[0]
-
-        # ------ global variables ------
-        a = float(dic['a'])
-        b = float(dic['b'])
-        frameWidth = int(dic['frame width']) 
-        frameHeight = int(dic['frame height'])
-
+        config = Config.load('config.csv')
     except:
         print ('Cannot find "config.csv" file, use default parameters.')
+        config = Config()
+    startup.mark('configuration')
+
+    # open the stage controller once for all pages
+    engine = Engine(config)
+    startup.mark('stage and engine')
 
     app = tkinterApp()
     app.title('Millimanipulation Mark3 Driver')
     app.geometry('1100x800')
+
+    def started():
+        # window is drawn: report start-up time, then warm up the filter
+        # design module in the background so the first test does not wait
+        startup.mark('first draw')
+        print(startup.report())
+        threading.Thread(target = lambda: __import__('scipy.signal'), daemon = True).start()
+
+    app.after_idle(started)
     app.mainloop() # ready to run
 
+    engine.close()
@@ -0,0 +1,199 @@
+# Headless batch post-processing of Millimanipulation Mark 3 runs
+# Scans a directory tree for run containers (.m3run) and csv files, re-filters
+# every run at a given cutoff in a process pool and writes one summary table.
+# Results are cached per run by content hash, so unchanged runs are skipped.
+#
+# usage: python batch.py <directory> [--cutoff 10] [--speed 1] [--workers 4]
+#================================================================
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+import runfile
+from filtering import zeroPhaseFilter
+
+
+CACHE_NAME = '.m3batch_cache.json'
+CACHE_VERSION = 1
+SUMMARY_COLUMNS = ['run', 'peak force (N)', 'plateau force (N)', 'work (mJ)',
+                   'samples', 'cutoff (Hz)', 'error']
+
+
+def isRunCsv(path):
+    # define function to check that a csv holds a force trace, i.e. has
+    # time and force columns; other csvs, e.g. relaxation fits, summaries
+    # or configs, are not runs
+    try:
+        with open(path, newline = '', encoding = 'UTF8') as f:
+            header = next(csv.reader(f), [])
+    except (OSError, UnicodeDecodeError):
+        return False
+    return 'time (s)' in header and 'Force (N)' in header
+
+
+def findRuns(directory, summaryPath = None):
+    # define function to list run containers and csv force traces below
+    # directory; a csv exported from a container next to it is skipped
+    runs = []
+    for root, dirs, files in os.walk(directory):
+        containers = [d for d in dirs if d.endswith(runfile.RUN_SUFFIX)]
+        runs += [os.path.join(root, d) for d in containers]
+        exported = {d[:-len(runfile.RUN_SUFFIX)]+'.csv' for d in containers}
+        for name in files:
+            path = os.path.join(root, name)
+            if (name.endswith('.csv') and name not in exported
+                    and name != CACHE_NAME
+                    and not (summaryPath and os.path.abspath(path) == os.path.abspath(summaryPath))
+                    and isRunCsv(path)):
+                runs.append(path)
+        # do not descend into run containers
+        dirs[:] = [d for d in dirs if not d.endswith(runfile.RUN_SUFFIX)]
+    return sorted(runs)
+
+
+def contentHash(path):
+    # define function to hash a csv file or every file of a run container
+    digest = hashlib.sha256()
+    files = [path]
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    for fileName in files:
+        digest.update(os.path.basename(fileName).encode())
+        with open(fileName, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def loadTrace(path, speed = None):
+    # define function to load time, force and displacement (mm, or None)
+    if os.path.isdir(path):
+        return loadRunTrace(path, speed)
+
+    with open(path, newline = '') as f:
+        header = next(csv.reader(f))
+    forceColumn = header.index('Force (N)') if 'Force (N)' in header else 1
+    data = np.loadtxt(path, delimiter = ',', skiprows = 1, usecols = (0, forceColumn), ndmin = 2)
+    t, force = data[:, 0], data[:, 1]
+    x = speed*(t-t[0]) if speed else None
+    return t, force, x
+
+
+def loadRunTrace(path, speed = None):
+    run = runfile.loadRun(path)
+    table = run['force']
+    t, force = np.asarray(table['time']), np.asarray(table['force'])
+
+    # measured stage position if it was recorded, else speed x motion time
+    if 'x' in table and len(table['x']):
+        return t, force, np.asarray(table['x'])-table['x'][0]
+    speed = speed or run.parameters.get('speed (mm/s)')
+    if not speed:
+        return t, force, None
+    timing = run.meta.get('timing', {})
+    start = timing.get('motionStart', 0.0)
+    end = timing.get('motionEnd', t[-1])
+    return t, force, speed*np.clip(t-start, 0, end-start)
+
+
+def analyse(t, force, x, cutoff):
+    # define function to compute the summary of one run
+    # peak: maximum filtered force
+    # plateau: mean filtered force over the middle half of the span where
+    #          the force is above half of the peak
+    # work: integral of force over displacement (N mm = mJ)
+    tf, ff = zeroPhaseFilter(t, force, cutoff)
+    peak = float(np.max(ff))
+
+    above = np.flatnonzero(ff >= 0.5*peak) if peak > 0 else np.empty(0, dtype = int)
+    plateau = float('nan')
+    if len(above):
+        first, last = above[0], above[-1]
+        quarter = (last-first)//4
+        plateau = float(np.mean(ff[first+quarter:last-quarter+1]))
+
+    work = float('nan')
+    if x is not None:
+        xf = np.interp(tf, t, x)
+        work = float(np.sum((ff[1:]+ff[:-1])/2*np.diff(xf)))
+
+    return {'peak force (N)': peak, 'plateau force (N)': plateau,
+            'work (mJ)': work, 'samples': len(t)}
+
+
+def processRun(path, cutoff, speed):
+    # worker: load, filter and summarise one run
+    try:
+        t, force, x = loadTrace(path, speed)
+        result = analyse(t, force, x, cutoff)
+        result['error'] = ''
+    except Exception as e:
+        result = {'error': str(e)}
+    result['cutoff (Hz)'] = cutoff
+    return result
+
+
+def loadCache(path):
+    try:
+        with open(path, encoding = 'UTF8') as f:
+            cache = json.load(f)
+        return cache if cache.get('version') == CACHE_VERSION else {'version': CACHE_VERSION}
+    except (OSError, ValueError):
+        return {'version': CACHE_VERSION}
+
+
+def runBatch(directory, cutoff = 10.0, speed = None, workers = None, output = None):
+    # define function to process every run below directory and write the summary
+    output = output or os.path.join(directory, 'summary.csv')
+    cachePath = os.path.join(directory, CACHE_NAME)
+    cache = loadCache(cachePath)
+    runs = findRuns(directory, output)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        # hash in parallel, then only process runs without a cached result
+        hashes = dict(zip(runs, pool.map(contentHash, runs)))
+        keys = {path: hashes[path]+':'+repr(cutoff)+':'+repr(speed) for path in runs}
+        todo = [path for path in runs if keys[path] not in cache]
+        results = pool.map(processRun, todo, [cutoff]*len(todo), [speed]*len(todo))
+        for path, result in zip(todo, results):
+            cache[keys[path]] = result
+
+    with open(output, 'w', encoding = 'UTF8', newline = '') as f:
+        writer = csv.DictWriter(f, SUMMARY_COLUMNS)
+        writer.writeheader()
+        for path in runs:
+            row = dict(cache[keys[path]])
+            row['run'] = os.path.relpath(path, directory)
+            writer.writerow(row)
+
+    # keep only entries of runs that still exist
+    live = set(keys.values())
+    cache = {key: value for key, value in cache.items() if key == 'version' or key in live}
+    with open(cachePath, 'w', encoding = 'UTF8') as f:
+        json.dump(cache, f)
+
+    print('Processed {} of {} runs ({} cached), summary: {}'.format(
+        len(todo), len(runs), len(runs)-len(todo), output))
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Re-filter and summarise Millimanipulation runs.')
+    parser.add_argument('directory', help = 'directory searched recursively for runs')
+    parser.add_argument('--cutoff', type = float, default = 10.0, help = 'low-pass cutoff (Hz)')
+    parser.add_argument('--speed', type = float, default = None,
+                        help = 'scraping speed (mm/s) for runs without stored speed or position')
+    parser.add_argument('--workers', type = int, default = None, help = 'number of processes')
+    parser.add_argument('--output', default = None, help = 'summary csv (default: <directory>/summary.csv)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print('Cannot find directory '+args.directory)
+        sys.exit(1)
+    runBatch(args.directory, args.cutoff, args.speed, args.workers, args.output)
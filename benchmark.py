@@ -0,0 +1,296 @@
+# Benchmark suite of the Millimanipulation Mark 3 driver
+# Runs the acquisition, camera, display, saving, filtering and stage paths
+# headless against the simulated backends at several run lengths, writes
+# the results as json and compares them with a stored baseline. Exits with
+# status 1 if any result is worse than the baseline by more than the
+# tolerance.
+#
+# usage: python benchmark.py [--quick] [--output benchmark.json]
+#                            [--baseline benchmark_baseline.json] [--save-baseline]
+#================================================================
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import runfile
+from buffers import TimeSeriesBuffer
+from bus import Stream
+from camera import CameraService, ImageSaver, openCamera
+from engine import Config, Engine, FORCE_COLUMNS
+from filtering import StreamingFilter, lowpassSos
+from liveplot import LiveTrace, MinMaxDecimator, updateArtists
+from relaxation import fitCycles
+from writer import StreamWriter
+
+
+VERSION = 1
+RATE = 1000 # Hz, default sample rate of the rig
+# run lengths (s) from a short test to a 2 h relaxation run
+SIZES = [1, 60, 600, 7200]
+QUICK_SIZES = [1, 60]
+TOLERANCE = 0.25
+FLOOR = 0.5 # ms, differences below this are timer noise
+
+
+class Results():
+    # collected results: name -> value, unit, whether higher is better and
+    # the absolute change that still counts as noise
+    def __init__(self):
+        self.values = {}
+
+    def add(self, name, value, unit, better = 'lower', floor = None):
+        if floor is None:
+            floor = FLOOR if unit == 'ms' else 0.0
+        self.values[name] = {'value': float(value), 'unit': unit,
+                             'better': better, 'floor': floor}
+        print('  {:<40s}{:>14.4g} {}'.format(name, value, unit))
+
+
+def timeIt(func, repeat = 3):
+    # define function to return the median wall time of func() (s)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-start)
+    return float(np.median(times))
+
+
+def percentiles(times):
+    times = np.asarray(times)
+    return float(np.median(times)), float(np.percentile(times, 95))
+
+
+def syntheticRun(seconds, rate = RATE, seed = 0):
+    # define function to make time, voltage and force of a run
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds*rate))/rate
+    vol = 0.1+0.02*(np.sin(2*np.pi*t/20) > 0)+0.002*rng.standard_normal(len(t))
+    return t, vol, 54*vol-5.4
+
+
+# ------ benchmarks ------
+def benchAcquisition(results, directory, seconds = 2.0):
+    # real-time acquisition through the engine: achieved rate, arm latency
+    engine = Engine(Config.simulated(sampleRate = RATE))
+    start = {}
+    engine.recordForce(seconds, lambda hostTime: start.setdefault('t', hostTime))
+    elapsed = time.perf_counter()-start['t']
+    samples = engine.forceData.total
+    engine.close()
+    results.add('acquisition.achieved_rate', samples/elapsed, 'Hz', 'higher')
+    results.add('acquisition.rate_error', abs(samples/elapsed/RATE-1), 'fraction', floor = 0.01)
+
+    # per-block work of the acquisition loop without waiting for the clock
+    t, vol, force = syntheticRun(60)
+    stream = Stream('force', FORCE_COLUMNS, 600*RATE)
+    liveFilter = StreamingFilter(lowpassSos(RATE, 10))
+    run = runfile.RunWriter(os.path.join(directory, 'throughput'), {}, {'force': runfile.FORCE_COLUMNS})
+    writer = StreamWriter(run)
+    stream.subscribe(lambda b: writer.put(time = b[0], voltage = b[1], force = b[2]))
+    block = RATE//10
+    begin = time.perf_counter()
+    for i in range(0, len(t), block):
+        f = force[i:i+block]
+        stream.publish(t[i:i+block], vol[i:i+block], f, liveFilter.process(f))
+    loop = time.perf_counter()-begin
+    writer.close()
+    writer.join()
+    results.add('acquisition.block_time', loop/(len(t)/block)*1000, 'ms')
+    results.add('acquisition.throughput', len(t)/loop, 'samples/s', 'higher')
+
+
+def benchCamera(results, directory, seconds = 2.0, fps = 30.0):
+    # achieved frame rate of the camera thread and jpg saving throughput
+    camera = CameraService(openCamera(0, 640, 480, 'simulated', fps)).start()
+    time.sleep(seconds)
+    camera.stop()
+    results.add('camera.achieved_fps', camera.fps, 'fps', 'higher')
+
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype = np.uint8)
+    saver = ImageSaver(os.path.join(directory, 'images'), queueSize = 1000)
+    os.makedirs(saver.directory, exist_ok = True)
+    begin = time.perf_counter()
+    for i in range(100):
+        while saver.submit(frame, begin+i/fps) is None:
+            time.sleep(0.001)
+    stats = saver.close()
+    results.add('camera.save_rate', stats['written']/(time.perf_counter()-begin), 'fps', 'higher')
+
+
+def benchDisplay(results, sizes):
+    # animate() of a test page: decimate the live buffer, update the
+    # lines and blit, with an Agg canvas instead of Tk
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize = (6, 6))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(212)
+    trace = LiveTrace(ax, 'Time (s)', 'Force (N)')
+    trace.addLine()
+    canvas.draw()
+    results.add('display.full_draw', timeIt(canvas.draw)*1000, 'ms')
+
+    for seconds in sizes:
+        # the live buffer holds at most bufferTime (600 s) of samples
+        # plus 20 blocks that arrive one per timed frame
+        held = min(seconds, 600)
+        block = RATE//10
+        t, vol, force = syntheticRun(held+2)
+        buffer = TimeSeriesBuffer(held*RATE, columns = FORCE_COLUMNS)
+        decimator = MinMaxDecimator('time', 'force', columns = ax.bbox.width)
+        decimatorFiltered = MinMaxDecimator('time', 'filtered', columns = ax.bbox.width)
+
+        def frame():
+            # one animation frame after a new block arrived
+            x, y = decimator.update(buffer)
+            xf, yf = decimatorFiltered.update(buffer)
+            changed = trace.update(x, y, xf, yf)
+            updateArtists(canvas, changed, *trace.lines)
+            for line in trace.lines:
+                ax.draw_artist(line)
+
+        n = held*RATE
+        buffer.extend(t[:n], vol[:n], force[:n], force[:n])
+        first = timeIt(frame, 1)
+        frames = []
+        for i in range(n, len(t), block):
+            buffer.extend(t[i:i+block], vol[i:i+block], force[i:i+block], force[i:i+block])
+            frames.append(timeIt(frame, 1))
+        median, p95 = percentiles(frames)
+        results.add('display.{}s.first_frame'.format(seconds), first*1000, 'ms')
+        results.add('display.{}s.frame'.format(seconds), median*1000, 'ms')
+        # the p95 frame includes the occasional full redraw after a rescale
+        results.add('display.{}s.frame_p95'.format(seconds), p95*1000, 'ms', floor = 50)
+
+
+def benchSaving(results, directory, sizes):
+    # writing a run container, filtering and csv export versus run length
+    engine = Engine(Config.simulated(sampleRate = RATE))
+    for seconds in sizes:
+        t, vol, force = syntheticRun(seconds)
+        paths = []
+
+        def write():
+            # every repeat writes a fresh container
+            paths.append(os.path.join(directory, 'run{}_{}'.format(seconds, len(paths))))
+            run = runfile.RunWriter(paths[-1], {}, {'force': runfile.FORCE_COLUMNS})
+            run.append('force', {'time': t, 'voltage': vol, 'force': force})
+            run.addColumn('force', 'filtered', 'Filtered force (N)', engine.filter(force))
+            run.close()
+
+        repeat = 5 if seconds <= 60 else 3 if seconds <= 600 else 1
+        results.add('filter.{}s'.format(seconds), timeIt(lambda: engine.filter(force), repeat)*1000, 'ms')
+        results.add('save.{}s.container'.format(seconds), timeIt(write, repeat)*1000, 'ms')
+        path = paths[-1]
+        results.add('save.{}s.csv'.format(seconds), timeIt(lambda: engine.save(path), repeat)*1000, 'ms')
+        results.add('load.{}s'.format(seconds),
+                    timeIt(lambda: np.asarray(runfile.loadRun(path)['force']['force']).sum(), repeat)*1000, 'ms')
+    engine.close()
+
+    # relaxation fits of a 2 h run: 720 cycles of 10 s
+    cycles = 720 if max(sizes) >= 7200 else 6
+    t, vol, force = syntheticRun(10*cycles)
+    starts = np.arange(cycles)*10.0
+    results.add('relaxation.{}cycles'.format(cycles),
+                timeIt(lambda: fitCycles(t, force, starts, starts+1.0), 1)*1000, 'ms')
+
+
+def benchStage(results, repeat = 50):
+    # round trips of stage commands through the shared session
+    engine = Engine(Config.simulated())
+    stage = engine.stage
+    positions, moves = [], []
+    settings = {'Speed': 2000, 'uSpeed': 0, 'Accel': 10000, 'Decel': 10000,
+                'AntiplaySpeed': 50, 'uAntiplaySpeed': 0}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage.posXYVals_cal()
+        positions.append(time.perf_counter()-start)
+        start = time.perf_counter()
+        stage.moveRelative(stage.lrDevId, 0, settings)
+        moves.append(time.perf_counter()-start)
+    engine.close()
+    for name, times in (('position', positions), ('move', moves)):
+        median, p95 = percentiles(times)
+        results.add('stage.{}'.format(name), median*1000, 'ms')
+        results.add('stage.{}_p95'.format(name), p95*1000, 'ms', floor = 5)
+
+
+def runBenchmarks(quick = False):
+    # define function to run the whole suite, returns the result document
+    sizes = QUICK_SIZES if quick else SIZES
+    results = Results()
+    directory = tempfile.mkdtemp(prefix = 'm3bench')
+    try:
+        print('Acquisition'); benchAcquisition(results, directory)
+        print('Camera'); benchCamera(results, directory)
+        print('Display'); benchDisplay(results, sizes)
+        print('Saving and filtering'); benchSaving(results, directory, sizes)
+        print('Stage'); benchStage(results)
+    finally:
+        shutil.rmtree(directory, ignore_errors = True)
+
+    return {'version': VERSION,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'quick': quick,
+            'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                        'processor': platform.processor(), 'cpus': os.cpu_count()},
+            'results': results.values}
+
+
+def compare(current, baseline, tolerance = TOLERANCE):
+    # define function to list results worse than the baseline by more than
+    # tolerance (relative) and by more than their noise floor (absolute);
+    # results missing on either side are skipped
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        reference = baseline['results'].get(name)
+        if reference is None or not reference['value']:
+            continue
+        ratio = result['value']/reference['value']
+        worse = ratio > 1+tolerance if result['better'] == 'lower' else ratio < 1-tolerance
+        worse = worse and abs(result['value']-reference['value']) > result.get('floor', 0)
+        print('  {:<40s}{:>12.4g}{:>12.4g}{:>9.2f}x{}'.format(
+            name, reference['value'], result['value'], ratio, '  REGRESSION' if worse else ''))
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the Millimanipulation driver on simulated hardware.')
+    parser.add_argument('--quick', action = 'store_true', help = 'only run lengths up to 1 min')
+    parser.add_argument('--output', default = 'benchmark.json', help = 'results json')
+    parser.add_argument('--baseline', default = 'benchmark_baseline.json', help = 'baseline json')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store the results as baseline')
+    parser.add_argument('--tolerance', type = float, default = TOLERANCE,
+                        help = 'allowed relative regression (default 0.25)')
+    args = parser.parse_args()
+
+    current = runBenchmarks(args.quick)
+    with open(args.output, 'w', encoding = 'UTF8') as f:
+        json.dump(current, f, indent = 1)
+    print('Results: '+args.output)
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print('Baseline: '+args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding = 'UTF8') as f:
+            baseline = json.load(f)
+        print('Comparison with {} ({}):'.format(args.baseline, baseline['created']))
+        print('  {:<40s}{:>12s}{:>12s}{:>10s}'.format('result', 'baseline', 'current', 'ratio'))
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print('{} regression(s): {}'.format(len(regressions), ', '.join(regressions)))
+            sys.exit(1)
+        print('No regressions.')
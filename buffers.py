@@ -0,0 +1,113 @@
+# Fixed-capacity time-series buffers for live data
+#================================================================
+import threading
+
+import numpy as np
+
+
+class TimeSeriesBuffer():
+    # Ring buffer of named columns backed by one preallocated array.
+    # Every sample is written twice (index i and i+capacity) so the latest
+    # samples are always contiguous and can be handed out as views.
+    def __init__(self, capacity, columns = ('time', 'voltage', 'force'),
+                 onSpill = None):
+        self.capacity = max(1, int(capacity))
+        self.columns = tuple(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.data = np.zeros((len(self.columns), 2*self.capacity))
+        self.head = 0 # next write position in [0, capacity)
+        self.size = 0 # samples currently held
+        self.total = 0 # samples written since creation or clear()
+        self.generation = 0 # incremented by clear() and resize()
+        # onSpill(rows) gets the oldest samples just before they are
+        # overwritten; rows is a view and must be copied if kept
+        self.onSpill = onSpill
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, *values):
+        # add a single sample, one value per column
+        self.extend(*[[v] for v in values])
+
+    def extend(self, *block):
+        # add a block of samples, one array per column
+        block = np.asarray(block, dtype = float)
+        n = block.shape[1]
+        if n == 0:
+            return
+
+        with self.lock:
+            overflow = self.size+n-self.capacity
+            if overflow > 0 and self.onSpill is not None:
+                # hand over the oldest rows (and any of the block that
+                # will not fit) before they are overwritten
+                held = min(overflow, self.size)
+                if held:
+                    self.onSpill(self._latest(self.size)[:, :held])
+                if n > self.capacity:
+                    self.onSpill(block[:, :n-self.capacity])
+
+            # every sample counts towards total, also those of a block
+            # larger than the buffer that are never stored
+            self.total += n
+            if n > self.capacity:
+                block = block[:, -self.capacity:]
+                n = self.capacity
+
+            idx = (self.head+np.arange(n)) % self.capacity
+            self.data[:, idx] = block
+            self.data[:, idx+self.capacity] = block
+            self.head = (self.head+n) % self.capacity
+            self.size = min(self.size+n, self.capacity)
+
+    def _latest(self, n):
+        end = self.head+self.capacity
+        return self.data[:, end-n:end]
+
+    def view(self, n = None):
+        # zero-copy, read-only view of the latest n samples (all by default)
+        # with shape (columns, n); valid until capacity-n further samples
+        # are added, copy it to keep it longer
+        with self.lock:
+            n = self.size if n is None else min(int(n), self.size)
+            out = self._latest(n)
+        out.flags.writeable = False
+        return out
+
+    def column(self, name, n = None):
+        return self.view(n)[self.index[name]]
+
+    def last(self, name):
+        # latest value of one column, 0 while the buffer is empty
+        with self.lock:
+            if not self.size:
+                return 0.0
+            return self.data[self.index[name], self.head+self.capacity-1]
+
+    def first(self, name):
+        # oldest value of one column, 0 while the buffer is empty
+        with self.lock:
+            if not self.size:
+                return 0.0
+            return self.data[self.index[name], self.head+self.capacity-self.size]
+
+    def clear(self):
+        with self.lock:
+            self.head = self.size = self.total = 0
+            self.generation += 1
+
+    def resize(self, capacity, onSpill = None, columns = None):
+        # define function to start over with a new capacity, spill handler
+        # and optionally columns, e.g. for a new run; readers notice the new
+        # generation
+        with self.lock:
+            if columns is not None:
+                self.columns = tuple(columns)
+                self.index = {name: i for i, name in enumerate(self.columns)}
+            self.capacity = max(1, int(capacity))
+            self.data = np.zeros((len(self.columns), 2*self.capacity))
+            self.onSpill = onSpill
+            self.head = self.size = self.total = 0
+            self.generation += 1
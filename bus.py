@@ -0,0 +1,149 @@
+# In-process data bus between producers and consumers of live data
+# Producers publish force blocks to streams and camera frames to latest-
+# value topics; consumers either subscribe (called on the producer thread
+# with every block or frame) or pull consistent snapshots and deltas.
+# Each topic has its own lock, there is no global one.
+#
+# Ownership: published arrays belong to the bus once published and are
+# never modified again, so subscribers may keep them without copying.
+# Snapshots and deltas are read-only views into a ring buffer. A view of
+# n samples stays valid until capacity-n further samples are published, so
+# a snapshot of the whole buffer is overwritten by the very next publish;
+# read short views right away, or copy them to keep them longer.
+#================================================================
+import threading
+
+from buffers import TimeSeriesBuffer
+
+
+class Subscribers():
+    # copy-on-write tuple of callbacks; publishing iterates it without a lock
+    def __init__(self):
+        self.callbacks = ()
+        self.lock = threading.Lock()
+
+    def add(self, callback):
+        with self.lock:
+            self.callbacks = self.callbacks+(callback,)
+        return callback
+
+    def remove(self, callback):
+        with self.lock:
+            # == so that bound methods match
+            self.callbacks = tuple(c for c in self.callbacks if c != callback)
+
+    def call(self, *args):
+        for callback in self.callbacks:
+            callback(*args)
+
+
+class Stream(TimeSeriesBuffer):
+    # topic of sample blocks: a ring buffer of the latest samples, which
+    # snapshots and cursors read, plus push subscribers
+    def __init__(self, name, columns, capacity, onSpill = None):
+        TimeSeriesBuffer.__init__(self, capacity, columns, onSpill)
+        self.name = name
+        self.subscribers = Subscribers()
+
+    def publish(self, *block):
+        # define function to add a block, one array per column, and hand
+        # it to every subscriber as callback(block)
+        self.extend(*block)
+        self.subscribers.call(block)
+
+    def subscribe(self, callback):
+        return self.subscribers.add(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def cursor(self):
+        # define function to return a reader of the samples published from now on
+        return Cursor(self)
+
+
+class Cursor():
+    # pull subscriber of a stream; read() returns what is new since the
+    # previous read
+    def __init__(self, stream):
+        self.stream = stream
+        self.generation = stream.generation
+        self.seen = stream.total
+
+    def read(self, copy = False):
+        # define function to return (view of the new samples with shape
+        # (columns, n), number of samples missed because they were
+        # overwritten or the stream was restarted); with copy the samples
+        # are copied under the lock and stay valid however long they are kept
+        stream = self.stream
+        with stream.lock:
+            if stream.generation != self.generation:
+                self.generation, self.seen = stream.generation, 0
+            new = stream.total-self.seen
+            n = min(new, stream.size)
+            out = stream._latest(n)
+            if copy:
+                out = out.copy()
+            self.seen = stream.total
+        out.flags.writeable = False
+        return out, new-n
+
+
+class Latest():
+    # topic keeping only the newest value, e.g. a camera frame; publishing
+    # overwrites, readers wait for news and subscribers get every value
+    def __init__(self, name = ''):
+        self.name = name
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.timestamp = None
+        self.value = None
+        self.subscribers = Subscribers()
+
+    def publish(self, value, timestamp):
+        with self.condition:
+            self.seq += 1
+            self.value = value
+            self.timestamp = timestamp
+            self.condition.notify_all()
+        self.subscribers.call(value, timestamp)
+
+    def get(self, afterSeq = 0, timeout = None):
+        # return (seq, timestamp, value) newer than afterSeq, or None on timeout
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > afterSeq, timeout):
+                return None
+            return self.seq, self.timestamp, self.value
+
+    def peek(self):
+        # return (seq, timestamp, value) without waiting
+        with self.condition:
+            return self.seq, self.timestamp, self.value
+
+    def subscribe(self, callback):
+        return self.subscribers.add(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+
+class DataBus():
+    # named topics, created on first use
+    def __init__(self):
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    def stream(self, name, columns, capacity):
+        with self.lock:
+            if name not in self.topics:
+                self.topics[name] = Stream(name, columns, capacity)
+            return self.topics[name]
+
+    def latest(self, name):
+        with self.lock:
+            if name not in self.topics:
+                self.topics[name] = Latest(name)
+            return self.topics[name]
+
+    def __getitem__(self, name):
+        return self.topics[name]
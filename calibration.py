@@ -0,0 +1,126 @@
+# Force transducer calibration
+# A calibration point is captured with buffered DAQ reads. Block means are
+# accumulated with Welford's running mean and variance, and the capture
+# stops as soon as the standard error of the mean is below a target, so a
+# quiet transducer needs well under a second per point. Applied
+# calibrations are appended to a history file.
+#================================================================
+import csv
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import daq
+
+
+HISTORY_FILE = 'calibration_history.csv'
+HISTORY_COLUMNS = ['date', 'a', 'b', 'r squared', 'points']
+
+BLOCK_TIME = 0.1 # s averaged per block, a whole number of mains periods
+MIN_BLOCKS = 5
+
+
+class RunningStats():
+    # Welford's running mean and variance; update() merges a whole array
+    # at once (Chan et al.), so cost is O(1) Python work per block
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        x = np.asarray(x, dtype = float).ravel()
+        if not len(x):
+            return
+        n, mean = len(x), float(np.mean(x))
+        m2 = float(np.sum((x-mean)**2))
+        delta = mean-self.mean
+        total = self.n+n
+        self.mean += delta*n/total
+        self.m2 += m2+delta**2*self.n*n/total
+        self.n = total
+
+    @property
+    def variance(self):
+        return self.m2/(self.n-1) if self.n > 1 else float('nan')
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        # standard error of the mean
+        return self.std/math.sqrt(self.n) if self.n > 1 else float('inf')
+
+
+def capturePoint(task, rate, targetSem, minTime = 0.5, maxTime = 5.0,
+                 onBlock = None, onProgress = None, isRunning = lambda: True):
+    # define function to measure the mean voltage of one calibration point
+    # the SEM is taken over block means, which are nearly independent even
+    # though neighbouring samples are not, and also average out mains hum
+    # onBlock(t, vol)          receives the raw samples, e.g. for the live plot
+    # onProgress(stats, time)  is called after every block
+    # returns {'mean', 'std', 'sem', 'samples', 'duration'} in V and s
+    samples = RunningStats()
+    blocks = RunningStats()
+    blockSize = daq.blockSizeFor(rate, BLOCK_TIME)
+    state = {'done': False}
+
+    def addBlock(t, vol):
+        samples.update(vol)
+        blocks.update(np.mean(vol))
+        if onBlock is not None:
+            onBlock(t, vol)
+        elapsed = (t[-1]+1/rate) if len(t) else 0.0
+        if onProgress is not None:
+            onProgress(blocks, elapsed)
+        state['done'] = (elapsed >= minTime and blocks.n >= MIN_BLOCKS
+                         and blocks.sem <= targetSem)
+
+    start = time.perf_counter()
+    daq.acquireBlocks(task, rate, maxTime, addBlock,
+                      isRunning = lambda: isRunning() and not state['done'],
+                      blockSize = blockSize, timerName = 'calibration block')
+    return {'mean': samples.mean, 'std': samples.std, 'sem': blocks.sem,
+            'samples': samples.n, 'duration': time.perf_counter()-start}
+
+
+def fitLine(voltages, forces):
+    # define function to fit force = a*voltage + b; returns (a, b, r squared)
+    x = np.asarray(voltages, dtype = float)
+    y = np.asarray(forces, dtype = float)
+    a, b = np.polyfit(x, y, 1)
+    residual = y-(a*x+b)
+    total = np.sum((y-np.mean(y))**2)
+    r2 = 1-np.sum(residual**2)/total if total > 0 else 1.0
+    return float(a), float(b), float(r2)
+
+
+def appendHistory(a, b, r2, points, path = HISTORY_FILE):
+    # define function to append an applied calibration to the history
+    # points: list of {'force', 'mean', 'std', 'sem', 'samples'}
+    newFile = not os.path.exists(path)
+    with open(path, 'a', encoding = 'UTF8', newline = '') as f:
+        writer = csv.DictWriter(f, HISTORY_COLUMNS)
+        if newFile:
+            writer.writeheader()
+        writer.writerow({'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                         'a': a, 'b': b, 'r squared': r2,
+                         'points': json.dumps(points)})
+
+
+def loadHistory(path = HISTORY_FILE):
+    # define function to read the calibration history, oldest first
+    if not os.path.exists(path):
+        return []
+    with open(path, newline = '', encoding = 'UTF8') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row['a'], row['b'] = float(row['a']), float(row['b'])
+        row['r squared'] = float(row['r squared'])
+        row['points'] = json.loads(row['points'])
+    return rows
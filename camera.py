@@ -0,0 +1,203 @@
+# Camera capture service
+# The device is opened once and a dedicated thread grabs frames into a
+# single-slot buffer; consumers always get the newest frame.
+#================================================================
+import os
+import queue
+import threading
+import time
+
+import diagnostics
+from bus import Latest
+
+
+def openCamera(index, width, height, backend = 'opencv', fps = 30.0):
+    # define function to open a capture device and set the frame size once
+    # fps only applies to the simulated camera
+    if backend == 'simulated':
+        from simulation import SimulatedCapture
+        capture = SimulatedCapture(fps = fps, width = width, height = height)
+    else:
+        import cv2
+        capture = cv2.VideoCapture(index)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    if not capture.isOpened():
+        raise IOError('Cannot open camera '+str(index)+'.')
+    return capture
+
+
+class CameraService():
+    # run the grab loop of an opened capture on its own thread; frames are
+    # published to a bus.Latest topic (BGR arrays, never modified after)
+    def __init__(self, capture, maxFailures = 10, frames = None):
+        self.capture = capture
+        self.maxFailures = maxFailures
+        self.latest = frames if frames is not None else Latest('frame')
+        self.fps = 0.0
+        self.framesGrabbed = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target = self.loop, daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def loop(self):
+        failures = 0
+        windowStart = time.perf_counter()
+        windowFrames = 0
+        # time spent per grabbed frame and the interval between frames
+        loopTimer = diagnostics.timer('camera grab')
+        loopTimer.start()
+
+        try:
+            while self.running:
+                ok, frame = self.capture.read()
+                if not ok:
+                    failures += 1
+                    if failures >= self.maxFailures:
+                        print('Error thrown in CameraService: no frames from camera.')
+                        break
+                    continue
+                failures = 0
+
+                loopTimer.begin()
+                # published frames are shared by every consumer
+                frame.flags.writeable = False
+                self.latest.publish(frame, time.perf_counter())
+                self.framesGrabbed += 1
+
+                # achieved frame rate over ~1 s windows
+                windowFrames += 1
+                elapsed = time.perf_counter()-windowStart
+                if elapsed >= 1.0:
+                    self.fps = windowFrames/elapsed
+                    windowStart += elapsed
+                    windowFrames = 0
+                loopTimer.end()
+        finally:
+            self.running = False
+            self.capture.release()
+
+
+def frameName(frameNo):
+    return '{:06d}.jpg'.format(frameNo)
+
+
+class ImageSaver():
+    # Encode and write recorded frames on a pool of worker threads fed by a
+    # bounded queue. When the queue is full the frame is dropped and counted
+    # instead of blocking the capture loop. With videoPath set, frames are
+    # appended to one video file by a single worker to keep their order.
+    # Accepted frames are numbered in order (file '000042.jpg' or video
+    # frame 42) and their capture timestamps kept in self.stamps. Frames
+    # that fail to encode or write are counted as dropped and left out of
+    # savedFrames().
+    def __init__(self, directory, workers = 2, queueSize = 32, quality = 90,
+                 videoPath = None, fps = 30.0):
+        import cv2
+        self.cv2 = cv2
+        self.directory = directory
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.videoPath = videoPath
+        self.fps = fps
+        self.video = None
+        self.queue = queue.Queue(maxsize = queueSize)
+        self.lock = threading.Lock()
+        self.counts = {'captured': 0, 'encoded': 0, 'written': 0, 'dropped': 0}
+        self.stamps = []
+        self.failed = set() # numbers of accepted frames that could not be saved
+
+        workers = 1 if videoPath else max(1, workers)
+        self.threads = [threading.Thread(target = self.loop, daemon = True)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def fail(self, frameNo):
+        # a frame that failed to encode or write is counted as dropped
+        with self.lock:
+            self.counts['dropped'] += 1
+            self.failed.add(frameNo)
+
+    def submit(self, frame, timestamp):
+        # define function to queue a frame without ever blocking the caller,
+        # returns the frame number or None if the frame was dropped
+        self.count('captured')
+        frameNo = len(self.stamps)
+        try:
+            self.queue.put_nowait((frame, frameNo))
+        except queue.Full:
+            self.count('dropped')
+            return None
+        self.stamps.append(timestamp)
+        return frameNo
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, frameNo = item
+            try:
+                if self.videoPath:
+                    self.writeVideo(frame)
+                else:
+                    ok, encoded = self.cv2.imencode('.jpg', frame, self.params)
+                    if not ok:
+                        self.fail(frameNo)
+                        continue
+                    self.count('encoded')
+                    encoded.tofile(os.path.join(self.directory, frameName(frameNo)))
+                    self.count('written')
+            except Exception as e:
+                print('Error thrown in ImageSaver: '+str(e))
+                self.fail(frameNo)
+
+    def writeVideo(self, frame):
+        if self.video is None:
+            height, width = frame.shape[:2]
+            self.video = self.cv2.VideoWriter(self.videoPath,
+                                              self.cv2.VideoWriter_fourcc(*'MJPG'),
+                                              self.fps, (width, height))
+        self.video.write(frame)
+        self.count('encoded')
+        self.count('written')
+
+    def close(self):
+        # define function to drain the queue, stop the workers and return stats
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.video is not None:
+            self.video.release()
+        return self.stats()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def savedFrames(self):
+        # define function to return the frame numbers and timestamps of the
+        # frames that were saved, after close(); in a video the number is
+        # the position in the file, so frames that failed shift the rest
+        with self.lock:
+            saved = [i for i in range(len(self.stamps)) if i not in self.failed]
+        stamps = [self.stamps[i] for i in saved]
+        if self.videoPath:
+            saved = list(range(len(saved)))
+        return saved, stamps
@@ -0,0 +1,86 @@
+# Analogue input channels and their calibration
+# The force transducer is always channel 0, with the port and calibration
+# of config.csv. Further channels, e.g. a second transducer, the
+# excitation voltage or a temperature probe, are listed in channels.csv:
+#     name,port,a,b,unit,min (V),max (V)
+#     excitation,Dev2/ai1,1,0,V,-10,10
+#     temperature,Dev2/ai2,100,0,degC,-1,1
+# All channels are sampled by one task on one clock, so sample i of every
+# channel belongs to the same clock tick; value = a*voltage+b is applied
+# to a whole block at once.
+#================================================================
+import csv
+import dataclasses
+import os
+
+import numpy as np
+
+
+CHANNEL_FILE = 'channels.csv'
+# reserved for the columns of the force buffer
+RESERVED_NAMES = ('time', 'voltage', 'force', 'filtered')
+
+
+@dataclasses.dataclass
+class Channel():
+    name: str # column name in the live buffer and the run
+    port: str # e.g. 'Dev2/ai1'
+    a: float = 1.0 # value = a*voltage+b
+    b: float = 0.0
+    unit: str = 'V'
+    minVoltage: float = -5.0 # input range (V)
+    maxVoltage: float = 5.0
+
+    # channels.csv header of each field
+    KEYS = {'name': 'name', 'port': 'port', 'a': 'a', 'b': 'b', 'unit': 'unit',
+            'minVoltage': 'min (V)', 'maxVoltage': 'max (V)'}
+
+    @property
+    def label(self):
+        return '{} ({})'.format(self.name.capitalize(), self.unit)
+
+
+def loadChannels(path = CHANNEL_FILE):
+    # define function to read the extra channels, none if there is no file
+    if not os.path.exists(path):
+        return []
+    with open(path, newline = '', encoding = 'UTF8') as f:
+        rows = list(csv.DictReader(f))
+
+    channels = []
+    for row in rows:
+        values = {name: row[key] for name, key in Channel.KEYS.items() if (row.get(key) or '').strip()}
+        for name in ('a', 'b', 'minVoltage', 'maxVoltage'):
+            if name in values:
+                values[name] = float(values[name])
+        channel = Channel(**values)
+        if channel.name in RESERVED_NAMES or channel.name in [c.name for c in channels]:
+            raise ValueError('Channel name used twice or reserved: '+channel.name)
+        channels.append(channel)
+    return channels
+
+
+def saveChannels(channels, path = CHANNEL_FILE):
+    # define function to rewrite channels.csv
+    with open(path, 'w', encoding = 'UTF8', newline = '') as f:
+        writer = csv.DictWriter(f, list(Channel.KEYS.values()))
+        writer.writeheader()
+        for channel in channels:
+            writer.writerow({key: getattr(channel, name) for name, key in Channel.KEYS.items()})
+
+
+class ChannelTable():
+    # calibration of all channels of a task as column vectors, applied to a
+    # (channels, samples) block in one operation
+    def __init__(self, channels):
+        self.channels = list(channels)
+        self.names = [channel.name for channel in self.channels]
+        self.gain = np.array([[channel.a] for channel in self.channels], dtype = float)
+        self.offset = np.array([[channel.b] for channel in self.channels], dtype = float)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def apply(self, vol):
+        # define function to scale a block of voltages, shape (channels, n)
+        return self.gain*vol+self.offset
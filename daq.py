@@ -0,0 +1,78 @@
+# Buffered, hardware-timed acquisition for the force transducer
+# Samples are clocked by the DAQ and pulled in blocks; time comes from
+# the sample index instead of the host clock.
+#================================================================
+import time
+
+import numpy as np
+
+import diagnostics
+
+
+def createTask(port, rate, bufferSize, backend = 'nidaqmx', profile = 'scrape',
+               ranges = None):
+    # define function to set up a sample-clocked voltage task
+    # port:    one port or a list of ports, all sampled on the task clock;
+    #          reads then return one row per port
+    # ranges:  (min, max) input range (V) per port, +-5 V by default
+    # profile: signal of the simulated DAQ, 'idle' or 'scrape'
+    ports = [port] if isinstance(port, str) else list(port)
+    ranges = ranges or [(-5.0, 5.0)]*len(ports)
+    if backend == 'simulated':
+        from simulation import SimulatedTask
+        Task = lambda: SimulatedTask(profile = profile)
+        chanOptions = {}
+        timingOptions = {}
+    else:
+        from nidaqmx import Task
+        from nidaqmx.constants import AcquisitionType, TerminalConfiguration, VoltageUnits
+        chanOptions = {'terminal_config': TerminalConfiguration.RSE,
+                       'units': VoltageUnits.VOLTS}
+        timingOptions = {'sample_mode': AcquisitionType.CONTINUOUS}
+
+    task = Task()
+    for channelPort, (minVoltage, maxVoltage) in zip(ports, ranges):
+        task.ai_channels.add_ai_voltage_chan(channelPort, min_val = minVoltage,
+                                             max_val = maxVoltage, **chanOptions)
+    task.timing.cfg_samp_clk_timing(rate, samps_per_chan = bufferSize,
+                                    **timingOptions)
+    return task
+
+
+def blockSizeFor(rate, blockTime = 0.1):
+    # number of samples pulled per read, ~10 reads per second
+    return max(1, int(rate*blockTime))
+
+
+def acquireBlocks(task, rate, targetTime, onBlock, isRunning = lambda: True,
+                  blockSize = None, onStart = None, timerName = 'daq block'):
+    # define function to read clocked samples in blocks until target time
+    # onBlock(t, vol) receives numpy arrays for every block, vol with one
+    # row per channel if the task has several, and onStart(hostTime) the
+    # perf_counter time of sample 0
+    # the timer records the time spent in onBlock and the gaps between
+    # block arrivals, i.e. the polling jitter
+    blockSize = blockSize or blockSizeFor(rate)
+    totalSamples = int(round(targetTime*rate))
+    timeout = max(10.0, 2*blockSize/rate)
+    nRead = 0
+    loopTimer = diagnostics.timer(timerName)
+    loopTimer.start()
+
+    task.start()
+    if onStart is not None:
+        onStart(time.perf_counter())
+    try:
+        while nRead < totalSamples and isRunning():
+            n = min(blockSize, totalSamples-nRead)
+            vol = np.asarray(task.read(number_of_samples_per_channel = n,
+                                       timeout = timeout), dtype = float)
+            loopTimer.begin()
+            t = (nRead+np.arange(n))/rate
+            onBlock(t, vol)
+            loopTimer.end()
+            nRead += n
+    finally:
+        task.stop()
+
+    return nRead
@@ -0,0 +1,155 @@
+# Timing diagnostics of the periodic loops
+# Every loop (DAQ blocks, camera frames, plot redraws, stage waits) owns a
+# LoopTimer. Each iteration adds its duration, and the gap since the
+# previous iteration started, to log-spaced histograms: an iteration costs
+# about 1-1.5 us with begin()/end() and 0.5 us more with 'with timer:' (a
+# bisect on precomputed bin edges, no logarithm) and memory stays
+# constant, so timing is always on. Percentiles are read from
+# the histograms, the maximum is exact.
+#================================================================
+import bisect
+import functools
+import threading
+import time
+
+
+BINS_PER_DECADE = 20 # percentiles are within ~12 %
+MIN_TIME = 1e-6 # s, upper edge of the first bin
+NBINS = 8*BINS_PER_DECADE+2 # 1 us to 100 s, plus under- and overflow
+# upper edge of every bin but the overflow bin
+EDGES = [MIN_TIME*10**(i/BINS_PER_DECADE) for i in range(NBINS-1)]
+
+_bin = functools.partial(bisect.bisect_right, EDGES)
+_now = time.perf_counter
+
+
+class Histogram():
+    # counts of durations (s) in log-spaced bins, with exact count, sum and max
+    def __init__(self):
+        self.counts = [0]*NBINS
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def n(self):
+        # number of values, summed on read to keep add() short
+        return sum(self.counts)
+
+    def add(self, seconds):
+        self.counts[_bin(seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # define function to return the upper bin edge below which q % of
+        # the values lie, capped at the maximum
+        n = self.n
+        if not n:
+            return 0.0
+        rank = q/100*n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(EDGES[i], self.max) if i < len(EDGES) else self.max
+        return self.max
+
+    def mean(self):
+        n = self.n
+        return self.total/n if n else 0.0
+
+
+class LoopTimer():
+    # durations of the iterations of one loop and the gaps between their
+    # starts; use begin()/end() or 'with timer:' around the loop body and
+    # start() when the loop (re)starts, so idle time is not counted as a gap
+    def __init__(self, name):
+        self.name = name
+        self.last = None
+        self.began = 0.0
+        self.reset()
+
+    def reset(self):
+        # clear the statistics only; an iteration in progress on another
+        # thread keeps its start and is counted once it ends
+        self.durations = Histogram()
+        self.gaps = Histogram()
+
+    def start(self):
+        self.last = None
+
+    def begin(self):
+        now = _now()
+        if self.last is not None:
+            self.gaps.add(now-self.last)
+        self.last = self.began = now
+
+    def end(self):
+        self.durations.add(_now()-self.began)
+
+    # 'with timer:' costs two more calls than begin()/end()
+    __enter__ = begin
+
+    def __exit__(self, *args):
+        self.durations.add(_now()-self.began)
+
+    def summary(self):
+        # define function to return the statistics in ms
+        ms = lambda seconds: round(1000*seconds, 3)
+        d, g = self.durations, self.gaps
+        return {'count': d.n, 'mean (ms)': ms(d.mean()),
+                'p50 (ms)': ms(d.percentile(50)), 'p90 (ms)': ms(d.percentile(90)),
+                'p99 (ms)': ms(d.percentile(99)), 'max (ms)': ms(d.max),
+                'gap p50 (ms)': ms(g.percentile(50)), 'gap p99 (ms)': ms(g.percentile(99)),
+                'max gap (ms)': ms(g.max)}
+
+
+timers = {}
+_lock = threading.Lock()
+
+
+def timer(name):
+    # define function to return the timer of a loop, created on first use
+    loopTimer = timers.get(name)
+    if loopTimer is None:
+        with _lock:
+            loopTimer = timers.setdefault(name, LoopTimer(name))
+    return loopTimer
+
+
+def timed(name):
+    # define decorator timing every call of a function as one iteration
+    # of the loop name, e.g. a FuncAnimation callback
+    def decorate(func):
+        loopTimer = timer(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            loopTimer.begin()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                loopTimer.end()
+        return wrapper
+    return decorate
+
+
+def summary():
+    # define function to return {loop: statistics} of every timer
+    return {name: timers[name].summary() for name in sorted(timers)}
+
+
+def reset():
+    # define function to clear every timer, e.g. at the start of a run
+    for loopTimer in list(timers.values()):
+        loopTimer.reset()
+
+
+def report():
+    # define function to format the statistics as a table
+    columns = ['count', 'p50 (ms)', 'p99 (ms)', 'max (ms)', 'gap p50 (ms)', 'max gap (ms)']
+    lines = ['{:<24s}'.format('loop')+''.join('{:>14s}'.format(c) for c in columns)]
+    for name, stats in summary().items():
+        lines.append('{:<24s}'.format(name)+''.join('{:>14g}'.format(stats[c]) for c in columns))
+    return '\n'.join(lines)
@@ -0,0 +1,684 @@
+# Experiment engine of the Millimanipulation Mark 3
+# Runs tests, jogs and calibrations without any GUI. Settings come from a
+# Config (config.csv), each test from a parameter object, and clients
+# follow progress through callbacks:
+#     onEvent(name, info)       'runStarted', 'runFinished', 'runSaved',
+#                               'queueProgress', 'queueFinished', 'moved',
+#                               'calibrationProgress', 'error'
+#                               ('error' info: message and exception)
+# lastError holds the exception that ended the latest run or jog, None if
+# it succeeded; a queue stops at the first failure.
+#     onData(t, vol, force)     every block of force samples (numpy arrays)
+# Live data goes through self.bus (bus.DataBus): the 'force' and
+# 'calibration' streams and the 'frame' topic of camera frames, which the
+# plots, run writer and image saver read or subscribe to.
+# The Tk pages in Mark3_main.py are clients of this engine; scripts can use
+# it directly, e.g.
+#     engine = Engine(Config.load())
+#     engine.runMillimanipulation(MillimanipulationParams(5, 1, 'run1'))
+#     engine.close()
+#================================================================
+import csv
+import dataclasses
+import os
+import threading
+import time
+
+import numpy as np
+
+import calibration
+import channels
+import daq
+import diagnostics
+import relaxation
+import runfile
+from bus import DataBus
+from camera import CameraService, ImageSaver, openCamera
+from filtering import StreamingFilter, filtfiltPadlen, lowpassSos
+from orchestration import runConcurrently
+from stage import TelemetryPoller, moveSettings, openStage
+from writer import StreamWriter
+
+
+X_STEPS_PER_MM = 200
+Z_STEPS_PER_MM = 12000
+
+# columns of the live force buffer, followed by one column per extra
+# channel; filtered is causal and live only
+FORCE_COLUMNS = ('time', 'voltage', 'force', 'filtered')
+CAL_COLUMNS = ('time', 'voltage')
+
+
+def fromText(field, text):
+    # define function to convert a csv cell to the type of a dataclass field
+    if field.type is bool:
+        return text.strip() in ('True', '1', 'yes')
+    if field.type is str:
+        return text
+    return field.type(float(text))
+
+
+@dataclasses.dataclass
+class Config():
+    # device and processing settings, stored in config.csv
+    a: float = 54 # force = a*voltage+b
+    b: float = -5.4
+    frameWidth: int = 640
+    frameHeight: int = 480
+    sampleRate: float = 1000 # DAQ sample clock (Hz)
+    filCutoff: float = 10 # low-pass cutoff (Hz)
+    telemetryRate: float = 20 # stage position polling during tests (Hz)
+    niport: str = 'Dev2/ai0'
+    daqBackend: str = 'nidaqmx' # 'nidaqmx' or 'simulated'
+    cameraBackend: str = 'opencv' # 'opencv' or 'simulated'
+    stageBackend: str = 'ximc' # 'ximc' or 'simulated'
+    recordVideo: bool = False # record one video file instead of jpg images
+    csvExport: bool = True # export a csv copy of every run container
+    compressRuns: bool = False # pack run containers into a compressed npz when finished
+    calSem: float = 0.0002 # V, calibration points stop at this standard error
+    calMaxTime: float = 5 # s, longest capture of a calibration point
+    bufferTime: float = 600 # seconds of live data kept in memory, the run container holds all
+    simProfile: str = 'scrape' # signal of the simulated DAQ, 'idle' or 'scrape'
+    simFps: float = 30 # frame rate of the simulated camera
+    channelFile: str = 'channels.csv' # extra DAQ channels sampled with the force
+
+    # config.csv header of each stored field
+    KEYS = {'a': 'a', 'b': 'b', 'frameWidth': 'frame width',
+            'frameHeight': 'frame height', 'sampleRate': 'sample rate',
+            'filCutoff': 'filter cutoff', 'telemetryRate': 'telemetry rate',
+            'daqBackend': 'daq backend', 'cameraBackend': 'camera backend',
+            'stageBackend': 'stage backend', 'recordVideo': 'record video',
+            'csvExport': 'csv export', 'compressRuns': 'compress runs',
+            'calSem': 'calibration sem', 'calMaxTime': 'calibration max time',
+            'simProfile': 'simulated profile', 'simFps': 'simulated fps',
+            'channelFile': 'channel file'}
+
+    @classmethod
+    def simulated(cls, **settings):
+        # define function to make a config using the simulated DAQ, stage
+        # and camera, e.g. for development and benchmarks
+        return cls(daqBackend = 'simulated', stageBackend = 'simulated',
+                   cameraBackend = 'simulated', **settings)
+
+    @classmethod
+    def load(cls, path = 'config.csv'):
+        # define function to read config.csv; missing keys keep defaults
+        config = cls()
+        with open(path, newline = '') as f:
+            row = next(csv.DictReader(f))
+        for field in dataclasses.fields(cls):
+            key = cls.KEYS.get(field.name)
+            if key in row:
+                setattr(config, field.name, fromText(field, row[key]))
+        return config
+
+    def save(self, path = 'config.csv'):
+        # define function to rewrite config.csv
+        with open(path, 'w', encoding = 'UTF8', newline = '') as f:
+            writer = csv.DictWriter(f, list(self.KEYS.values()))
+            writer.writeheader()
+            writer.writerow({key: getattr(self, name) for name, key in self.KEYS.items()})
+
+
+@dataclasses.dataclass
+class MillimanipulationParams():
+    distance: float # mm
+    speed: float # mm/s
+    path: str # run path without suffix, also the image folder
+    recordImages: bool = False
+
+
+@dataclasses.dataclass
+class RelaxationParams():
+    interval: float # mm per scrape
+    speed: float # mm/s
+    noScrape: int
+    relaxTime: float # s of relaxation after each scrape
+    path: str
+    recordImages: bool = False
+
+
+@dataclasses.dataclass
+class QueueEntry():
+    # one line of a run queue, run `repeats` times back to back
+    test: str # 'millimanipulation' or 'relaxation'
+    name: str # run name, repeats get the suffix _01, _02, ...
+    speed: float # mm/s
+    distance: float # mm, per scrape for relaxation tests
+    depth: float = 0 # mm lowered in Z before each run
+    relaxTime: float = 0 # s of relaxation after each scrape
+    noScrape: int = 1
+    repeats: int = 1
+    recordImages: bool = False
+
+    # queue file header of each field
+    KEYS = {'test': 'test', 'name': 'name', 'speed': 'speed (mm/s)',
+            'distance': 'distance (mm)', 'depth': 'depth (mm)',
+            'relaxTime': 'relax time (s)', 'noScrape': 'scrapes',
+            'repeats': 'repeats', 'recordImages': 'record images'}
+
+    def params(self, path):
+        # define function to make the parameter object of one run
+        if self.test == 'relaxation':
+            return RelaxationParams(self.distance, self.speed, self.noScrape,
+                                    self.relaxTime, path, self.recordImages)
+        return MillimanipulationParams(self.distance, self.speed, path, self.recordImages)
+
+    def travel(self):
+        # X distance (mm) covered by one run
+        return self.distance*(self.noScrape if self.test == 'relaxation' else 1)
+
+
+def loadQueue(path):
+    # define function to read a queue file, one QueueEntry per row; empty
+    # cells keep the defaults
+    with open(path, newline = '', encoding = 'UTF8') as f:
+        rows = list(csv.DictReader(f))
+    fields = {field.name: field for field in dataclasses.fields(QueueEntry)}
+    entries = []
+    for row in rows:
+        values = {name: fromText(fields[name], row[key])
+                  for name, key in QueueEntry.KEYS.items() if (row.get(key) or '').strip()}
+        if values.get('test') not in ('millimanipulation', 'relaxation'):
+            raise ValueError('Unknown test in queue row: '+str(row))
+        entries.append(QueueEntry(**values))
+    return entries
+
+
+class Engine():
+    # Owns the stage session, DAQ acquisitions, camera and run writers.
+    # Run methods block until the test is over and should be called from a
+    # worker thread by interactive clients; stop() ends a test early.
+    def __init__(self, config = None, stage = None, onEvent = None, onData = None):
+        self.config = config or Config()
+        self.stage = stage if stage is not None else openStage(self.config.stageBackend)
+        self.eventCallbacks = [onEvent] if onEvent else []
+
+        # live data, the topics live as long as the engine and are
+        # restarted (not replaced) by every acquisition
+        self.bus = DataBus()
+        self.channels = channels.loadChannels(self.config.channelFile) # extra channels
+        self.forceData = self.bus.stream('force', FORCE_COLUMNS+tuple(c.name for c in self.channels),
+                                         int(self.config.sampleRate))
+        self.calData = self.bus.stream('calibration', CAL_COLUMNS, int(self.config.sampleRate))
+        self.frames = self.bus.latest('frame') # BGR camera frames
+        if onData is not None:
+            self.forceData.subscribe(lambda block: onData(*block[:3]))
+
+        self.operation = False
+        self.queueRunning = False
+        self.lastError = None # exception of the latest run or jog, None if it succeeded
+        self.acquisitionStart = 0.0 # perf_counter time of the first force sample
+
+        self.camera = None # CameraService while the camera is connected
+        self.cameraThread = None # thread opening the camera and waiting on it
+        self.cameraLock = threading.Lock()
+        self.imageSaver = None # ImageSaver while a test records images
+        self.recordImages = False
+
+        self.writer = None
+        self.writers = [] # closed writers still finishing in the background
+        self.timing = {}
+        self.telemetry = None
+        self.cycles = [] # (motion start, motion stop) host times
+
+    # ------ callbacks ------
+    def emit(self, name, **info):
+        for callback in list(self.eventCallbacks):
+            callback(name, info)
+
+    def error(self, message, exception = None):
+        # define function to report an error; the exception that caused it
+        # is added to the message and passed on as info['exception']
+        if exception is not None:
+            message += ': '+repr(exception)
+        print(message)
+        self.emit('error', message = message, exception = exception)
+
+    # ------ stage ------
+    def jog(self, axis, distance, speed):
+        # define function to move X or Z by distance (mm) at speed (mm/s)
+        stepsPerMm = X_STEPS_PER_MM if axis == 'x' else Z_STEPS_PER_MM
+        devId = self.stage.lrDevId if axis == 'x' else self.stage.udDevId
+        self.lastError = None
+        try:
+            # parameters are only sent if changed
+            self.stage.moveRelative(devId, int(distance*stepsPerMm),
+                                    moveSettings(speed*stepsPerMm)) # steps/s
+            time.sleep(0.3) # pause time: 0.3 s
+        except KeyboardInterrupt as e:
+            print('Exiting scan early!')
+            self.lastError = e
+        except Exception as e:
+            self.error('Error thrown in jog('+axis+')', e)
+            self.lastError = e
+
+        x, z = self.stage.posXYVals_cal()
+        self.emit('moved', x = x, z = z)
+
+    # ------ tests ------
+    def runMillimanipulation(self, params):
+        # define function to run millimanipulation, returns the run path
+        steps = int(params.distance*X_STEPS_PER_MM)
+        settings = moveSettings(params.speed*X_STEPS_PER_MM) # steps/s
+
+        def motion():
+            # run x-axis positioner
+            self.stage.moveRelative(self.stage.lrDevId, steps, settings)
+            time.sleep(0.3) # pause time: 0.3 s
+
+        # add extra 1 sec to capture relaxation
+        targetTime = int(params.distance/params.speed)+1
+        return self.runTest(params, {'test': 'millimanipulation',
+                                     'distance (mm)': params.distance,
+                                     'speed (mm/s)': params.speed},
+                            targetTime, settings, motion)
+
+    def runRelaxation(self, params):
+        # define function to run relaxation tests, returns the run path
+        steps = int(params.interval*X_STEPS_PER_MM)
+        settings = moveSettings(params.speed*X_STEPS_PER_MM) # steps/s
+
+        def motion():
+            # run x-axis positioner, logging motion start/stop of every cycle
+            for _ in range(params.noScrape):
+                start = time.perf_counter()
+                self.stage.moveRelative(self.stage.lrDevId, steps, settings)
+                self.cycles.append((start, time.perf_counter()))
+                time.sleep(params.relaxTime)
+
+        targetTime = int((params.interval/params.speed+params.relaxTime+1)*params.noScrape)
+        return self.runTest(params, {'test': 'relaxation', 'interval (mm)': params.interval,
+                                     'speed (mm/s)': params.speed, 'noScrape': params.noScrape,
+                                     'relaxTime (s)': params.relaxTime},
+                            targetTime, settings, motion)
+
+    def runTest(self, params, parameters, targetTime, settings, motion):
+        # define function to record force while motion() runs and save the run;
+        # a failed run is still saved and its exception kept in lastError
+        self.lastError = None
+        self.recordImages = params.recordImages
+        # nothing of the previous run is reused, even if this one fails
+        # before acquisition is armed
+        self.timing = {}
+        self.telemetry = None
+        self.cycles = []
+        self.acquisitionStart = time.perf_counter()
+        self.startImages(params.path)
+        # stream raw data to disk while the test runs
+        self.startRun(params.path, parameters)
+        self.emit('runStarted', path = params.path, parameters = parameters)
+
+        try:
+            # hold the stage for the whole test
+            with self.stage.lock:
+                # set up x-axis movement parameters
+                self.stage.setMoveParameters(self.stage.lrDevId, settings)
+
+                # record force, move once acquisition is armed and
+                # poll stage positions alongside
+                self.telemetry = TelemetryPoller(self.stage, self.config.telemetryRate)
+                runConcurrently(lambda onArmed: self.recordForce(targetTime, onArmed),
+                                motion, self.stop, companions = [self.telemetry.run],
+                                timing = self.timing)
+
+        except KeyboardInterrupt as e:
+            print('Exiting scan early!')
+            self.lastError = e
+        except Exception as e:
+            self.error('Error thrown in '+parameters['test']+' test', e)
+            self.lastError = e
+
+        # filter and save results on the writer thread
+        self.finishRun(params.path)
+        self.emit('runFinished', path = params.path, error = self.lastError)
+        return params.path
+
+    def runQueue(self, entries, directory = '', resetZ = False, returnX = False,
+                 zSpeed = 0.2, returnSpeed = 10):
+        # define function to run queued tests back to back, returns the run paths
+        # Filtering, fitting, csv export and image flushing of a run continue
+        # on its writer thread while the next run moves and records; a run
+        # only starts once the one before the previous run is saved.
+        # depth   lowered in Z (mm, at zSpeed) before each run; with resetZ
+        #         raised again afterwards, else repeats go deeper each time
+        # returnX moves X back to the start (at returnSpeed) after each run
+        # The queue stops at the first failed run or stage move, the path of
+        # that run (or of the run it was moving for) is reported as failed.
+        runs = [(entry, repeat) for entry in entries for repeat in range(entry.repeats)]
+        paths = []
+        failed = None
+        self.queueRunning = True
+
+        try:
+            for number, (entry, repeat) in enumerate(runs):
+                if not self.queueRunning:
+                    break
+                name = entry.name if entry.repeats == 1 else '{}_{:02d}'.format(entry.name, repeat+1)
+                path = os.path.join(directory, name)
+
+                # keep at most one earlier run post-processing
+                self.wait(pending = 1)
+                if entry.depth:
+                    self.jog('z', -entry.depth, zSpeed)
+                    if self.lastError is not None:
+                        failed = path
+                        self.error('Queue stopped, lowering Z for '+name+' failed')
+                        break
+                if entry.test == 'relaxation':
+                    paths.append(self.runRelaxation(entry.params(path)))
+                else:
+                    paths.append(self.runMillimanipulation(entry.params(path)))
+                if self.lastError is not None:
+                    failed = path
+                    self.error('Queue stopped after failed run '+name)
+                    break
+
+                # reposition while the run is saved
+                if returnX and self.queueRunning:
+                    self.jog('x', -entry.travel(), returnSpeed)
+                if resetZ and entry.depth and self.queueRunning and self.lastError is None:
+                    self.jog('z', entry.depth, zSpeed)
+                if self.lastError is not None:
+                    failed = path
+                    self.error('Queue stopped, repositioning after '+name+' failed')
+                    break
+                self.emit('queueProgress', path = path, done = number+1, runs = len(runs))
+
+        finally:
+            self.queueRunning = False
+            self.emit('queueFinished', paths = paths, failed = failed)
+        return paths
+
+    def stop(self):
+        # define function to end force recording early
+        self.operation = False
+
+    def stopQueue(self):
+        # define function to end the running test and skip the rest of the queue
+        self.queueRunning = False
+        self.stop()
+
+    def calibrate(self, onProgress = None):
+        # define function to get calibration point
+        # measures until the standard error of the mean voltage is below
+        # calSem, at most calMaxTime; returns the point statistics
+        config = self.config
+        bufferSize = int(config.calMaxTime*config.sampleRate)
+        self.calData.resize(bufferSize)
+
+        def progress(blocks, elapsed):
+            if onProgress is not None:
+                onProgress(blocks, elapsed)
+            self.emit('calibrationProgress', mean = blocks.mean, sem = blocks.sem,
+                      elapsed = elapsed)
+
+        try:
+            self.operation = True
+            with daq.createTask(config.niport, config.sampleRate, bufferSize,
+                                config.daqBackend, config.simProfile) as task:
+                return calibration.capturePoint(task, config.sampleRate, config.calSem,
+                                                maxTime = config.calMaxTime,
+                                                onBlock = self.calData.publish,
+                                                onProgress = progress,
+                                                isRunning = lambda: self.operation)
+        except KeyboardInterrupt:
+            print('Exiting early!')
+        finally:
+            self.operation = False
+
+    def recordForce(self, targetTime, onStart = None):
+        # define function to record force
+        config = self.config
+
+        def setStart(hostTime):
+            self.acquisitionStart = hostTime
+            if onStart is not None:
+                onStart(hostTime)
+
+        # causal low-pass for the live display, filtfilt runs after the test
+        liveFilter = StreamingFilter(lowpassSos(config.sampleRate, config.filCutoff))
+        table = self.channelTable()
+
+        def addBlock(t, vol):
+            # scale all channels at once and publish time, force voltage,
+            # force, live filtered force and the extra channels; the run
+            # writer and onData subscribe to the stream
+            vol = np.atleast_2d(vol)
+            values = table.apply(vol)
+            force = values[0]
+            self.forceData.publish(t, vol[0], force, liveFilter.process(force), *values[1:])
+
+        try:
+            # the live buffer keeps the last bufferTime seconds, every
+            # sample is streamed to the run container by the writer
+            self.forceData.resize(int(config.bufferTime*config.sampleRate),
+                                  columns = FORCE_COLUMNS+tuple(table.names[1:]))
+            self.operation = True
+
+            # all channels in one task on one sample clock; the buffer holds
+            # 10 s of samples in case a block read is delayed
+            with daq.createTask([c.port for c in table.channels], config.sampleRate,
+                                int(10*config.sampleRate), config.daqBackend, config.simProfile,
+                                [(c.minVoltage, c.maxVoltage) for c in table.channels]) as task:
+                daq.acquireBlocks(task, config.sampleRate, targetTime, addBlock,
+                                  isRunning = lambda: self.operation, onStart = setStart)
+
+        except KeyboardInterrupt:
+            print('Exiting early!')
+
+        finally:
+            self.operation = False
+
+    def channelTable(self):
+        # define function to return the calibration of all channels, the
+        # force transducer first with the calibration of the config
+        config = self.config
+        force = channels.Channel('force', config.niport, config.a, config.b, 'N')
+        return channels.ChannelTable([force]+self.channels)
+
+    # ------ camera ------
+    def startCamera(self):
+        # define function to grab camera frames on a background thread; the
+        # thread is kept before it starts, so calls made while the camera is
+        # still opening do not open it a second time
+        with self.cameraLock:
+            if self.cameraThread is None or not self.cameraThread.is_alive():
+                self.cameraThread = threading.Thread(target = self.grabImage, daemon = True)
+                self.cameraThread.start()
+
+    def stopCamera(self):
+        if self.camera is not None:
+            self.camera.running = False
+
+    @property
+    def image(self):
+        # latest camera frame as an RGB view, None before the first frame
+        frame = self.frames.peek()[2]
+        return None if frame is None else frame[:, :, ::-1]
+
+    def grabImage(self):
+        # define function to take images
+        config = self.config
+        camera = None
+        try:
+            # open the camera once, it publishes frames to self.frames
+            # from its own thread until stopCamera()
+            camera = self.camera = CameraService(openCamera(0, config.frameWidth, config.frameHeight,
+                                                            config.cameraBackend, config.simFps),
+                                                 frames = self.frames).start()
+            camera.thread.join()
+
+        except KeyboardInterrupt:
+            print('Exiting early!')
+
+        except Exception as e:
+            self.error('Error thrown in VideoCapture(). Check camera connection.', e)
+
+        finally:
+            if camera is not None:
+                camera.stop()
+                print('Camera closed, achieved {:.1f} fps.'.format(camera.fps))
+            self.camera = None
+
+    # ------ runs ------
+    def startImages(self, path):
+        # define function to create the image folder and saving workers
+        if self.recordImages and self.camera is not None:
+            if not os.path.isdir(path): os.mkdir(path)
+            self.imageSaver = ImageSaver(path,
+                                         videoPath = path+'/video.avi' if self.config.recordVideo else None,
+                                         fps = self.camera.fps or 30.0)
+            self.frames.subscribe(self.recordFrame)
+
+    def recordFrame(self, frame, stamp):
+        # queue frames for saving while force is recorded, never waits for
+        # the disk; frames are matched to force samples by their timestamp
+        saver = self.imageSaver
+        if self.operation and saver is not None:
+            saver.submit(frame, stamp)
+
+    def startRun(self, path, parameters):
+        # define function to open the run container and its writer thread
+        config = self.config
+        parameters.update({'a': config.a, 'b': config.b, 'filCutoff (Hz)': config.filCutoff,
+                           'niport': config.niport, 'sampleRate (Hz)': config.sampleRate,
+                           'daqBackend': config.daqBackend,
+                           'channels': [dataclasses.asdict(c) for c in self.channels]})
+        columns = runfile.FORCE_COLUMNS+[(c.name, c.label) for c in self.channels]
+        run = runfile.RunWriter(path, parameters, {'force': columns})
+        self.writer = StreamWriter(run, compress = config.compressRuns)
+        self.forceData.subscribe(self.writeBlock)
+        # loop timings are stored per run
+        diagnostics.reset()
+
+    def writeBlock(self, block):
+        # stream the samples of a force block to the run writer, all but
+        # the live filtered force
+        writer = self.writer
+        if writer is not None:
+            writer.put(**{name: values for name, values in zip(self.forceData.columns, block)
+                          if name != 'filtered'})
+
+    def finishRun(self, path):
+        # define function to hand the completed run to the writer thread,
+        # which adds the filtered force and exports csv in the background
+        self.forceData.unsubscribe(self.writeBlock)
+        self.frames.unsubscribe(self.recordFrame)
+        saver, self.imageSaver = self.imageSaver, None
+        sampleRate = self.config.sampleRate
+
+        # host time of the first force sample of this run, the origin of
+        # motion, telemetry, cycle and frame times
+        origin = self.acquisitionStart
+
+        # motion start/end on the force timeline and arm-to-motion latency (s)
+        timing = {name: value-origin for name, value in self.timing.items()
+                  if name not in ('acquisitionStart', 'armLatency')}
+        if 'armLatency' in self.timing:
+            timing['armLatency'] = self.timing['armLatency']
+
+        telemetry = self.telemetry
+        loopTimings = diagnostics.summary()
+        cycles, self.cycles = np.asarray(self.cycles, dtype = float).reshape(-1, 2)-origin, []
+
+        def finalize(run):
+            # release the image workers and video file before anything
+            # that can fail; the stats are stored whatever happens next
+            images = None
+            if saver is not None:
+                try:
+                    images = saver.close()
+                finally:
+                    run.meta['images'] = dict(images or {'error': 'ImageSaver did not close.'},
+                                              directory = saver.directory, video = saver.videoPath)
+
+            run.meta['timing'] = timing
+            run.meta['diagnostics'] = loopTimings
+            # read the recorded samples back from disk, memory use does
+            # not grow with the run length
+            t, force = run.read('force', 'time'), run.read('force', 'force')
+            n = min(len(t), len(force))
+            t, force = t[:n], force[:n]
+
+            # metadata and tables first, so a failure in filtering or
+            # fitting does not lose them
+            if len(cycles):
+                # motion start/stop of every cycle
+                run.addTable('cycles', runfile.CYCLE_COLUMNS)
+                run.append('cycles', {'start': cycles[:, 0], 'stop': cycles[:, 1]})
+
+            if telemetry is not None and telemetry.times:
+                # polled positions and their interpolation onto the force samples
+                run.addTable('stage', runfile.STAGE_COLUMNS)
+                run.append('stage', {'time': np.asarray(telemetry.times)-origin,
+                                     'x': telemetry.x, 'z': telemetry.z})
+                x, z = telemetry.onTimeline(t, origin)
+                run.addColumn('force', 'x', 'X position (mm)', x)
+                run.addColumn('force', 'z', 'Z position (mm)', z)
+                run.meta['telemetry'] = {'rate (Hz)': telemetry.rate,
+                                         'achieved rate (Hz)': telemetry.achievedRate(),
+                                         'samples': len(telemetry.times)}
+            if saver is not None:
+                # index of frame number, time and matching force sample of
+                # every saved frame
+                frameNo, stamps = saver.savedFrames()
+                frameTime = np.asarray(stamps, dtype = float)-origin
+                sample = np.clip(np.round(frameTime*sampleRate), 0, max(len(t)-1, 0))
+                run.addTable('frames', runfile.FRAME_COLUMNS)
+                run.append('frames', {'frame': frameNo, 'time': frameTime, 'sample': sample})
+
+            # filtfilt needs more samples than its padding, e.g. a run
+            # that failed at the start has none
+            if n <= filtfiltPadlen(lowpassSos(sampleRate, self.config.filCutoff)):
+                run.meta['filter'] = {'error': 'Too few samples to filter ('+str(n)+').'}
+                return
+            yf = self.filter(force)
+            run.addColumn('force', 'filtered', 'Filtered force (N)', yf)
+
+            if len(cycles):
+                # relaxation fits of all cycles at once
+                try:
+                    fits, pronyTaus = relaxation.fitCycles(t, yf, cycles[:, 0], cycles[:, 1])
+                    run.addTable('relaxation', relaxation.RELAXATION_COLUMNS)
+                    run.append('relaxation', fits)
+                    run.meta['relaxation'] = {'prony taus (s)': pronyTaus}
+                except ValueError as e:
+                    run.meta['relaxation'] = {'error': str(e)}
+
+        def closed():
+            if self.config.csvExport:
+                self.save(path)
+            self.emit('runSaved', path = path)
+
+        self.writer.close(finalize = finalize, onClosed = closed)
+        self.writers = [writer for writer in self.writers if writer.thread.is_alive()]+[self.writer]
+        self.writer = None
+
+    def filter(self, yy, rate = None):
+        # define function to filter results using low-pass
+        # samples are clocked at sampleRate unless another rate is given;
+        # the design for (rate, cutoff) is cached
+        from scipy import signal
+        sos = lowpassSos(rate or self.config.sampleRate, self.config.filCutoff)
+        return signal.sosfiltfilt(sos, yy)
+
+    def save(self, path):
+        # define function to export the run container as csv, plus the
+        # relaxation fits of a relaxation test
+        if 'relaxation' in runfile.loadRun(path).meta['tables']:
+            runfile.exportCsv(path, path+'_relaxation.csv', 'relaxation')
+        return runfile.exportCsv(path, path+'.csv')
+
+    def wait(self, timeout = None, pending = 0):
+        # define function to wait until every run is written and exported,
+        # or all but the latest `pending` runs
+        for writer in self.writers[:max(len(self.writers)-pending, 0)]:
+            writer.join(timeout)
+        self.writers = [writer for writer in self.writers if writer.thread.is_alive()]
+
+    def close(self):
+        self.stopQueue()
+        self.stopCamera()
+        self.wait()
+        self.stage.close()
@@ -0,0 +1,97 @@
+# Low-pass filtering of force traces
+# Cutoffs are given in Hz and designs are made for the measured sample
+# rate, so results are comparable between runs and PCs.
+# scipy.signal is imported on first use, it is slow to import.
+#================================================================
+import functools
+
+import numpy as np
+
+
+def measureRate(t):
+    # define function to measure the sample rate of a time column (Hz)
+    dt = np.diff(np.asarray(t, dtype = float))
+    dt = dt[dt > 0]
+    if not len(dt):
+        raise ValueError('Cannot measure the sample rate of fewer than two samples.')
+    return 1/np.median(dt)
+
+
+def isUniform(t, rate, tolerance = 0.01):
+    # True if every sample interval is within tolerance of 1/rate
+    dt = np.diff(np.asarray(t, dtype = float))
+    return bool(len(dt)) and np.max(np.abs(dt*rate-1)) <= tolerance
+
+
+def resampleUniform(t, y, rate):
+    # define function to interpolate y onto a uniform grid at rate (Hz)
+    t = np.asarray(t, dtype = float)
+    grid = t[0]+np.arange(int(np.floor((t[-1]-t[0])*rate))+1)/rate
+    return grid, np.interp(grid, t, y)
+
+
+@functools.lru_cache(maxsize = 64)
+def _lowpassSos(rate, cutoff, order):
+    from scipy import signal
+    cutoff = min(cutoff, 0.99*rate/2)
+    return signal.butter(order, cutoff, 'lowpass', fs = rate, output = 'sos')
+
+
+def lowpassSos(rate, cutoff, order = 3):
+    # define function to design a Butterworth low-pass, memoized per
+    # (rate, cutoff, order); the rate is rounded so measured rates that
+    # differ only by float noise share a design
+    return _lowpassSos(round(float(rate), 3), float(cutoff), int(order))
+
+
+def filtfiltPadlen(sos):
+    # define function to return the padding sosfiltfilt uses by default;
+    # traces of this many samples or fewer cannot be filtered
+    ntaps = 2*len(sos)+1-min(int(np.sum(sos[:, 2] == 0)), int(np.sum(sos[:, 5] == 0)))
+    return 3*ntaps
+
+
+def zeroPhaseFilter(t, y, cutoff, order = 3):
+    # define function to filter a trace with filtfilt at cutoff (Hz);
+    # irregularly sampled traces are resampled to their median rate first
+    # returns (t, filtered) on the grid that was filtered
+    from scipy import signal
+    rate = measureRate(t)
+    if not isUniform(t, rate):
+        t, y = resampleUniform(t, y, rate)
+    return np.asarray(t, dtype = float), signal.sosfiltfilt(lowpassSos(rate, cutoff, order), y)
+
+
+class StreamingFilter():
+    # Causal SOS filter applied block by block; the filter state (zi) is
+    # carried between blocks, so each block costs O(block) and the result
+    # equals filtering the whole trace at once with causalFilter().
+    # Unlike the zero-phase sosfiltfilt run after the test, the output lags
+    # the input by the group delay of the filter, about 2/(2*pi*cutoff) for
+    # the 3rd-order Butterworth (32 ms at 10 Hz). The live trace therefore
+    # deviates from the saved filtered force by about slope*delay while the
+    # force changes and matches it once shifted by the delay.
+    def __init__(self, sos):
+        self.sos = sos
+        self.zi = None
+
+    def process(self, x):
+        from scipy import signal
+        x = np.asarray(x, dtype = float)
+        if not len(x):
+            return x
+        if self.zi is None:
+            # start in steady state at the first sample to avoid a step
+            self.zi = signal.sosfilt_zi(self.sos)*x[0]
+        y, self.zi = signal.sosfilt(self.sos, x, zi = self.zi)
+        return y
+
+    def reset(self):
+        self.zi = None
+
+
+def causalFilter(sos, x):
+    # offline reference for StreamingFilter
+    from scipy import signal
+    x = np.asarray(x, dtype = float)
+    return signal.sosfilt(sos, x, zi = signal.sosfilt_zi(sos)*x[0])[0]
@@ -0,0 +1,160 @@
+# Live plotting helpers for the Tk pages
+# Artists are created once and updated with set_data; axis limits only
+# change (and trigger a full redraw) when the data leaves the view.
+#================================================================
+import numpy as np
+
+from bus import Cursor
+
+
+class LiveTrace():
+    # animated line(s) on an axes with self-managed limits
+    def __init__(self, ax, xlabel, ylabel, title = None, **lineOptions):
+        self.ax = ax
+        self.line, = ax.plot([], [], animated = True, **lineOptions)
+        self.lines = [self.line]
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        if title:
+            ax.set_title(title)
+        ax.set_xlim(0, 1)
+        ax.set_ylim(-1, 1)
+
+    def addLine(self, **lineOptions):
+        # define function to add another animated line sharing the limits
+        line, = self.ax.plot([], [], animated = True, **lineOptions)
+        self.lines.append(line)
+        return line
+
+    def update(self, x, y, *others):
+        # define function to update the lines with (x, y) and one further
+        # (x, y) pair per added line, True if limits were changed
+        pairs = [(x, y)]+list(zip(others[0::2], others[1::2]))
+        for line, (xi, yi) in zip(self.lines, pairs):
+            line.set_data(xi, yi)
+
+        pairs = [(xi, yi) for xi, yi in pairs if len(xi)]
+        if not pairs:
+            return False
+        return self.rescale(min(xi[0] for xi, yi in pairs), max(xi[-1] for xi, yi in pairs),
+                            min(np.min(yi) for xi, yi in pairs),
+                            max(np.max(yi) for xi, yi in pairs))
+
+    def rescale(self, xmin, xmax, ymin, ymax):
+        # define function to grow the view ahead of the data so redraws
+        # happen rarely, and to shrink it again when a new run starts
+        changed = False
+
+        x0, x1 = self.ax.get_xlim()
+        xspan = max(xmax-xmin, 1e-9)
+        if xmin < x0 or xmax > x1 or (x1-x0) > 4*xspan+1:
+            self.ax.set_xlim(xmin, xmin+1.5*xspan+1)
+            changed = True
+
+        y0, y1 = self.ax.get_ylim()
+        yspan = max(ymax-ymin, 1e-3)
+        if ymin < y0 or ymax > y1 or (y1-y0) > 8*yspan:
+            self.ax.set_ylim(ymin-0.25*yspan, ymax+0.25*yspan)
+            changed = True
+
+        return changed
+
+
+def updateArtists(canvas, changed, *artists):
+    # define function to finish an animate() call used with blit = True;
+    # a full draw refreshes ticks and the cached background after a rescale
+    if changed:
+        canvas.draw()
+    return artists
+
+
+class MinMaxDecimator():
+    # Incremental min/max reduction of one buffer column for display.
+    # Samples are reduced into buckets once; when there are more buckets
+    # than pixel columns, neighbouring buckets are merged pairwise, so
+    # peaks survive and each update only costs the new samples. New
+    # samples are read through a bus Cursor, atomically with respect to
+    # the thread filling the buffer.
+    def __init__(self, xName, yName, columns = 500):
+        self.xName = xName
+        self.yName = yName
+        self.maxBuckets = max(2, int(columns))
+        self.buffer = None
+
+    def reset(self, buffer):
+        if buffer is not self.buffer:
+            # read every sample held, then what is added
+            self.buffer = buffer
+            self.cursor = Cursor(buffer)
+            self.cursor.seen = 0
+        self.bucketSize = 1
+        # per bucket: time and value of the minimum and maximum, end time
+        self.buckets = np.empty((5, 0))
+        self.pending = np.empty((2, 0))
+
+    def update(self, buffer):
+        # define function to reduce samples added since the last call and
+        # return (x, y) with about two points per pixel column
+        if buffer is not self.buffer:
+            self.reset(buffer)
+
+        generation = self.cursor.generation
+        data, missed = self.cursor.read(copy = True)
+        if self.cursor.generation != generation:
+            # the buffer was restarted, e.g. by a new run
+            self.reset(buffer)
+        if data.shape[1]:
+            samples = np.vstack((data[buffer.index[self.xName]],
+                                 data[buffer.index[self.yName]]))
+            self.addSamples(np.hstack((self.pending, samples)))
+
+        # forget buckets that have been spilled out of the buffer
+        if self.buckets.shape[1] and len(buffer):
+            oldest = buffer.first(self.xName)
+            self.buckets = self.buckets[:, self.buckets[4] >= oldest]
+
+        return self.points()
+
+    def addSamples(self, samples):
+        nFull = samples.shape[1]//self.bucketSize
+        if nFull:
+            x = samples[0, :nFull*self.bucketSize].reshape(nFull, self.bucketSize)
+            y = samples[1, :nFull*self.bucketSize].reshape(nFull, self.bucketSize)
+            rows = np.arange(nFull)
+            iMin = np.argmin(y, axis = 1)
+            iMax = np.argmax(y, axis = 1)
+            new = np.vstack((x[rows, iMin], y[rows, iMin],
+                             x[rows, iMax], y[rows, iMax], x[:, -1]))
+            self.buckets = np.hstack((self.buckets, new))
+        self.pending = samples[:, nFull*self.bucketSize:].copy()
+
+        while self.buckets.shape[1] > self.maxBuckets:
+            self.mergeBuckets()
+
+    def mergeBuckets(self):
+        # define function to halve the number of buckets (min/max are exact)
+        n = self.buckets.shape[1]//2*2
+        left, right = self.buckets[:, 0:n:2], self.buckets[:, 1:n:2]
+        useLeftMin = left[1] <= right[1]
+        useLeftMax = left[3] >= right[3]
+        merged = np.vstack((np.where(useLeftMin, left[0], right[0]),
+                            np.where(useLeftMin, left[1], right[1]),
+                            np.where(useLeftMax, left[2], right[2]),
+                            np.where(useLeftMax, left[3], right[3]),
+                            right[4]))
+        self.buckets = np.hstack((merged, self.buckets[:, n:]))
+        # pending samples are shorter than a bucket and simply carry over
+        self.bucketSize *= 2
+
+    def points(self):
+        # emit the minimum and maximum of each bucket in time order
+        tMin, yMin, tMax, yMax = self.buckets[:4]
+        minFirst = tMin <= tMax
+        x = np.empty(2*len(tMin))
+        y = np.empty(2*len(tMin))
+        x[0::2] = np.where(minFirst, tMin, tMax)
+        y[0::2] = np.where(minFirst, yMin, yMax)
+        x[1::2] = np.where(minFirst, tMax, tMin)
+        y[1::2] = np.where(minFirst, yMax, yMin)
+        return (np.concatenate((x, self.pending[0])),
+                np.concatenate((y, self.pending[1])))
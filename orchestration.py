@@ -0,0 +1,82 @@
+# Orchestration of acquisition, motion and companion threads for a test
+# Acquisition starts first; motion only starts once the DAQ reports that
+# it is armed, and the latency between the two is measured.
+#================================================================
+import threading
+import time
+
+
+class _Worker(threading.Thread):
+    # thread keeping the exception of its target for the caller
+    def __init__(self, target, *args):
+        threading.Thread.__init__(self, daemon = True)
+        self.target = target
+        self.args = args
+        self.error = None
+
+    def run(self):
+        try:
+            self.target(*self.args)
+        except BaseException as e:
+            self.error = e
+
+
+def runConcurrently(acquire, motion, stop, companions = (), armTimeout = 10.0,
+                    timing = None):
+    # define function to run one test
+    # acquire(onArmed)  records data and calls onArmed(hostTime) at sample 0
+    # motion()          moves the stage, runs on the calling thread
+    # stop()            asks acquisition to finish early (used on errors)
+    # companions        callables(stopEvent) run alongside until acquisition ends
+    # timing            dict filled with the host times (perf_counter) and the
+    #                   arm-to-motion latency as they happen, so a caller
+    #                   keeps the times reached before an error
+    # returns timing
+    armed = threading.Event()
+    timing = {} if timing is None else timing
+
+    def onArmed(hostTime):
+        timing['acquisitionStart'] = hostTime
+        armed.set()
+
+    acqThread = _Worker(acquire, onArmed)
+    acqThread.start()
+    # wait in short slices so a failed acquisition is reported at once
+    deadline = time.perf_counter()+armTimeout
+    while not armed.wait(0.05):
+        if not acqThread.is_alive():
+            acqThread.join()
+            if acqThread.error is not None:
+                raise acqThread.error
+            raise RuntimeError('Acquisition ended before it was armed.')
+        if time.perf_counter() > deadline:
+            stop()
+            acqThread.join()
+            if acqThread.error is not None:
+                raise acqThread.error
+            raise TimeoutError('Acquisition was not armed within '+str(armTimeout)+' s.')
+
+    companionStop = threading.Event()
+    companionThreads = [_Worker(companion, companionStop) for companion in companions]
+    for thread in companionThreads:
+        thread.start()
+
+    timing['motionStart'] = time.perf_counter()
+    timing['armLatency'] = timing['motionStart']-timing['acquisitionStart']
+    try:
+        motion()
+        timing['motionEnd'] = time.perf_counter()
+    except BaseException:
+        stop()
+        raise
+    finally:
+        acqThread.join()
+        companionStop.set()
+        for thread in companionThreads:
+            thread.join()
+        timing['acquisitionEnd'] = time.perf_counter()
+
+    for thread in [acqThread]+companionThreads:
+        if thread.error is not None:
+            raise thread.error
+    return timing
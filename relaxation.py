@@ -0,0 +1,190 @@
+# Cycle segmentation and relaxation fitting for relaxation tests
+# Each cycle is a scrape followed by a pause; the force relaxation during
+# the pauses of all cycles is fitted at once. Exponential time constants
+# are found by a grid search in which the amplitudes of every candidate
+# and every cycle are solved together as one batched linear least-squares
+# problem, then refined by batched Levenberg-Marquardt steps on all
+# cycles at once, so no per-cycle curve_fit loop is needed.
+#================================================================
+import numpy as np
+
+
+MAX_POINTS = 400 # relaxation curves are block-averaged to at most this length
+PRONY_TERMS = 5
+
+# columns of the 'relaxation' table stored with a run
+RELAXATION_COLUMNS = ([('cycle', 'Cycle'),
+                       ('single_Finf', 'Single exp: F_inf (N)'),
+                       ('single_A1', 'Single exp: A1 (N)'),
+                       ('single_tau1', 'Single exp: tau1 (s)'),
+                       ('single_rmse', 'Single exp: RMSE (N)'),
+                       ('double_Finf', 'Double exp: F_inf (N)'),
+                       ('double_A1', 'Double exp: A1 (N)'),
+                       ('double_tau1', 'Double exp: tau1 (s)'),
+                       ('double_A2', 'Double exp: A2 (N)'),
+                       ('double_tau2', 'Double exp: tau2 (s)'),
+                       ('double_rmse', 'Double exp: RMSE (N)'),
+                       ('prony_Finf', 'Prony: F_inf (N)')]
+                      +[('prony_A'+str(i+1), 'Prony: A'+str(i+1)+' (N)') for i in range(PRONY_TERMS)]
+                      +[('prony_rmse', 'Prony: RMSE (N)')])
+
+
+def relaxationCurves(t, force, starts, stops):
+    # define function to cut the pause after every motion stop into a
+    # (cycles, points) matrix on a common time grid starting at the stop
+    # starts/stops: motion start and stop time of each cycle (s)
+    t = np.asarray(t, dtype = float)
+    stops = np.asarray(stops, dtype = float)
+    ends = np.append(np.asarray(starts, dtype = float)[1:], t[-1])
+
+    rate = (len(t)-1)/(t[-1]-t[0])
+    first = np.searchsorted(t, stops)
+    length = int(np.min(np.searchsorted(t, ends)-first))
+    if length < 4:
+        raise ValueError('Relaxation periods are too short to fit.')
+
+    # fixed-length slices of a uniformly sampled trace, then block means
+    curves = np.asarray(force, dtype = float)[first[:, None]+np.arange(length)]
+    block = max(1, int(np.ceil(length/MAX_POINTS)))
+    points = length//block
+    curves = curves[:, :points*block].reshape(len(first), points, block).mean(axis = 2)
+    tau = (np.arange(points)*block+(block-1)/2)/rate
+    return tau, curves
+
+
+def _solveBatch(basis, curves):
+    # least squares of curves (cycles, points) on basis (candidates, points, k)
+    # returns coefficients (candidates, k, cycles) and rmse (candidates, cycles)
+    gram = np.einsum('cpk,cpl->ckl', basis, basis)
+    rhs = np.einsum('cpk,np->ckn', basis, curves)
+    coef = np.linalg.solve(gram+1e-12*np.eye(basis.shape[2]), rhs)
+    # at the optimum |y-Bc|^2 = |y|^2-c.B'y, no residual matrix needed
+    sse = np.sum(curves**2, axis = 1)[None]-np.einsum('ckn,ckn->cn', coef, rhs)
+    return coef, np.sqrt(np.maximum(sse, 0)/curves.shape[1])
+
+
+def _solveCycles(basis, curves):
+    # least squares of each curve (cycles, points) on its own basis
+    # (cycles, points, k); returns coefficients (cycles, k) and rmse (cycles)
+    gram = np.einsum('npk,npl->nkl', basis, basis)
+    rhs = np.einsum('npk,np->nk', basis, curves)
+    coef = np.linalg.solve(gram+1e-12*np.eye(basis.shape[2]), rhs[:, :, None])[:, :, 0]
+    residual = curves-np.einsum('npk,nk->np', basis, coef)
+    return coef, np.sqrt(np.mean(residual**2, axis = 1))
+
+
+def _expBasis(tau, taus):
+    # basis [1, exp(-tau/tau_1), ...] of every cycle, (cycles, points, terms+1)
+    decays = np.exp(-tau[None, :, None]/taus[:, None, :])
+    return np.concatenate((np.ones(decays.shape[:2]+(1,)), decays), axis = 2)
+
+
+def refineExponentials(tau, curves, taus, bounds, iterations = 30):
+    # define function to refine the time constants (cycles, terms) of
+    # every cycle from a starting guess; damped Gauss-Newton steps in
+    # log(tau) are taken for all cycles at once, the amplitudes are solved
+    # linearly for every trial and a step is only kept if it lowers the
+    # rmse of its cycle. Returns taus, coefficients and rmse.
+    lo, hi = np.log(bounds[0]), np.log(bounds[1])
+    logTaus = np.log(taus)
+    coef, rmse = _solveCycles(_expBasis(tau, taus), curves)
+    damping = np.full(len(curves), 1e-3)
+    terms = taus.shape[1]
+
+    for _ in range(iterations):
+        basis = _expBasis(tau, np.exp(logTaus))
+        residual = curves-np.einsum('npk,nk->np', basis, coef)
+        # d/dlog(tau_i) of A_i exp(-tau/tau_i) is A_i exp(-tau/tau_i) tau/tau_i
+        slopes = (coef[:, None, 1:]*basis[:, :, 1:]
+                  *tau[None, :, None]/np.exp(logTaus)[:, None, :])
+        jacobian = np.concatenate((basis, slopes), axis = 2)
+        jtj = np.einsum('npk,npl->nkl', jacobian, jacobian)
+        jtr = np.einsum('npk,np->nk', jacobian, residual)
+        diag = np.einsum('nkk->nk', jtj)
+        system = jtj+(damping[:, None]*diag+1e-15)[:, :, None]*np.eye(jtj.shape[1])
+        step = np.linalg.solve(system, jtr[:, :, None])[:, :, 0]
+
+        trial = np.clip(logTaus+step[:, terms+1:], lo, hi)
+        trialCoef, trialRmse = _solveCycles(_expBasis(tau, np.exp(trial)), curves)
+        better = trialRmse < rmse
+        logTaus[better], coef[better], rmse[better] = trial[better], trialCoef[better], trialRmse[better]
+        damping = np.where(better, damping/3, damping*4)
+        if np.all(np.abs(step[:, terms+1:]) < 1e-8) or np.all(damping > 1e8):
+            break
+
+    # order the terms by time constant
+    order = np.argsort(logTaus, axis = 1)
+    cycles = np.arange(len(curves))[:, None]
+    coef[:, 1:] = coef[:, 1:][cycles, order]
+    return np.exp(logTaus[cycles, order]), coef, rmse
+
+
+def fitExponentials(tau, curves, terms = 1, gridSize = 60):
+    # define function to fit F_inf + sum A_i exp(-tau/tau_i) to every curve;
+    # a grid search gives the starting time constants, which are then
+    # refined; returns {'Finf', 'A1', 'tau1', ..., 'rmse'} with one value
+    # per cycle
+    span = tau[-1]-tau[0]
+    grid = np.geomspace(max(tau[1]-tau[0], span/1e4), 2*span, gridSize)
+    if terms == 1:
+        candidates = grid[:, None]
+    else:
+        i, j = np.triu_indices(gridSize, 1)
+        candidates = np.column_stack((grid[i], grid[j]))
+
+    bestRmse = np.full(len(curves), np.inf)
+    best = {}
+    # chunk the candidates to bound memory on long curves
+    chunk = max(1, int(2e6//(len(tau)*(terms+1)+len(curves)*len(tau))))
+    for lo in range(0, len(candidates), chunk):
+        taus = candidates[lo:lo+chunk]
+        basis = np.concatenate((np.ones((len(taus), len(tau), 1)),
+                                np.exp(-tau[None, :, None]/taus[:, None, :])), axis = 2)
+        coef, rmse = _solveBatch(basis, curves)
+        pick = np.argmin(rmse, axis = 0)
+        cycles = np.arange(len(curves))
+        better = rmse[pick, cycles] < bestRmse
+        bestRmse[better] = rmse[pick, cycles][better]
+        for k in range(terms+1):
+            name = 'Finf' if k == 0 else 'A'+str(k)
+            best.setdefault(name, np.zeros(len(curves)))[better] = coef[pick, k, cycles][better]
+        for k in range(terms):
+            best.setdefault('tau'+str(k+1), np.zeros(len(curves)))[better] = taus[pick, k][better]
+
+    taus = np.column_stack([best['tau'+str(k+1)] for k in range(terms)])
+    taus, coef, rmse = refineExponentials(tau, curves, taus, (grid[0], grid[-1]))
+    result = {'Finf': coef[:, 0]}
+    for k in range(terms):
+        result['A'+str(k+1)] = coef[:, k+1]
+        result['tau'+str(k+1)] = taus[:, k]
+    result['rmse'] = rmse
+    return result
+
+
+def fitProny(tau, curves, terms = PRONY_TERMS):
+    # define function to fit a Prony series with fixed, log-spaced time
+    # constants; one linear solve for all cycles
+    span = tau[-1]-tau[0]
+    taus = np.geomspace(max(tau[1]-tau[0], span/1e4), span, terms)
+    basis = np.column_stack([np.ones(len(tau))]+[np.exp(-tau/ti) for ti in taus])
+    coef, _, _, _ = np.linalg.lstsq(basis, curves.T, rcond = None)
+    rmse = np.sqrt(np.mean((curves.T-basis @ coef)**2, axis = 0))
+    result = {'Finf': coef[0], 'rmse': rmse, 'taus': taus}
+    for i in range(terms):
+        result['A'+str(i+1)] = coef[i+1]
+    return result
+
+
+def fitCycles(t, force, starts, stops):
+    # define function to fit all relaxation models to all cycles; returns
+    # the columns of RELAXATION_COLUMNS and the Prony time constants
+    tau, curves = relaxationCurves(t, force, starts, stops)
+    prony = fitProny(tau, curves)
+    columns = {'cycle': np.arange(len(curves))}
+    for prefix, fit in (('single_', fitExponentials(tau, curves, 1)),
+                        ('double_', fitExponentials(tau, curves, 2)),
+                        ('prony_', prony)):
+        for name, values in fit.items():
+            if name != 'taus':
+                columns[prefix+name] = values
+    return columns, [float(ti) for ti in prony['taus']]
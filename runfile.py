@@ -0,0 +1,229 @@
+# Run container for Millimanipulation Mark 3 results
+# A run is a directory '<path>.m3run' holding
+#     meta.json              run parameters, tables and column labels
+#     <table>.<column>.f8    raw little-endian float64 columns, appended in chunks
+#     data.npz               replaces the .f8 files when the run is compressed
+# Raw columns load as memory maps; csv is exported on demand.
+#================================================================
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+
+RUN_SUFFIX = '.m3run'
+DTYPE = '<f8'
+
+# labels of the columns written by Mark3, used as csv headers
+FORCE_COLUMNS = [('time', 'time (s)'), ('voltage', 'Voltage (V)'), ('force', 'Force (N)')]
+# stage positions polled during a test
+STAGE_COLUMNS = [('time', 'time (s)'), ('x', 'X position (mm)'), ('z', 'Z position (mm)')]
+# index linking each recorded frame to the force timeline
+FRAME_COLUMNS = [('frame', 'Frame number'), ('time', 'time (s)'),
+                 ('sample', 'Force sample index')]
+# motion start and stop of every cycle of a relaxation test
+CYCLE_COLUMNS = [('start', 'Motion start (s)'), ('stop', 'Motion stop (s)')]
+
+
+def runDirectory(path):
+    return path if path.endswith(RUN_SUFFIX) else path+RUN_SUFFIX
+
+
+class RunWriter():
+    # write a run container; columns are declared per table up front. An
+    # existing container at the same path is replaced, never appended to.
+    def __init__(self, path, parameters, tables):
+        self.dir = runDirectory(path)
+        if os.path.isdir(self.dir):
+            shutil.rmtree(self.dir)
+        os.makedirs(self.dir)
+        self.files = {}
+        self.meta = {'version': 1,
+                     'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'complete': False,
+                     'compressed': False,
+                     'parameters': parameters,
+                     'tables': {}}
+        for table, columns in tables.items():
+            self.addTable(table, columns)
+        self.writeMeta()
+
+    def addTable(self, table, columns):
+        # columns: list of (name, label)
+        self.meta['tables'][table] = {'columns': [name for name, label in columns],
+                                      'labels': dict(columns)}
+
+    def columnFile(self, table, name):
+        return os.path.join(self.dir, table+'.'+name+'.f8')
+
+    def append(self, table, columns):
+        # define function to append a chunk, columns: {name: array}
+        for name, values in columns.items():
+            key = (table, name)
+            if key not in self.files:
+                self.files[key] = open(self.columnFile(table, name), 'wb')
+            np.asarray(values, dtype = DTYPE).tofile(self.files[key])
+
+    def addColumn(self, table, name, label, values):
+        # define function to store a derived column in one go
+        info = self.meta['tables'][table]
+        if name not in info['columns']:
+            info['columns'].append(name)
+        info['labels'][name] = label
+        np.asarray(values, dtype = DTYPE).tofile(self.columnFile(table, name))
+
+    def read(self, table, name):
+        # define function to read back a column appended so far as a
+        # read-only memory map, e.g. to post-process a run without keeping
+        # it in memory
+        f = self.files.get((table, name))
+        if f is not None:
+            f.flush()
+        fileName = self.columnFile(table, name)
+        if not os.path.exists(fileName) or not os.path.getsize(fileName):
+            return np.empty(0)
+        return np.memmap(fileName, dtype = DTYPE, mode = 'r')
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def writeMeta(self):
+        # replace meta.json atomically so a crash never leaves it half written
+        tmp = os.path.join(self.dir, 'meta.json.tmp')
+        with open(tmp, 'w', encoding = 'UTF8') as f:
+            json.dump(self.meta, f, indent = 1)
+        os.replace(tmp, os.path.join(self.dir, 'meta.json'))
+
+    def close(self, compress = False, **extra):
+        # define function to finish the run, optionally packing it into data.npz
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+        lengths = {}
+        for table, info in self.meta['tables'].items():
+            for name in info['columns']:
+                fileName = self.columnFile(table, name)
+                size = os.path.getsize(fileName) if os.path.exists(fileName) else 0
+                lengths[table+'.'+name] = size//8
+
+        if compress:
+            arrays = {key: np.fromfile(self.columnFile(*key.split('.', 1)), dtype = DTYPE)
+                      for key, n in lengths.items() if n}
+            np.savez_compressed(os.path.join(self.dir, 'data.npz'), **arrays)
+            for key in arrays:
+                os.remove(self.columnFile(*key.split('.', 1)))
+
+        self.meta.update(extra)
+        self.meta['lengths'] = lengths
+        self.meta['complete'] = True
+        self.meta['compressed'] = compress
+        self.writeMeta()
+
+
+class Run():
+    # loaded run: parameters, metadata and {table: {column: array}}
+    def __init__(self, meta, tables):
+        self.meta = meta
+        self.parameters = meta['parameters']
+        self.tables = tables
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def nearestFrame(self, t):
+        # define function to find the recorded frame closest to time t
+        frameTime = self['frames']['time']
+        if not len(frameTime):
+            return None
+        i = int(np.clip(np.searchsorted(frameTime, t), 1, len(frameTime)-1))
+        if len(frameTime) == 1 or abs(frameTime[i-1]-t) <= abs(frameTime[i]-t):
+            i -= 1
+        return int(self['frames']['frame'][i])
+
+    def frameForSample(self, sample):
+        # define function to find the frame closest to a force sample
+        return self.nearestFrame(self['force']['time'][sample])
+
+    def forceWindow(self, frame, before = 0.5, after = 0.5):
+        # define function to return the force columns within a time window
+        # (s) around a frame, as {column: array}
+        frames = self['frames']
+        i = int(np.searchsorted(frames['frame'], frame))
+        if i == len(frames['frame']) or frames['frame'][i] != frame:
+            raise KeyError('Frame '+str(frame)+' was not saved.')
+        t = frames['time'][i]
+        force = self['force']
+        lo, hi = np.searchsorted(force['time'], [t-before, t+after])
+        return {name: values[lo:hi] for name, values in force.items()}
+
+    def framePath(self, frame):
+        # define function to locate the image of a frame; in video runs the
+        # frame number is the position in the video file
+        images = self.meta.get('images', {})
+        if images.get('video'):
+            return images['video']
+        return os.path.join(images.get('directory', ''), '{:06d}.jpg'.format(frame))
+
+
+def loadRun(path):
+    # define function to load a run; raw columns are memory-mapped
+    directory = runDirectory(path)
+    with open(os.path.join(directory, 'meta.json'), encoding = 'UTF8') as f:
+        meta = json.load(f)
+
+    packed = None
+    if meta.get('compressed'):
+        packed = np.load(os.path.join(directory, 'data.npz'))
+
+    tables = {}
+    for table, info in meta['tables'].items():
+        columns = {}
+        for name in info['columns']:
+            key = table+'.'+name
+            fileName = os.path.join(directory, key+'.f8')
+            if packed is not None:
+                columns[name] = packed[key] if key in packed.files else np.empty(0)
+            elif os.path.exists(fileName) and os.path.getsize(fileName):
+                columns[name] = np.memmap(fileName, dtype = DTYPE, mode = 'r')
+            else:
+                columns[name] = np.empty(0)
+
+        # an interrupted run may have columns of slightly different length
+        lengths = [len(v) for v in columns.values() if len(v)]
+        n = min(lengths) if lengths else 0
+        tables[table] = {name: v[:n] if len(v) else v for name, v in columns.items()}
+
+    return Run(meta, tables)
+
+
+def exportCsv(path, csvPath = None, table = 'force'):
+    # define function to export one table of a run as csv
+    run = loadRun(path)
+    info = run.meta['tables'][table]
+    columns = [name for name in info['columns'] if len(run[table][name])]
+    if csvPath is None:
+        csvPath = runDirectory(path)[:-len(RUN_SUFFIX)]+'.csv'
+
+    with open(csvPath, 'w', encoding = 'UTF8', newline = '') as f:
+        writer = csv.writer(f)
+        writer.writerow([info['labels'][name] for name in columns])
+        if columns:
+            np.savetxt(f, np.column_stack([run[table][name] for name in columns]),
+                       delimiter = ',', fmt = '%.10g')
+    return csvPath
+
+
+# export a run from the command line: python runfile.py <run> [csv path]
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python runfile.py <run'+RUN_SUFFIX+'> [output.csv]')
+        sys.exit(1)
+    print(exportCsv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
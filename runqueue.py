@@ -0,0 +1,65 @@
+# Unattended run queue of the Millimanipulation Mark 3
+# Runs every test of a queue file back to back through the engine; each
+# run is post-processed and saved in the background while the next one
+# moves and records. Queue files are csv with one test per row:
+#     test,name,speed (mm/s),distance (mm),depth (mm),relax time (s),scrapes,repeats,record images
+#     millimanipulation,sweep_1mms,1,5,0.1,,,3,
+#     relaxation,relax_2mms,2,1,0.1,10,5,1,
+#
+# usage: python runqueue.py <queue.csv> [--output <directory>] [--reset-z] [--return-x]
+#================================================================
+import argparse
+import os
+import sys
+import time
+
+from engine import Config, Engine, loadQueue
+
+
+def printEvent(name, info):
+    # define function to report queue progress on the console
+    if name == 'queueProgress':
+        print('{done}/{runs} {path}'.format(**info))
+    elif name == 'runSaved':
+        print('Saved '+info['path'])
+    elif name == 'queueFinished' and info['failed']:
+        print('Queue stopped at '+info['failed'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run a queue of Millimanipulation tests.')
+    parser.add_argument('queue', help = 'queue csv, one test per row')
+    parser.add_argument('--output', default = '', help = 'directory of the runs')
+    parser.add_argument('--config', default = 'config.csv', help = 'device configuration')
+    parser.add_argument('--simulated', action = 'store_true', help = 'use the simulated DAQ, stage and camera')
+    parser.add_argument('--reset-z', action = 'store_true', help = 'raise Z by the depth after each run')
+    parser.add_argument('--return-x', action = 'store_true', help = 'move X back to the start after each run')
+    parser.add_argument('--z-speed', type = float, default = 0.2, help = 'Z speed (mm/s)')
+    parser.add_argument('--return-speed', type = float, default = 10, help = 'X return speed (mm/s)')
+    args = parser.parse_args()
+
+    entries = loadQueue(args.queue)
+    config = Config.load(args.config) if os.path.exists(args.config) else Config()
+    if args.simulated:
+        config.daqBackend = config.stageBackend = config.cameraBackend = 'simulated'
+    if args.output:
+        os.makedirs(args.output, exist_ok = True)
+
+    engine = Engine(config, onEvent = printEvent)
+    if any(entry.recordImages for entry in entries):
+        engine.startCamera()
+        # images are only recorded once the camera is open
+        deadline = time.perf_counter()+5
+        while engine.camera is None and time.perf_counter() < deadline:
+            time.sleep(0.1)
+    try:
+        paths = engine.runQueue(entries, args.output, args.reset_z, args.return_x,
+                                args.z_speed, args.return_speed)
+    except KeyboardInterrupt:
+        print('Exiting queue early!')
+        sys.exit(1)
+    finally:
+        engine.close() # waits for the last runs to be saved
+    print('{} runs finished.'.format(len(paths)))
+    if engine.lastError is not None:
+        sys.exit(1)
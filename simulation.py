@@ -0,0 +1,361 @@
+# Simulated hardware for the Millimanipulation Mark 3 driver
+# Stand-ins mirror the parts of the vendor APIs used by the engine. They run
+# in real time and are coupled through the latest simulated stage: the DAQ
+# force and the camera frames follow its X motion. Select them with the
+# 'daq backend', 'stage backend' and 'camera backend' keys of config.csv.
+#================================================================
+import bisect
+import time
+
+import numpy as np
+
+
+# simulated transducer signal (V); with the default calibration
+# force = 54*V-5.4 the offset reads 0 N and the scrape plateau about 1 N
+OFFSET_VOLTAGE = 0.1
+EXTRA_VOLTAGE = 1.0 # level of further channels, e.g. an excitation voltage
+SCRAPE_VOLTAGE = 0.02 # plateau at SCRAPE_SPEED and above
+SCRAPE_SPEED = 1.0 # mm/s
+SCRAPE_TAUS = (0.1, 1.0) # s, build-up and relaxation time constants
+SCRAPE_WEIGHTS = (0.6, 0.4)
+
+X_RANGE = 100.0 # mm of X travel across a simulated camera frame
+
+_stage = None # latest FakeStageControl, drives the 'scrape' profile and frames
+
+
+class _ChannelCollection():
+    # mimic nidaqmx task.ai_channels
+    def __init__(self):
+        self.names = []
+
+    def add_ai_voltage_chan(self, physical_channel, min_val = -5.0, max_val = 5.0, **kwargs):
+        self.names.append(physical_channel)
+        return physical_channel
+
+
+class _Timing():
+    # mimic nidaqmx task.timing
+    def __init__(self):
+        self.rate = 1000.0
+        self.bufferSize = 1000
+
+    def cfg_samp_clk_timing(self, rate, samps_per_chan = 1000, **kwargs):
+        self.rate = float(rate)
+        self.bufferSize = int(samps_per_chan)
+
+
+class SimulatedTask():
+    # stand-in for nidaqmx.Task producing a clocked voltage signal; the
+    # first channel is the force transducer, further channels read
+    # EXTRA_VOLTAGE with the same noise and hum
+    # profile 'idle':   offset voltage with transducer noise and mains hum
+    # profile 'scrape': idle plus the force of the blade while the simulated
+    #                   stage moves X forward; the force builds up and relaxes
+    #                   as the sum of a fast and a slow first-order response
+    def __init__(self, signal = None, seed = None, profile = 'scrape',
+                 noise = 0.002, hum = 0.001, mainsFrequency = 50.0):
+        self.ai_channels = _ChannelCollection()
+        self.timing = _Timing()
+        self.signal = signal if signal is not None else self.defaultSignal
+        self.rng = np.random.default_rng(seed)
+        self.profile = profile
+        self.noise = noise
+        self.hum = hum
+        self.mainsFrequency = mainsFrequency
+        self.response = np.zeros(len(SCRAPE_TAUS)) # state of the scrape response
+        self.startTime = None
+        self.samplesRead = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def defaultSignal(self, t):
+        v = (OFFSET_VOLTAGE+self.noise*self.rng.standard_normal(len(t))
+             +self.hum*np.sin(2*np.pi*self.mainsFrequency*t))
+        if self.profile == 'scrape' and _stage is not None and self.startTime is not None:
+            v += self.scrapeSignal(t)
+        return v
+
+    def extraSignal(self, t):
+        return (EXTRA_VOLTAGE+self.noise*self.rng.standard_normal(len(t))
+                +self.hum*np.sin(2*np.pi*self.mainsFrequency*t))
+
+    def scrapeSignal(self, t):
+        # blade force (V) from the X velocity of the stage at the host time
+        # each sample was clocked
+        _, velocity = _stage.positionsAt(_stage.lrDevId, self.startTime+t)
+        speed = np.clip(velocity/_stage.stepsPerMm[_stage.lrDevId], 0, None) # mm/s
+        target = SCRAPE_VOLTAGE*np.minimum(1, speed/SCRAPE_SPEED)**0.3
+
+        # first-order lags y[n] = y[n-1]+alpha*(x[n]-y[n-1]), state carried
+        from scipy.signal import lfilter
+        force = np.zeros(len(t))
+        for i, (tau, weight) in enumerate(zip(SCRAPE_TAUS, SCRAPE_WEIGHTS)):
+            alpha = 1-np.exp(-1/(self.timing.rate*tau))
+            y, _ = lfilter([alpha], [1, alpha-1], target, zi = [(1-alpha)*self.response[i]])
+            self.response[i] = y[-1]
+            force += weight*y
+        return force
+
+    def start(self):
+        self.startTime = time.perf_counter()
+        self.samplesRead = 0
+        self.response[:] = 0
+
+    def stop(self):
+        self.startTime = None
+
+    def close(self):
+        self.stop()
+
+    def read(self, number_of_samples_per_channel = None, timeout = 10.0):
+        # block until the requested samples have been clocked, as the DAQ would
+        if self.startTime is None:
+            self.start()
+
+        n = 1 if number_of_samples_per_channel is None else int(number_of_samples_per_channel)
+        rate = self.timing.rate
+        waitTime = (self.samplesRead+n)/rate-(time.perf_counter()-self.startTime)
+        if waitTime > timeout:
+            raise TimeoutError('Simulated DAQ read timed out.')
+        if waitTime > 0:
+            time.sleep(waitTime)
+
+        t = (self.samplesRead+np.arange(n))/rate
+        self.samplesRead += n
+        nChannels = max(1, len(self.ai_channels.names))
+        data = np.array([self.signal(t)]+[self.extraSignal(t) for _ in range(nChannels-1)])
+
+        if number_of_samples_per_channel is None:
+            values = data[:, 0].tolist()
+        else:
+            values = data.tolist()
+        return values[0] if len(values) == 1 else values
+
+
+class SimulatedCapture():
+    # stand-in for cv2.VideoCapture producing synthetic BGR frames at a set fps
+    CAP_PROP_FRAME_WIDTH = 3
+    CAP_PROP_FRAME_HEIGHT = 4
+
+    def __init__(self, fps = 30.0, width = 640, height = 480):
+        self.fps = float(fps)
+        self.width = int(width)
+        self.height = int(height)
+        self.frameCount = 0
+        self.nextTime = time.perf_counter()
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        if prop == self.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == self.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        return True
+
+    def read(self):
+        # wait for the next frame period, then draw the blade as a bar at
+        # the X position of the simulated stage (a moving bar without one)
+        if not self.opened:
+            return False, None
+        waitTime = self.nextTime-time.perf_counter()
+        if waitTime > 0:
+            time.sleep(waitTime)
+        self.nextTime = max(self.nextTime, time.perf_counter()-1/self.fps)+1/self.fps
+
+        frame = np.full((self.height, self.width, 3), 40, dtype = np.uint8)
+        if _stage is not None:
+            x = _stage.posXYVals_cal()[0]
+            column = int(x/X_RANGE*(self.width-8)) % self.width
+        else:
+            column = (self.frameCount*4) % self.width
+        frame[:, column:column+8] = 255
+        self.frameCount += 1
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
+
+def trapezoid(elapsed, distance, speed, accel, decel):
+    # define function to evaluate a trapezoidal move from rest to rest
+    # elapsed: array of times since the move started (s)
+    # returns travelled distance and speed (steps, steps/s) and the duration
+    distance = abs(distance)
+    accelDist = speed**2/(2*accel)
+    decelDist = speed**2/(2*decel)
+    if accelDist+decelDist > distance:
+        # too short to reach speed: triangular profile
+        speed = np.sqrt(2*distance*accel*decel/(accel+decel))
+        accelDist = speed**2/(2*accel)
+        decelDist = speed**2/(2*decel)
+    accelTime = speed/accel if speed else 0.0
+    decelTime = speed/decel if speed else 0.0
+    cruiseTime = (distance-accelDist-decelDist)/speed if speed else 0.0
+    duration = accelTime+cruiseTime+decelTime
+
+    e = np.clip(np.asarray(elapsed, dtype = float), 0, duration)
+    remaining = duration-e
+    accelerating = e < accelTime
+    cruising = ~accelerating & (remaining > decelTime)
+    # an infinite accel (a segment starting at speed) has no accelerating part
+    accelX = 0.5*accel*e**2 if accelTime else np.zeros_like(e)
+    accelV = accel*e if accelTime else np.zeros_like(e)
+    x = np.where(accelerating, accelX,
+                 np.where(cruising, accelDist+speed*(e-accelTime),
+                          distance-0.5*decel*remaining**2))
+    v = np.where(accelerating, accelV, np.where(cruising, speed, decel*remaining))
+    return x, v, duration
+
+
+class FakeStageControl():
+    # stand-in for ximc.StageControl; X (lr) and Z (ud) move with the
+    # trapezoidal profile of the configured Speed, Accel and Decel (steps/s,
+    # steps/s^2) in real time. Every move is kept as a segment, so positions
+    # and speeds can be looked up for past times (see positionsAt).
+    HISTORY = 30.0 # s of move segments kept for past lookups
+
+    def __init__(self):
+        global _stage
+        self.lrDevId = 1
+        self.udDevId = 2
+        self.stepsPerMm = {self.lrDevId: 200, self.udDevId: 12000}
+        self.settings = {devId: {'Speed': 2000, 'Accel': 10000, 'Decel': 10000}
+                         for devId in (self.lrDevId, self.udDevId)}
+        # devId -> [(start time, start, target, speed, accel, decel, duration)]
+        self.segments = {devId: [(-np.inf, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0)]
+                         for devId in (self.lrDevId, self.udDevId)}
+        self.calls = []
+        _stage = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def setMoveParameters(self, devId, settings):
+        self.calls.append(('setMoveParameters', devId))
+        self.settings[devId] = dict(settings)
+
+    def getMoveParameters(self, devId):
+        self.calls.append(('getMoveParameters', devId))
+        return dict(self.settings[devId])
+
+    def positionsAt(self, devId, times):
+        # define function to look up positions and speeds (steps, steps/s)
+        # at host perf_counter times
+        times = np.atleast_1d(np.asarray(times, dtype = float))
+        segments = list(self.segments[devId])
+        position = np.empty(len(times))
+        velocity = np.zeros(len(times))
+        starts = [segment[0] for segment in segments]
+        first = max(0, bisect.bisect_right(starts, times.min() if len(times) else 0)-1)
+        for i in range(first, len(segments)):
+            startTime, start, target, speed, accel, decel, duration = segments[i]
+            end = segments[i+1][0] if i+1 < len(segments) else np.inf
+            mask = (times >= startTime) & (times < end)
+            if i == first:
+                mask |= times < startTime
+            x, v, _ = trapezoid(times[mask]-startTime, target-start, speed, accel, decel)
+            direction = np.sign(target-start)
+            position[mask] = start+direction*x
+            velocity[mask] = direction*v
+        return position, velocity
+
+    def currentPosition(self, devId):
+        return float(self.positionsAt(devId, time.perf_counter())[0][0])
+
+    def isMoving(self, devId, now = None):
+        startTime, _, _, _, _, _, duration = self.segments[devId][-1]
+        return (now or time.perf_counter()) < startTime+duration
+
+    def addSegment(self, devId, target, moving = True):
+        # define function to start a move (or a stop) from the current position
+        now = time.perf_counter()
+        start = float(self.positionsAt(devId, now)[0][0])
+        settings = self.settings[devId]
+        speed = float(settings.get('Speed', 2000)) if moving else 0.0
+        accel = float(settings.get('Accel', 10000)) or np.inf
+        decel = float(settings.get('Decel', 10000)) or np.inf
+        target = float(target) if moving else start
+        _, _, duration = trapezoid(0, target-start, speed, accel, decel)
+        self.pushSegment(devId, (now, start, target, speed, accel, decel, duration))
+
+    def pushSegment(self, devId, segment):
+        # define function to append a segment, dropping those that ended
+        # before the kept history
+        segments = [old for old in self.segments[devId]
+                    if old[0]+old[6] >= segment[0]-self.HISTORY]
+        self.segments[devId] = (segments or self.segments[devId][-1:])+[segment]
+
+    def moveTo(self, devId, target):
+        self.calls.append(('move', devId, target))
+        self.addSegment(devId, target)
+
+    def moveRelativeRight(self, steps):
+        self.moveTo(self.lrDevId, self.currentPosition(self.lrDevId)+steps)
+
+    def moveRelativeUp(self, steps):
+        self.moveTo(self.udDevId, self.currentPosition(self.udDevId)+steps)
+
+    def moveToZeroX(self):
+        self.moveTo(self.lrDevId, 0)
+
+    def moveToZeroY(self):
+        self.moveTo(self.udDevId, 0)
+
+    def moveContinuousLeft(self):
+        self.moveTo(self.lrDevId, 0)
+
+    def moveContinuousDown(self):
+        self.moveTo(self.udDevId, 0)
+
+    def softStop(self, devId):
+        # define function to decelerate from the current speed to rest at
+        # the configured Decel, as the controller does
+        self.calls.append(('softStop', devId))
+        now = time.perf_counter()
+        position, velocity = self.positionsAt(devId, now)
+        speed = abs(float(velocity[0]))
+        decel = float(self.settings[devId].get('Decel', 10000)) or np.inf
+        if speed == 0 or decel == np.inf:
+            self.addSegment(devId, None, moving = False)
+            return
+        # a segment that starts at speed (infinite accel) and only decelerates
+        start = float(position[0])
+        target = start+np.sign(velocity[0])*speed**2/(2*decel)
+        self.pushSegment(devId, (now, start, target, speed, np.inf, decel, speed/decel))
+
+    def softStopX(self):
+        self.softStop(self.lrDevId)
+
+    def softStopY(self):
+        self.softStop(self.udDevId)
+
+    def setZero(self, devId):
+        self.addSegment(devId, None, moving = False)
+        startTime = self.segments[devId][-1][0]
+        self.segments[devId][-1] = (startTime, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0)
+
+    def setZeroPositionX(self):
+        self.setZero(self.lrDevId)
+
+    def setZeroPositionY(self):
+        self.setZero(self.udDevId)
+
+    def waitForStopXY(self, interval = 0.01):
+        while self.isMoving(self.lrDevId) or self.isMoving(self.udDevId):
+            time.sleep(interval)
+
+    def posXYVals_cal(self):
+        # positions in mm
+        return (self.currentPosition(self.lrDevId)/self.stepsPerMm[self.lrDevId],
+                self.currentPosition(self.udDevId)/self.stepsPerMm[self.udDevId])
@@ -0,0 +1,130 @@
+# Shared session with the 8SMC4 stage controller
+# The controller is opened once for the whole application; move
+# parameters are cached so unchanged settings are not sent again.
+#================================================================
+import threading
+import time
+
+import numpy as np
+
+import diagnostics
+
+
+# x-axis speeds used for homing and jogging (steps/s, steps/s^2)
+DEFAULT_X = {"Speed":2000, "uSpeed":0, "Accel":2000, "Decel":5000,
+             "AntiplaySpeed":50, "uAntiplaySpeed":0}
+
+
+def moveSettings(stepSpeed):
+    # move parameters used by tests and manual moves
+    return {"Speed":int(stepSpeed), "uSpeed":0, "Accel":10000, "Decel":10000,
+            "AntiplaySpeed":50, "uAntiplaySpeed":0}
+
+
+def openStage(backend = 'ximc'):
+    # define function to open the controller once
+    if backend == 'simulated':
+        from simulation import FakeStageControl as StageControl
+    else:
+        from ximc import StageControl
+    return StageSession(StageControl())
+
+
+class StageSession():
+    # Long-lived wrapper around a StageControl. Calls that change move
+    # parameters or start moves take self.lock, so one test or jog owns the
+    # controller at a time; hold it with 'with session.lock:' around a
+    # sequence. Other StageControl methods (soft stops, positions) pass
+    # straight through and are never blocked.
+    def __init__(self, stcon):
+        self.stcon = stcon
+        self.lock = threading.RLock()
+        self.moveParameters = {}
+        self.lrDevId = stcon.lrDevId
+        self.udDevId = stcon.udDevId
+
+    def __getattr__(self, name):
+        return getattr(self.stcon, name)
+
+    def setMoveParameters(self, devId, settings):
+        # define function to send move parameters only when they change
+        with self.lock:
+            if self.moveParameters.get(devId) == settings:
+                return False
+            self.stcon.setMoveParameters(devId, settings)
+            self.moveParameters[devId] = dict(settings)
+            return True
+
+    def moveRelative(self, devId, steps, settings, wait = True):
+        # define function to run a relative move with the given parameters
+        with self.lock:
+            self.setMoveParameters(devId, settings)
+            if devId == self.lrDevId:
+                self.stcon.moveRelativeRight(steps)
+            else:
+                self.stcon.moveRelativeUp(steps)
+            if wait:
+                self.waitForStopXY()
+
+    def waitForStopXY(self):
+        # define function to wait until both axes stopped, timed as 'stage wait';
+        # waits are one-off, the time between them is not a loop gap
+        loopTimer = diagnostics.timer('stage wait')
+        loopTimer.start()
+        with loopTimer:
+            self.stcon.waitForStopXY()
+
+    def moveToZeroX(self):
+        with self.lock:
+            self.setMoveParameters(self.lrDevId, DEFAULT_X)
+            self.stcon.moveToZeroX()
+
+    def moveContinuousLeft(self):
+        with self.lock:
+            self.setMoveParameters(self.lrDevId, DEFAULT_X)
+            self.stcon.moveContinuousLeft()
+
+    def close(self):
+        self.stcon.__exit__(None, None, None)
+
+
+class TelemetryPoller():
+    # Sample X/Z positions at a fixed rate on a companion thread of a test.
+    # Times are host perf_counter values; the force loop is hardware timed,
+    # so polling here never delays it.
+    def __init__(self, session, rate = 20.0):
+        self.session = session
+        self.rate = float(rate)
+        self.times = []
+        self.x = []
+        self.z = []
+
+    def run(self, stopEvent):
+        period = 1/self.rate
+        nextTime = time.perf_counter()
+        loopTimer = diagnostics.timer('stage telemetry')
+        loopTimer.start()
+        while not stopEvent.is_set():
+            with loopTimer:
+                x, z = self.session.posXYVals_cal()
+                self.times.append(time.perf_counter())
+                self.x.append(float(x))
+                self.z.append(float(z))
+
+            nextTime += period
+            waitTime = nextTime-time.perf_counter()
+            if waitTime > 0:
+                stopEvent.wait(waitTime)
+            else:
+                # fell behind, keep the period from now on
+                nextTime = time.perf_counter()
+
+    def achievedRate(self):
+        if len(self.times) < 2:
+            return 0.0
+        return (len(self.times)-1)/(self.times[-1]-self.times[0])
+
+    def onTimeline(self, t, origin):
+        # define function to interpolate positions onto times t (s after origin)
+        tt = np.asarray(self.times)-origin
+        return np.interp(t, tt, self.x), np.interp(t, tt, self.z)
@@ -0,0 +1,28 @@
+# Start-up time report
+# Import this module first; mark(step) records the wall time spent since
+# the previous mark, report() formats the breakdown.
+#================================================================
+import time
+
+
+START = time.perf_counter()
+steps = []
+_last = START
+
+
+def mark(step):
+    # define function to record the time since the previous mark (s)
+    global _last
+    now = time.perf_counter()
+    elapsed = now-_last
+    steps.append((step, elapsed))
+    _last = now
+    return elapsed
+
+
+def report():
+    # define function to format the breakdown and the total so far
+    lines = ['Start-up time:']
+    lines += ['  {:<28s}{:7.0f} ms'.format(step, 1000*seconds) for step, seconds in steps]
+    lines.append('  {:<28s}{:7.0f} ms'.format('total', 1000*(time.perf_counter()-START)))
+    return '\n'.join(lines)
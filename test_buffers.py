@@ -0,0 +1,71 @@
+# Tests of the ring buffer of live data
+#================================================================
+import numpy as np
+import pytest
+
+from buffers import TimeSeriesBuffer
+
+
+def fill(buffer, start, n):
+    t = np.arange(start, start+n, dtype = float)
+    buffer.extend(t, 2*t)
+    return start+n
+
+
+def test_wraparound_keeps_latest_samples_in_order():
+    buffer = TimeSeriesBuffer(10, columns = ('time', 'force'))
+    end = 0
+    for n in (3, 4, 5, 7, 1, 9):
+        end = fill(buffer, end, n)
+        expected = np.arange(max(0, end-10), end, dtype = float)
+        np.testing.assert_array_equal(buffer.column('time'), expected)
+        np.testing.assert_array_equal(buffer.column('force'), 2*expected)
+        assert len(buffer) == min(end, 10)
+        assert buffer.total == end
+        assert buffer.first('time') == expected[0] and buffer.last('time') == expected[-1]
+
+
+def test_block_larger_than_capacity():
+    spilled = []
+    buffer = TimeSeriesBuffer(10, columns = ('time', 'force'),
+                              onSpill = lambda rows: spilled.append(rows[0].copy()))
+    fill(buffer, 0, 4)
+    fill(buffer, 4, 25)
+    np.testing.assert_array_equal(buffer.column('time'), np.arange(19, 29))
+    assert buffer.total == 29
+    # the held samples and the part of the block that does not fit are spilled
+    np.testing.assert_array_equal(np.concatenate(spilled), np.arange(19))
+
+
+def test_spill_hands_over_every_overwritten_sample():
+    spilled = []
+    buffer = TimeSeriesBuffer(7, columns = ('time', 'force'),
+                              onSpill = lambda rows: spilled.append(rows[0].copy()))
+    end = 0
+    for n in np.random.default_rng(0).integers(1, 12, 50):
+        end = fill(buffer, end, int(n))
+    kept = buffer.column('time')
+    np.testing.assert_array_equal(np.concatenate(spilled+[kept]), np.arange(end))
+
+
+@pytest.mark.parametrize('n', [1, 4, 6, 10])
+def test_view_across_the_wrap_point(n):
+    buffer = TimeSeriesBuffer(10, columns = ('time', 'force'))
+    fill(buffer, 0, 17) # head is at 7, the latest samples wrap
+    view = buffer.view(n)
+    assert view.shape == (2, n)
+    assert not view.flags.writeable
+    assert view.base is not None # no copy
+    np.testing.assert_array_equal(view[0], np.arange(17-n, 17))
+
+
+def test_view_of_partly_filled_buffer_and_resize():
+    buffer = TimeSeriesBuffer(10, columns = ('time', 'force'))
+    assert buffer.view().shape == (2, 0) and buffer.first('time') == 0.0
+    fill(buffer, 0, 3)
+    assert buffer.view(8).shape == (2, 3)
+    generation = buffer.generation
+    buffer.resize(5, columns = ('time', 'force', 'x'))
+    assert buffer.generation == generation+1 and len(buffer) == 0
+    buffer.extend([1.0], [2.0], [3.0])
+    np.testing.assert_array_equal(buffer.view()[:, 0], [1, 2, 3])
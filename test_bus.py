@@ -0,0 +1,57 @@
+# Tests of the live data bus
+#================================================================
+import numpy as np
+
+from bus import DataBus
+
+
+def publishRange(stream, start, n):
+    t = np.arange(start, start+n, dtype = float)
+    stream.publish(t, -t)
+
+
+def test_snapshot_valid_until_capacity_minus_n_samples():
+    # a view of n samples survives capacity-n further samples
+    capacity, n = 100, 30
+    for block in (1, 7, 70):
+        stream = DataBus().stream('force', ('time', 'force'), capacity)
+        publishRange(stream, 0, 250)
+        snapshot = stream.view(n)
+        kept = snapshot.copy()
+        published = 0
+        while published+block <= capacity-n:
+            publishRange(stream, 250+published, block)
+            published += block
+            np.testing.assert_array_equal(snapshot, kept)
+        publishRange(stream, 250+published, capacity)
+        assert not np.array_equal(snapshot, kept)
+
+
+def test_cursor_reads_new_samples_and_counts_missed():
+    stream = DataBus().stream('force', ('time', 'force'), 50)
+    cursor = stream.cursor()
+    publishRange(stream, 0, 20)
+    block, missed = cursor.read()
+    np.testing.assert_array_equal(block[0], np.arange(20))
+    assert missed == 0
+
+    publishRange(stream, 20, 80)
+    block, missed = cursor.read()
+    np.testing.assert_array_equal(block[0], np.arange(50, 100))
+    assert missed == 30
+
+    stream.resize(50)
+    publishRange(stream, 0, 5)
+    block, missed = cursor.read()
+    assert block.shape[1] == 5 and missed == 0
+
+
+def test_subscribers_get_every_block():
+    stream = DataBus().stream('force', ('time', 'force'), 10)
+    blocks = []
+    stream.subscribe(blocks.append)
+    publishRange(stream, 0, 25)
+    publishRange(stream, 25, 3)
+    stream.unsubscribe(blocks.append)
+    publishRange(stream, 28, 3)
+    assert [len(block[0]) for block in blocks] == [25, 3]
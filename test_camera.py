@@ -0,0 +1,96 @@
+# Tests of the camera service on the simulated camera
+#================================================================
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import camera
+from bus import Latest
+from camera import CameraService, ImageSaver, frameName, openCamera
+from engine import Config, Engine
+from simulation import SimulatedCapture
+
+
+def test_start_latest_frame_and_stop():
+    capture = openCamera(0, 320, 240, backend = 'simulated', fps = 50)
+    assert isinstance(capture, SimulatedCapture)
+    service = CameraService(capture).start()
+    first = service.latest.get(timeout = 2)
+    assert first is not None
+    seq, stamp, frame = first
+    assert frame.shape == (240, 320, 3) and frame.dtype == np.uint8
+    assert not frame.flags.writeable
+
+    # consumers always get the newest frame
+    time.sleep(0.2)
+    newer = service.latest.get(afterSeq = seq, timeout = 2)
+    assert newer[0] > seq and newer[1] > stamp
+
+    service.stop()
+    assert not service.thread.is_alive()
+    assert not service.running and not capture.isOpened()
+    assert service.framesGrabbed >= 2
+
+
+def test_stops_after_repeated_failures():
+    capture = SimulatedCapture(fps = 100)
+    capture.release() # every read fails
+    service = CameraService(capture, maxFailures = 3, frames = Latest('frame')).start()
+    service.thread.join(2)
+    assert not service.thread.is_alive()
+    assert service.framesGrabbed == 0
+
+
+def test_engine_opens_the_camera_once(tmp_path, monkeypatch):
+    opened = []
+    openSimulated = camera.openCamera
+
+    def slowOpen(*args):
+        opened.append(threading.current_thread())
+        time.sleep(0.2) # opening a device takes a while
+        return openSimulated(*args)
+    monkeypatch.setattr('engine.openCamera', slowOpen)
+
+    engine = Engine(Config.simulated(channelFile = str(tmp_path/'channels.csv')))
+    try:
+        engine.startCamera()
+        engine.startCamera()
+        assert engine.frames.get(timeout = 3) is not None
+        engine.startCamera()
+        assert len(opened) == 1
+        assert engine.image.shape[2] == 3
+    finally:
+        engine.stopCamera()
+        engine.cameraThread.join(2)
+        engine.close()
+    assert engine.camera is None
+
+
+def test_failed_encodes_are_dropped_from_the_index(tmp_path):
+    pytest.importorskip('cv2')
+    saver = ImageSaver(str(tmp_path), workers = 2, queueSize = 100)
+    cv2 = saver.cv2
+
+    class FailingCv2():
+        # every third frame fails to encode
+        def __getattr__(self, name):
+            return getattr(cv2, name)
+
+        def imencode(self, ext, frame, params):
+            if frame[0, 0, 0] % 3 == 0:
+                return False, None
+            return cv2.imencode(ext, frame, params)
+    saver.cv2 = FailingCv2()
+
+    for i in range(12):
+        saver.submit(np.full((8, 8, 3), i, dtype = np.uint8), float(i))
+    stats = saver.close()
+    frameNo, stamps = saver.savedFrames()
+
+    assert stats['dropped'] == 4 and stats['written'] == 8
+    assert frameNo == [i for i in range(12) if i % 3]
+    assert stamps == [float(i) for i in frameNo]
+    assert sorted(os.listdir(tmp_path)) == [frameName(i) for i in frameNo]
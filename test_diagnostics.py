@@ -0,0 +1,54 @@
+# Tests of the loop timing histograms
+#================================================================
+import math
+
+import numpy as np
+import pytest
+
+import diagnostics
+from diagnostics import BINS_PER_DECADE, MIN_TIME, NBINS, Histogram, LoopTimer
+
+
+def test_bins_are_log_spaced():
+    rng = np.random.default_rng(0)
+    for seconds in 10**rng.uniform(-8, 3, 10000):
+        expected = (min(int(math.log10(seconds/MIN_TIME)*BINS_PER_DECADE)+1, NBINS-1)
+                    if seconds > MIN_TIME else 0)
+        assert diagnostics._bin(seconds) == expected
+
+
+def test_percentiles_within_a_bin():
+    values = 10**np.random.default_rng(1).uniform(-5, -1, 5000)
+    histogram = Histogram()
+    for seconds in values:
+        histogram.add(seconds)
+    assert histogram.n == len(values)
+    assert histogram.max == values.max()
+    assert histogram.mean() == pytest.approx(values.mean())
+    for q in (50, 90, 99):
+        exact = np.percentile(values, q)
+        assert exact <= histogram.percentile(q) <= exact*10**(1/BINS_PER_DECADE)*1.001
+
+
+def test_loop_timer_counts_iterations_and_gaps():
+    loopTimer = LoopTimer('test')
+    loopTimer.start()
+    for _ in range(10):
+        with loopTimer:
+            pass
+    loopTimer.begin()
+    loopTimer.end()
+    stats = loopTimer.summary()
+    assert stats['count'] == 11
+    assert loopTimer.gaps.n == 10
+    loopTimer.reset()
+    assert loopTimer.summary()['count'] == 0
+
+
+def test_reset_keeps_iterations_in_progress():
+    loopTimer = LoopTimer('test')
+    loopTimer.begin()
+    loopTimer.reset()
+    loopTimer.end()
+    assert loopTimer.durations.n == 1
+    assert loopTimer.durations.max < 1.0
@@ -0,0 +1,64 @@
+# Tests of the experiment engine on the simulated backends
+#================================================================
+import os
+
+import pytest
+
+import daq
+import runfile
+from engine import Config, Engine, MillimanipulationParams
+
+
+@pytest.fixture
+def engine(tmp_path):
+    events = []
+    engine = Engine(Config.simulated(channelFile = str(tmp_path/'channels.csv')),
+                    onEvent = lambda name, info: events.append((name, info)))
+    engine.events = events
+    yield engine
+    engine.close()
+
+
+def test_failed_run_is_still_saved(engine, tmp_path, monkeypatch):
+    def createTask(*args, **kwargs):
+        raise RuntimeError('no DAQ')
+    monkeypatch.setattr(daq, 'createTask', createTask)
+
+    path = engine.runMillimanipulation(MillimanipulationParams(1, 1, str(tmp_path/'run1')))
+    engine.wait()
+    assert [name for name, info in engine.events] == ['runStarted', 'error', 'runFinished', 'runSaved']
+    assert isinstance(engine.lastError, RuntimeError)
+
+    run = runfile.loadRun(path)
+    assert run.meta['complete']
+    assert 'diagnostics' in run.meta and 'timing' in run.meta
+    assert 'Too few samples' in run.meta['filter']['error']
+    assert os.path.exists(path+'.csv')
+
+
+def test_image_saver_closed_when_finalize_fails(engine, tmp_path, monkeypatch):
+    pytest.importorskip('cv2')
+    import stage
+    engine.startCamera()
+    engine.frames.get(timeout = 5)
+
+    def onTimeline(self, t, origin):
+        raise RuntimeError('telemetry fault')
+    monkeypatch.setattr(stage.TelemetryPoller, 'onTimeline', onTimeline)
+    savers = []
+    startImages = engine.startImages
+
+    def keepSaver(path):
+        startImages(path)
+        savers.append(engine.imageSaver)
+    monkeypatch.setattr(engine, 'startImages', keepSaver)
+
+    params = MillimanipulationParams(0.5, 1, str(tmp_path/'run1'), recordImages = True)
+    path = engine.runMillimanipulation(params)
+    engine.wait()
+    assert not any(thread.is_alive() for thread in savers[0].threads)
+
+    run = runfile.loadRun(path)
+    assert run.meta['complete']
+    assert run.meta['images']['written'] > 0
+    assert os.path.isdir(run.meta['images']['directory'])
@@ -0,0 +1,80 @@
+# Tests of the live (causal, block by block) and post-run force filters
+#================================================================
+import numpy as np
+import pytest
+from scipy import signal
+
+from filtering import StreamingFilter, causalFilter, lowpassSos, zeroPhaseFilter
+
+
+RATE = 1000.0
+CUTOFF = 10.0
+
+
+def trace(n = 20000, seed = 0):
+    # slow force changes with transducer noise and mains hum
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)/RATE
+    y = (np.sin(2*np.pi*0.5*t)+0.01*rng.standard_normal(n)
+         +0.005*np.sin(2*np.pi*50*t))
+    return t, y
+
+
+def streamed(sos, y, blockSizes):
+    # filter y block by block as the acquisition thread does
+    liveFilter = StreamingFilter(sos)
+    blocks, start = [], 0
+    for size in blockSizes:
+        blocks.append(liveFilter.process(y[start:start+size]))
+        start += size
+    blocks.append(liveFilter.process(y[start:]))
+    return np.concatenate(blocks)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_blocks_match_whole_trace(seed):
+    sos = lowpassSos(RATE, CUTOFF)
+    t, y = trace(seed = seed)
+    blockSizes = np.random.default_rng(seed).integers(0, 500, size = 80)
+    live = streamed(sos, y, blockSizes)
+
+    np.testing.assert_allclose(live, causalFilter(sos, y), rtol = 0, atol = 1e-12)
+
+    # independent reference: the same filter in transfer function form
+    b, a = signal.sos2tf(sos)
+    reference = signal.lfilter(b, a, y, zi = signal.lfilter_zi(b, a)*y[0])[0]
+    np.testing.assert_allclose(live, reference, rtol = 0, atol = 1e-9)
+
+
+def test_single_samples_and_reset():
+    sos = lowpassSos(RATE, CUTOFF)
+    _, y = trace(2000)
+    liveFilter = StreamingFilter(sos)
+    live = np.concatenate([liveFilter.process(y[i:i+1]) for i in range(len(y))])
+    np.testing.assert_allclose(live, causalFilter(sos, y), rtol = 0, atol = 1e-12)
+
+    # a reset starts a new trace in steady state
+    liveFilter.reset()
+    np.testing.assert_allclose(liveFilter.process(y[:100]), causalFilter(sos, y[:100]),
+                               rtol = 0, atol = 1e-12)
+    assert liveFilter.process(np.empty(0)).shape == (0,)
+
+
+def test_deviation_from_zero_phase_filter():
+    # the live trace lags the post-run filtfilt result by the group delay
+    sos = lowpassSos(RATE, CUTOFF)
+    t, y = trace()
+    live = causalFilter(sos, y)
+    _, saved = zeroPhaseFilter(t, y, CUTOFF)
+
+    delay = signal.group_delay(signal.sos2tf(sos), w = [0.0], fs = RATE)[1][0]/RATE
+    assert delay == pytest.approx(2/(2*np.pi*CUTOFF), rel = 0.01)
+
+    # after the start-up transient the deviation is about slope*delay
+    settled = slice(int(RATE), None)
+    slope = np.max(np.abs(np.gradient(saved, 1/RATE)))
+    assert np.max(np.abs(live-saved)[settled]) <= 1.2*slope*delay+0.01
+
+    # and shifting by the delay aligns both within the noise
+    shift = int(round(delay*RATE))
+    assert np.max(np.abs(live[int(RATE)+shift:]-saved[int(RATE):-shift])) < 0.02
@@ -0,0 +1,76 @@
+# Tests of the live trace decimation
+#================================================================
+import sys
+import threading
+import time
+
+import numpy as np
+
+from buffers import TimeSeriesBuffer
+from liveplot import MinMaxDecimator
+
+
+def test_peaks_survive_decimation():
+    buffer = TimeSeriesBuffer(10000, columns = ('time', 'force'))
+    t = np.arange(10000)/1000
+    force = np.sin(t)
+    force[1234] = 5.0
+    force[8765] = -5.0
+    decimator = MinMaxDecimator('time', 'force', columns = 100)
+    for lo in range(0, len(t), 100):
+        buffer.extend(t[lo:lo+100], force[lo:lo+100])
+        x, y = decimator.update(buffer)
+    assert len(x) <= 2*100+decimator.bucketSize
+    assert np.all(np.diff(x) >= 0)
+    assert y.max() == 5.0 and y.min() == -5.0
+
+
+def test_restarted_buffer_starts_a_new_trace():
+    buffer = TimeSeriesBuffer(100, columns = ('time', 'force'))
+    decimator = MinMaxDecimator('time', 'force', columns = 1000)
+    buffer.extend(np.arange(50.0), np.zeros(50))
+    decimator.update(buffer)
+    buffer.resize(100)
+    buffer.extend(np.arange(10.0), np.ones(10))
+    x, y = decimator.update(buffer)
+    np.testing.assert_array_equal(np.unique(x), np.arange(10.0))
+    assert np.all(y == 1)
+
+
+def test_concurrent_producer():
+    # the DAQ thread extends the buffer while frames are decimated; every
+    # frame is in time order and no sample is skipped or repeated
+    capacity, total, block = 20000, 1000000, 100
+    buffer = TimeSeriesBuffer(capacity, columns = ('time', 'force'))
+    decimator = MinMaxDecimator('time', 'force', columns = 10**7) # no merging
+    done = threading.Event()
+
+    def produce():
+        for lo in range(0, total, block):
+            t = np.arange(lo, lo+block, dtype = float)
+            buffer.extend(t, t)
+            if lo % 5000 == 0:
+                time.sleep(0)
+        done.set()
+
+    # switch threads often so the two interleave within an update
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        producer = threading.Thread(target = produce)
+        producer.start()
+        frames = 0
+        while not done.is_set():
+            x, y = decimator.update(buffer)
+            assert np.all(np.diff(x) >= 0)
+            assert np.all(np.diff(x[0::2]) == 1)
+            frames += 1
+        producer.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    x, y = decimator.update(buffer)
+    assert frames > 1
+    # one bucket (min and max) per sample of the latest buffer contents
+    samples = x[0::2]
+    np.testing.assert_array_equal(samples, np.arange(total-capacity, total))
@@ -0,0 +1,131 @@
+# Tests of the concurrent acquisition and motion of a test, run on the
+# simulated DAQ and stage
+#================================================================
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import daq
+from orchestration import runConcurrently
+from simulation import FakeStageControl, SimulatedTask
+from stage import StageSession, moveSettings
+
+
+RATE = 1000.0
+
+
+class Acquisition():
+    # records targetTime seconds of the simulated DAQ like Engine.recordForce
+    def __init__(self, targetTime):
+        self.targetTime = targetTime
+        self.running = True
+        self.samples = 0
+
+    def __call__(self, onArmed):
+        task = SimulatedTask(profile = 'idle')
+        task.ai_channels.add_ai_voltage_chan('Dev2/ai0')
+        task.timing.cfg_samp_clk_timing(RATE, samps_per_chan = int(10*RATE))
+        self.samples = daq.acquireBlocks(task, RATE, self.targetTime, lambda t, vol: None,
+                                         isRunning = lambda: self.running, onStart = onArmed)
+
+    def stop(self):
+        self.running = False
+
+
+@pytest.fixture
+def stage():
+    return StageSession(FakeStageControl())
+
+
+def test_motion_overlaps_acquisition(stage):
+    acquisition = Acquisition(1.0)
+
+    def motion():
+        stage.moveRelative(stage.lrDevId, 40, moveSettings(200)) # 0.2 mm at 1 mm/s
+
+    timing = runConcurrently(acquisition, motion, acquisition.stop)
+    assert acquisition.samples == int(RATE)
+    assert timing['acquisitionStart'] <= timing['motionStart'] < timing['motionEnd']
+    assert timing['motionEnd'] < timing['acquisitionEnd']
+    assert timing['armLatency'] == timing['motionStart']-timing['acquisitionStart']
+
+    # the stage moved while samples were clocked
+    sampleTimes = timing['acquisitionStart']+np.arange(int(RATE))/RATE
+    _, velocity = stage.positionsAt(stage.lrDevId, sampleTimes)
+    assert np.any(velocity > 0)
+
+
+def test_companions_run_until_acquisition_ends():
+    acquisition = Acquisition(0.3)
+    ticks = []
+
+    def companion(stopEvent):
+        while not stopEvent.wait(0.01):
+            ticks.append(time.perf_counter())
+
+    timing = runConcurrently(acquisition, lambda: None, acquisition.stop,
+                             companions = [companion])
+    assert ticks and ticks[0] >= timing['acquisitionStart']
+    assert ticks[-1] <= timing['acquisitionEnd']
+
+
+def test_motion_error_stops_acquisition(stage):
+    acquisition = Acquisition(10.0)
+    timing = {}
+
+    def motion():
+        stage.moveRelative(stage.lrDevId, 20, moveSettings(200))
+        raise RuntimeError('stage fault')
+
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match = 'stage fault'):
+        runConcurrently(acquisition, motion, acquisition.stop, timing = timing)
+    assert time.perf_counter()-start < 2.0
+    assert acquisition.samples < 10*RATE
+    # times reached before the error are kept
+    assert {'acquisitionStart', 'motionStart', 'acquisitionEnd'} <= set(timing)
+    assert 'motionEnd' not in timing
+
+
+def test_acquisition_error_before_arming_is_raised_at_once():
+    def acquire(onArmed):
+        raise ImportError('no DAQ driver')
+
+    motion = threading.Event()
+    start = time.perf_counter()
+    with pytest.raises(ImportError, match = 'no DAQ driver'):
+        runConcurrently(acquire, motion.set, lambda: None, armTimeout = 10.0)
+    assert time.perf_counter()-start < 1.0
+    assert not motion.is_set()
+
+
+def test_acquisition_error_after_arming():
+    def acquire(onArmed):
+        onArmed(time.perf_counter())
+        time.sleep(0.1)
+        raise TimeoutError('Simulated DAQ read timed out.')
+
+    with pytest.raises(TimeoutError, match = 'read timed out'):
+        runConcurrently(acquire, lambda: None, lambda: None)
+
+
+def test_companion_error():
+    def companion(stopEvent):
+        raise ValueError('telemetry fault')
+
+    acquisition = Acquisition(0.2)
+    with pytest.raises(ValueError, match = 'telemetry fault'):
+        runConcurrently(acquisition, lambda: None, acquisition.stop, companions = [companion])
+
+
+def test_arm_timeout():
+    stopped = threading.Event()
+
+    def acquire(onArmed):
+        stopped.wait(5.0)
+
+    with pytest.raises(TimeoutError):
+        runConcurrently(acquire, lambda: None, stopped.set, armTimeout = 0.2)
+    assert stopped.is_set()
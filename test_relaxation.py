@@ -0,0 +1,54 @@
+# Tests of the batched relaxation fits
+#================================================================
+import numpy as np
+
+from relaxation import fitCycles, fitExponentials
+
+
+def synthetic(cycles = 50, seed = 1):
+    # double-exponential relaxations whose time constants drift per cycle
+    rng = np.random.default_rng(seed)
+    tau = np.arange(400)*0.01
+    tau1 = 0.1*(1+0.2*np.linspace(0, 1, cycles))
+    tau2 = 0.8*(1+0.3*np.linspace(0, 1, cycles))
+    curves = (0.2+0.5*np.exp(-tau/tau1[:, None])+0.3*np.exp(-tau/tau2[:, None])
+              +0.001*rng.standard_normal((cycles, len(tau))))
+    return tau, curves, tau1, tau2
+
+
+def test_double_exponential_resolves_per_cycle_changes():
+    tau, curves, tau1, tau2 = synthetic()
+    fit = fitExponentials(tau, curves, 2)
+    np.testing.assert_allclose(fit['tau1'], tau1, rtol = 0.02)
+    np.testing.assert_allclose(fit['tau2'], tau2, rtol = 0.03)
+    np.testing.assert_allclose(fit['Finf'], 0.2, atol = 0.01)
+    assert np.all(fit['rmse'] < 0.0015)
+    # the drift is resolved, not quantised to grid steps
+    assert len(np.unique(np.round(fit['tau1'], 6))) == len(tau1)
+
+
+def test_single_exponential_is_exact_without_noise():
+    tau = np.arange(200)*0.02
+    curves = 0.1+0.7*np.exp(-tau[None]/np.array([[0.37], [1.3]]))
+    fit = fitExponentials(tau, curves, 1)
+    np.testing.assert_allclose(fit['tau1'], [0.37, 1.3], rtol = 1e-6)
+    np.testing.assert_allclose(fit['A1'], 0.7, rtol = 1e-6)
+    np.testing.assert_allclose(fit['Finf'], 0.1, atol = 1e-6)
+
+
+def test_fit_cycles_of_a_trace():
+    # scrape for 0.5 s, relax for 2 s, four times, sampled at 1 kHz
+    rate = 1000.0
+    t = np.arange(int(10*rate))/rate
+    starts = np.arange(4)*2.5
+    stops = starts+0.5
+    force = np.zeros(len(t))
+    for k, (start, stop) in enumerate(zip(starts, stops)):
+        moving = (t >= start) & (t < stop)
+        force[moving] = 1.0
+        relaxing = (t >= stop) & (t < start+2.5)
+        force[relaxing] = 0.3+0.7*np.exp(-(t[relaxing]-stop)/(0.2+0.05*k))
+
+    columns, pronyTaus = fitCycles(t, force, starts, stops)
+    np.testing.assert_allclose(columns['single_tau1'], 0.2+0.05*np.arange(4), rtol = 0.02)
+    assert len(pronyTaus) == 5
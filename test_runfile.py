@@ -0,0 +1,80 @@
+# Tests of the run container
+#================================================================
+import csv
+
+import numpy as np
+import pytest
+
+import runfile
+
+
+def writeRun(path, n, offset = 0.0, compress = False):
+    t = np.arange(n)/1000
+    force = offset+np.sin(t)
+    run = runfile.RunWriter(path, {'test': 'unit'}, {'force': runfile.FORCE_COLUMNS})
+    for lo in range(0, n, 300):
+        run.append('force', {'time': t[lo:lo+300], 'voltage': force[lo:lo+300]/54,
+                             'force': force[lo:lo+300]})
+    run.addColumn('force', 'filtered', 'Filtered force (N)', force)
+    run.close(compress = compress)
+    return t, force
+
+
+def test_write_read_rerun_export(tmp_path):
+    path = str(tmp_path/'run1')
+    t, force = writeRun(path, 1000)
+    run = runfile.loadRun(path)
+    assert run.meta['complete'] and run.parameters == {'test': 'unit'}
+    np.testing.assert_array_equal(run['force']['time'], t)
+    np.testing.assert_array_equal(run['force']['force'], force)
+
+    # a rerun to the same path replaces the run instead of appending to it
+    t, force = writeRun(path, 700, offset = 1.0)
+    run = runfile.loadRun(path)
+    assert run.meta['lengths'] == {'force.'+name: 700
+                                   for name in ('time', 'voltage', 'force', 'filtered')}
+    for name in ('time', 'voltage', 'force', 'filtered'):
+        assert len(run['force'][name]) == 700
+    np.testing.assert_array_equal(run['force']['filtered'], force)
+
+    csvPath = runfile.exportCsv(path)
+    with open(csvPath, newline = '') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['time (s)', 'Voltage (V)', 'Force (N)', 'Filtered force (N)']
+    assert len(rows) == 701
+    np.testing.assert_allclose(np.array(rows[1:], dtype = float)[:, 2], force, rtol = 1e-9)
+
+
+def test_rerun_over_compressed_run(tmp_path):
+    path = str(tmp_path/'run1')
+    writeRun(path, 1000, compress = True)
+    t, force = writeRun(path, 500)
+    run = runfile.loadRun(path)
+    assert not run.meta['compressed']
+    np.testing.assert_array_equal(run['force']['force'], force)
+
+
+def test_read_back_while_writing(tmp_path):
+    run = runfile.RunWriter(str(tmp_path/'run1'), {}, {'force': runfile.FORCE_COLUMNS})
+    assert len(run.read('force', 'time')) == 0
+    run.append('force', {'time': np.arange(10.0)})
+    np.testing.assert_array_equal(run.read('force', 'time'), np.arange(10.0))
+    run.close()
+
+
+def test_force_window_of_a_frame(tmp_path):
+    path = str(tmp_path/'run1')
+    t = np.arange(1000)/1000
+    run = runfile.RunWriter(path, {}, {'force': runfile.FORCE_COLUMNS})
+    run.append('force', {'time': t, 'voltage': t, 'force': t})
+    run.addTable('frames', runfile.FRAME_COLUMNS)
+    # frame 2 failed to save and is not in the index
+    run.append('frames', {'frame': [0, 1, 3], 'time': [0.1, 0.2, 0.4], 'sample': [100, 200, 400]})
+    run.close()
+
+    run = runfile.loadRun(path)
+    window = run.forceWindow(3, before = 0.05, after = 0.05)
+    assert window['time'][0] >= 0.35 and window['time'][-1] <= 0.45
+    assert run.nearestFrame(0.31) == 3
+    with pytest.raises(KeyError):
+        run.forceWindow(2)
@@ -0,0 +1,52 @@
+# Tests of the simulated stage
+#================================================================
+import time
+import warnings
+
+import numpy as np
+
+from simulation import FakeStageControl, trapezoid
+
+
+def test_trapezoid_reaches_target_at_rest():
+    x, v, duration = trapezoid(np.linspace(0, 2, 201), 1000, 2000, 10000, 5000)
+    # 0.2 s accelerating, 0.2 s at speed and 0.4 s decelerating
+    assert abs(duration-0.8) < 1e-12
+    assert x[-1] == 1000 and v[-1] == 0
+    assert np.all(np.diff(x) >= 0)
+    assert v.max() == 2000
+
+
+def test_soft_stop_decelerates_at_the_configured_rate():
+    stage = FakeStageControl()
+    devId = stage.lrDevId
+    stage.setMoveParameters(devId, {'Speed': 2000, 'Accel': 10000, 'Decel': 4000})
+    stage.moveRelativeRight(100000) # far, cruising when stopped
+    time.sleep(0.3)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        stage.softStopX()
+        stopTime, start, target, speed, accel, decel, duration = stage.segments[devId][-1]
+        assert speed == 2000 and decel == 4000
+        assert duration == 0.5 # 2000 steps/s at 4000 steps/s^2
+        assert target-start == 2000**2/(2*4000)
+
+        # still moving, slowing down linearly, then at rest at the target
+        times = stopTime+np.array([0, 0.1, 0.25, 0.5, 1.0])
+        position, velocity = stage.positionsAt(devId, times)
+    np.testing.assert_allclose(velocity, [2000, 1600, 1000, 0, 0])
+    np.testing.assert_allclose(position[-2:], target)
+    assert np.all(np.diff(position) >= 0)
+    assert stage.isMoving(devId, stopTime+0.4) and not stage.isMoving(devId, stopTime+0.6)
+
+
+def test_soft_stop_at_rest_and_set_zero():
+    stage = FakeStageControl()
+    stage.softStopX()
+    assert not stage.isMoving(stage.lrDevId)
+    stage.moveRelativeRight(400)
+    stage.waitForStopXY()
+    assert stage.currentPosition(stage.lrDevId) == 400
+    stage.setZeroPositionX()
+    assert stage.currentPosition(stage.lrDevId) == 0
@@ -0,0 +1,81 @@
+# Background writer streaming run data to disk during acquisition
+#================================================================
+import queue
+import threading
+import time
+
+import numpy as np
+
+import diagnostics
+
+
+_STOP = object()
+
+
+class StreamWriter():
+    # Appends queued blocks to a run container (runfile.RunWriter) on its
+    # own thread and fsyncs at most every flushInterval seconds, so a crash
+    # loses at most the last interval. close() returns immediately; the
+    # optional finalize(run) callback then runs on the writer thread
+    # before the container is closed, and onClosed() after it.
+    def __init__(self, run, flushInterval = 1.0, compress = False):
+        self.run = run
+        self.flushInterval = flushInterval
+        self.compress = compress
+        self.finalize = None
+        self.onClosed = None
+        self.rowsWritten = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target = self.loop, daemon = True)
+        self.thread.start()
+
+    def put(self, table = 'force', **columns):
+        # queue one block, one array per column
+        self.queue.put((table, columns))
+
+    def close(self, finalize = None, onClosed = None):
+        self.finalize = finalize
+        self.onClosed = onClosed
+        self.queue.put(_STOP)
+
+    def join(self, timeout = None):
+        self.thread.join(timeout)
+
+    def loop(self):
+        lastFlush = time.perf_counter()
+        loopTimer = diagnostics.timer('writer block')
+        loopTimer.start()
+
+        while True:
+            try:
+                item = self.queue.get(timeout = self.flushInterval)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+            if item is not None:
+                loopTimer.begin()
+                table, columns = item
+                self.run.append(table, columns)
+                if table == 'force':
+                    self.rowsWritten += len(np.atleast_1d(next(iter(columns.values()))))
+                loopTimer.end()
+
+            if time.perf_counter()-lastFlush >= self.flushInterval:
+                self.run.flush()
+                lastFlush = time.perf_counter()
+
+        self.run.flush()
+        # the run is closed even if finalize fails, keeping what it added
+        try:
+            if self.finalize is not None:
+                self.finalize(self.run)
+        except Exception as e:
+            print('Error thrown in finalizing '+self.run.dir+': '+str(e))
+        try:
+            self.run.close(compress = self.compress)
+            if self.onClosed is not None:
+                self.onClosed()
+        except Exception as e:
+            print('Error thrown in closing '+self.run.dir+', raw data kept: '+str(e))